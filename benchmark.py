@@ -0,0 +1,220 @@
+"""
+Small benchmarks used to guard against performance regressions.
+
+    python benchmark.py startup                  # import time + lazy import guard, no database needed
+    python benchmark.py startup -c config.yaml   # also measures time to first query against the database
+    python benchmark.py fetch                    # rows vs arrow conversion of rows to csv, no database needed
+
+The startup benchmark exits with a non zero status code if a heavy dependency is imported at module load, or if the
+import time is above --max-import-ms, so it can be used as a gate in CI.
+"""
+import csv
+import decimal
+import io
+import json
+import subprocess
+import sys
+from datetime import datetime, timedelta
+from time import time
+
+# Modules that must only be imported when they are used.  Importing any of these at module load adds seconds to the
+# cold start of a serverless invocation.
+LAZY_MODULES = [
+    "sqlalchemy",
+    "pyodbc",
+    "smart_open",
+    "google.cloud.bigquery",
+    "google.cloud.storage",
+    "pyarrow",
+    "arrow_odbc",
+]
+
+IMPORT_PROBE = """
+import json, sys
+from time import perf_counter
+start = perf_counter()
+import main
+from database_to_bigquery import SqlServerToCsv, SqlServerToBigquery
+csv = SqlServerToCsv(username="u", password="p", host="h", database="d", destination="gs://bucket")
+bq = SqlServerToBigquery(sql_server_to_csv=csv)
+elapsed = perf_counter() - start
+print(json.dumps({"elapsed": elapsed, "modules": sorted(sys.modules.keys())}))
+"""
+
+
+def measure_import(repeat: int) -> dict:
+    """
+    Import the program in a fresh interpreter, repeat times, and report the best run.
+    A fresh interpreter is needed since python caches imported modules.
+    """
+    best = None
+    modules = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        probe = json.loads(out.stdout.strip().splitlines()[-1])
+        if best is None or probe["elapsed"] < best:
+            best = probe["elapsed"]
+        modules = probe["modules"]
+    eager = [m for m in LAZY_MODULES if m in modules]
+    return {"import_ms": best * 1000, "eager_modules": eager}
+
+
+def measure_first_query(config_path: str) -> dict:
+    """
+    Measure time from nothing imported to the first query result, i.e. what a cold serverless invocation pays before
+    doing any real work.
+    """
+    start = time()
+    from main import get_config
+    from database_to_bigquery import SqlServerToCsv
+
+    config = get_config(config_path=config_path)
+    sql_server_to_csv = SqlServerToCsv(
+        username=config.db_username,
+        password=config.db_password,
+        host=config.db_host,
+        database=config.db_database,
+        destination=f"gs://{config.gcp_bucket}/sqlserver/{config.gcp_bq_dataset}",
+    )
+    created = time()
+    with sql_server_to_csv.connect() as connection:
+        connection.execute("SELECT 1").first()
+    end = time()
+    return {
+        "setup_ms": (created - start) * 1000,
+        "first_query_ms": (end - start) * 1000,
+    }
+
+
+def startup(args) -> int:
+    result = measure_import(repeat=args.repeat)
+    print(f"import + construct: {result['import_ms']:.1f} ms (best of {args.repeat})")
+    failed = False
+    if result["eager_modules"]:
+        print(f"REGRESSION: heavy modules imported at load: {', '.join(result['eager_modules'])}")
+        failed = True
+    if result["import_ms"] > args.max_import_ms:
+        print(f"REGRESSION: import took more than {args.max_import_ms} ms")
+        failed = True
+    if args.config:
+        first_query = measure_first_query(args.config)
+        print(f"setup: {first_query['setup_ms']:.1f} ms")
+        print(f"time to first query: {first_query['first_query_ms']:.1f} ms")
+    return 1 if failed else 0
+
+
+def fetch_sample(rows: int):
+    """
+    A table of typical columns, as the rows pyodbc returns and as the record batch arrow-odbc returns.
+    """
+    import pyarrow as pa
+    from database_to_bigquery.base import Column
+
+    columns_type = [
+        Column("id", "BIGINT"),
+        Column("code", "CHAR", max_length=10),
+        Column("name", "NVARCHAR", max_length=100),
+        Column("amount", "DECIMAL", precision=18, scale=4),
+        Column("ratio", "FLOAT"),
+        Column("active", "BIT"),
+        Column("created", "DATETIME2"),
+        Column("note", "NVARCHAR", max_length=200),
+    ]
+    start = datetime(2020, 1, 1)
+    data = {
+        "id": list(range(rows)),
+        "code": [f"C{i % 1000:<9}" for i in range(rows)],
+        "name": [f"name {i}\x00" if i % 100 == 0 else f"name {i}" for i in range(rows)],
+        "amount": [decimal.Decimal(i) / 16 for i in range(rows)],
+        "ratio": [i / 7 for i in range(rows)],
+        "active": [i % 2 == 0 for i in range(rows)],
+        "created": [start + timedelta(seconds=i, microseconds=i % 1000) for i in range(rows)],
+        "note": [None if i % 3 else f'a "note", {i}' for i in range(rows)],
+    }
+    names = [c.name for c in columns_type]
+    dict_rows = [dict(zip(names, values)) for values in zip(*data.values())]
+    batch = pa.RecordBatch.from_arrays(
+        [
+            pa.array(data["id"], pa.int64()),
+            pa.array(data["code"], pa.string()),
+            pa.array(data["name"], pa.string()),
+            pa.array(data["amount"], pa.decimal128(18, 4)),
+            pa.array(data["ratio"], pa.float64()),
+            pa.array(data["active"], pa.bool_()),
+            pa.array(data["created"], pa.timestamp("ns")),
+            pa.array(data["note"], pa.string()),
+        ],
+        names=names,
+    )
+    return columns_type, dict_rows, batch
+
+
+def fetch(args) -> int:
+    """
+    Time the conversion of fetched rows to csv with the rows engine and the arrow engine, on the same data.  This is
+    the python side of a split copy, i.e. what limits the rows/s of a thread once the database keeps up.
+    """
+    from database_to_bigquery import SqlServerToCsv, arrow_fetch
+
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        print("pyarrow is not installed, pip install database-to-bigquery[arrow]")
+        return 1
+    sql_server_to_csv = SqlServerToCsv(username="u", password="p", host="h", database="d", destination="gs://b")
+    columns_type, dict_rows, batch = fetch_sample(args.rows)
+    columns = [c.name for c in columns_type]
+
+    best_rows = None
+    for _ in range(args.repeat):
+        start = time()
+        encoders = sql_server_to_csv.type_mapping.encoders(columns_type)
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=columns, quotechar='"')
+        for row in dict_rows:
+            writer.writerow(sql_server_to_csv.row_to_bq(row, encoders))
+        elapsed = time() - start
+        best_rows = elapsed if best_rows is None else min(best_rows, elapsed)
+
+    best_arrow = None
+    for _ in range(args.repeat):
+        start = time()
+        for offset in range(0, batch.num_rows, SqlServerToCsv.ARROW_BATCH_SIZE):
+            piece = batch.slice(offset, SqlServerToCsv.ARROW_BATCH_SIZE)
+            out = io.StringIO()
+            encoded = arrow_fetch.encode_batch(piece, columns_type, sql_server_to_csv.type_mapping)
+            out.write(arrow_fetch.batch_to_csv(encoded))
+        elapsed = time() - start
+        best_arrow = elapsed if best_arrow is None else min(best_arrow, elapsed)
+
+    print(f"{args.rows} rows, {len(columns)} columns (best of {args.repeat})")
+    print(f"rows engine:  {best_rows * 1000:.1f} ms, {args.rows / best_rows:,.0f} rows/s")
+    print(f"arrow engine: {best_arrow * 1000:.1f} ms, {args.rows / best_arrow:,.0f} rows/s")
+    print(f"speedup: {best_rows / best_arrow:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmarks for database-to-bigquery.")
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+
+    startup_parser = sub.add_parser("startup", help="import time and time to first query")
+    startup_parser.add_argument("-c", "--config", help="path to yaml config file", type=str, default=None)
+    startup_parser.add_argument("--repeat", help="number of runs, best is reported", type=int, default=5)
+    startup_parser.add_argument("--max-import-ms", help="fail if import is slower", type=float, default=500)
+    startup_parser.set_defaults(func=startup)
+
+    fetch_parser = sub.add_parser("fetch", help="rows vs arrow engine conversion of rows to csv")
+    fetch_parser.add_argument("--rows", help="number of rows", type=int, default=200000)
+    fetch_parser.add_argument("--repeat", help="number of runs, best is reported", type=int, default=3)
+    fetch_parser.set_defaults(func=fetch)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
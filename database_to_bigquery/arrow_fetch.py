@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Fetch of split queries as Arrow record batches with arrow-odbc, and conversion of the batches to what BigQuery
+expects in a csv file.  The column at a time counterpart of the TypeMapping encoders and SqlServerToCsv.row_to_bq.
+
+pyarrow and arrow-odbc are optional, install them with: pip install database-to-bigquery[arrow]
+"""
+from typing import TYPE_CHECKING, Callable, Iterator, List
+
+from database_to_bigquery.base import Column
+from database_to_bigquery.type_mapping import (
+    TypeMapping,
+    encode_bool,
+    encode_char,
+    encode_isoformat,
+    encode_native,
+    encode_numeric,
+    encode_string,
+)
+
+if TYPE_CHECKING:
+    import pyarrow
+
+
+def available() -> bool:
+    """
+    If pyarrow and arrow-odbc are installed.
+    """
+    try:
+        import pyarrow  # noqa: F401
+        import arrow_odbc  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def read_batches(
+    connection_string: str,
+    username: str,
+    password: str,
+    sql: str,
+    params: list,
+    batch_size: int,
+) -> Iterator["pyarrow.RecordBatch"]:
+    """
+    Run the query and read the result in record batches of at most batch_size rows.
+    """
+    from arrow_odbc import read_arrow_batches_from_odbc
+
+    return read_arrow_batches_from_odbc(
+        query=sql,
+        connection_string=connection_string,
+        batch_size=batch_size,
+        user=username,
+        password=password,
+        # arrow-odbc binds every parameter as VARCHAR, SQL Server converts them to the type they are compared with.
+        parameters=[None if p is None else str(p) for p in params],
+    )
+
+
+def encode_values(array: "pyarrow.Array", encoder: Callable) -> "pyarrow.Array":
+    """
+    The encoder a value at a time, as text the way the csv writer of the row path writes it.  For what the kernels can
+    not write the same.
+    """
+    import pyarrow as pa
+
+    values = [None if v is None else encoder(v) for v in array.to_pylist()]
+    return pa.array([None if v is None else str(v) for v in values], pa.string())
+
+
+def encode_column(array: "pyarrow.Array", column: Column, type_mapping: TypeMapping) -> "pyarrow.Array":
+    """
+    The encoder of the column from type_mapping, as vectorized kernels over the whole column.  Returns the text of
+    every value, byte for byte what the row path writes.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    encoder = type_mapping.encoder(column)
+    if pa.types.is_string(array.type) or pa.types.is_large_string(array.type):
+        if encoder is encode_char:
+            array = pc.utf8_trim_whitespace(array)
+        elif encoder is encode_string:
+            # bigquery fails if loading null terminations.
+            array = pc.replace_substring(array, "\x00", "")
+        elif encoder is not encode_native:
+            array = encode_values(array, encoder)
+    elif pa.types.is_integer(array.type) or pa.types.is_date(array.type):
+        array = encode_values(array, encoder) if encoder is encode_bool else pc.cast(array, pa.string())
+    elif pa.types.is_boolean(array.type) and encoder is encode_bool:
+        array = pc.cast(array, pa.string())
+    elif pa.types.is_decimal(array.type) and encoder is encode_numeric:
+        # decimals keep their scale and are not rounded.  The kernel writes values close to 0 with an exponent,
+        # 0.00 is 0E-2, those are written a value at a time.
+        text = pc.cast(array, pa.string())
+        exponent = pc.match_substring(text, "E")
+        if pc.any(exponent).as_py():
+            text = pc.replace_with_mask(text, exponent, encode_values(array.filter(exponent), encoder))
+        array = text
+    elif (pa.types.is_time(array.type) or pa.types.is_timestamp(array.type) and not array.type.tz) and encoder in (
+        encode_string,
+        encode_native,
+        encode_isoformat,
+    ):
+        timestamp = pa.types.is_timestamp(array.type)
+        array = pc.cast(array, pa.timestamp("us") if timestamp else pa.time64("us"), safe=False)
+        # Like str and isoformat, microseconds are left out when 0.
+        array = pc.replace_substring_regex(pc.cast(array, pa.string()), r"\.000000$", "")
+        if timestamp and encoder is encode_isoformat:
+            array = pc.replace_substring(array, " ", "T", max_replacements=1)
+    else:
+        # Floats, binary and timestamps with a time zone.  There is no base64 kernel, and the float kernel does not
+        # write the shortest repr of a value like python does.
+        array = encode_values(array, encoder)
+    # The csv writer of the row path writes empty strings and None the same, which BigQuery loads as NULL.
+    return pc.if_else(pc.equal(array, ""), pa.scalar(None, array.type), array)
+
+
+def encode_batch(
+    batch: "pyarrow.RecordBatch", columns_type: List[Column], type_mapping: TypeMapping
+) -> "pyarrow.RecordBatch":
+    import pyarrow as pa
+
+    return pa.RecordBatch.from_arrays(
+        [encode_column(batch.column(c.name), c, type_mapping) for c in columns_type],
+        names=[c.name for c in columns_type],
+    )
+
+
+def batch_to_csv(batch: "pyarrow.RecordBatch", eol: str = "\r\n") -> str:
+    """
+    The rows of an encoded batch as csv, without header.  Quoted like the csv module does, only fields with a
+    delimiter, quote or line break.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if batch.num_rows == 0:
+        return ""
+    fields = []
+    for column in batch.columns:
+        quoted = pc.binary_join_element_wise('"', pc.replace_substring(column, '"', '""'), '"', "")
+        fields.append(pc.if_else(pc.match_substring_regex(column, '[,"\r\n]'), quoted, column))
+    if len(fields) == 1:
+        # The csv writer quotes a row of a single empty field, so it is not an empty line.
+        rows = pc.fill_null(fields[0], '""')
+    else:
+        rows = pc.binary_join_element_wise(*fields, ",", null_handling="replace", null_replacement="")
+    rows = pc.binary_join_element_wise(rows, eol, "")
+    return pc.binary_join(pa.ListArray.from_arrays([0, len(rows)], rows), "")[0].as_py()
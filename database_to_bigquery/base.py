@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 from time import strftime, localtime
 from datetime import timedelta
-from typing import List
+from typing import List, Optional
 
 
 def elapsed_string(elapsed=None):
@@ -11,6 +11,14 @@ def elapsed_string(elapsed=None):
         return str(timedelta(seconds=elapsed))
 
 
+def size_string(size_bytes: float) -> str:
+    for unit in ["B", "KB", "MB", "GB"]:
+        if abs(size_bytes) < 1024:
+            return f"{size_bytes:.1f} {unit}"
+        size_bytes /= 1024
+    return f"{size_bytes:.1f} TB"
+
+
 class DatabaseToCsv:
     """
     TODO: Make into a more generic base class to support more databases.
@@ -20,9 +28,26 @@ class DatabaseToCsv:
 
 
 class Column:
-    def __init__(self, name, data_type):
+    # Large object types without a character_maximum_length of -1.
+    LOB_TYPES = ["TEXT", "NTEXT", "IMAGE", "XML"]
+
+    def __init__(
+        self,
+        name,
+        data_type,
+        precision: Optional[int] = None,
+        scale: Optional[int] = None,
+        max_length: Optional[int] = None,
+        expression: Optional[str] = None,
+    ):
         self.name = name
         self.data_type = data_type
+        self.precision = precision
+        self.scale = scale
+        # -1 for MAX types
+        self.max_length = max_length
+        # SQL expression of computed columns, None for table columns.
+        self.expression = expression
         self.pk = False
 
     def __eq__(self, other):
@@ -33,7 +58,16 @@ class Column:
         else:
             return False
 
+    @property
+    def is_lob(self) -> bool:
+        """
+        Large object columns, i.e. VARCHAR(MAX), NVARCHAR(MAX), VARBINARY(MAX) and the legacy TEXT, NTEXT and IMAGE.
+        """
+        return self.max_length == -1 or self.data_type in self.LOB_TYPES
+
     def __str__(self):
+        if self.expression:
+            return f"{self.name} {self.data_type} [{self.pk}] AS {self.expression}"
         return f"{self.name} {self.data_type} [{self.pk}]"
 
 
@@ -45,17 +79,35 @@ class SplitResult:
         elapsed: float,
         cache_hit: bool,
         row_count: int,
+        first_row_elapsed: float = -1,
+        content_files: Optional[List[str]] = None,
+        lock_wait: int = -1,
+        split_id: Optional[int] = None,
+        reused: bool = False,
     ):
+        """
+        :param lock_wait: milliseconds the split query waited on locks, -1 if unknown.
+        :param split_id: the internal_split of the split.
+        :param reused: the content was copied from splits read before with another split size, not read.
+        """
         self.content_file: str = content_file
         self.crc_file: str = crc_file
         self.elapsed: float = elapsed
         self.cache_hit: bool = cache_hit
         self.row_count: int = row_count
+        self.first_row_elapsed: float = first_row_elapsed
+        self.content_files: List[str] = content_files or [content_file]
+        self.lock_wait: int = lock_wait
+        self.split_id: Optional[int] = split_id
+        self.reused: bool = reused
 
     def __str__(self):
+        status = "CACHE" if self.cache_hit else "REUSE" if self.reused else "RELOAD"
         return (
-            f"[{'CACHE' if self.cache_hit else 'RELOAD'}] {self.content_file} {elapsed_string(self.elapsed)}"
+            f"[{status}] {self.content_file} {elapsed_string(self.elapsed)}"
             f" ({self.row_count if self.row_count > 0 else 'unknown'} rows)"
+            f"{f' in {len(self.content_files)} files' if len(self.content_files) > 1 else ''}"
+            f"{f', {self.lock_wait} ms lock wait' if self.lock_wait > 0 else ''}"
         )
 
 
@@ -74,7 +126,17 @@ class CopyResult:
         elapsed_time: float,
         split_results: List[SplitResult],
         column_type: List[Column],
+        watermark: Optional[dict] = None,
+        previous_watermark: Optional[dict] = None,
+        predicted_elapsed: Optional[float] = None,
+        content_digest: Optional[str] = None,
     ):
+        """
+        :param watermark: for incremental copies, the watermark after this copy.  Should be stored once loaded.
+        :param previous_watermark: for incremental copies, the watermark the copy started from.  None for full copies.
+        :param predicted_elapsed: seconds the copy was predicted to take from the split history, None if unknown.
+        :param content_digest: digest of the crc of every split, None if not all splits were copied.
+        """
         self.base_path: str = base_path
         self.elapsed_time: float = elapsed_time
         self.split_results: list = split_results
@@ -82,6 +144,10 @@ class CopyResult:
         self.table_name: str = table_name
         self.schema_name: str = schema_name
         self.table_rows: int = table_rows
+        self.watermark: Optional[dict] = watermark
+        self.previous_watermark: Optional[dict] = previous_watermark
+        self.predicted_elapsed: Optional[float] = predicted_elapsed
+        self.content_digest: Optional[str] = content_digest
 
     def is_fully_cached(self) -> bool:
         for split_res in self.split_results:
@@ -93,6 +159,7 @@ class CopyResult:
         return (
             f"{self.schema_name}.{self.table_name} ({self.table_rows}) -> {self.base_path} - "
             f"{elapsed_string(self.elapsed_time)}, {len(self.split_results)} splits"
+            f"{f' (predicted {elapsed_string(self.predicted_elapsed)})' if self.predicted_elapsed is not None else ''}"
         )
 
 
@@ -137,6 +204,98 @@ class IngestResult:
         return "\n".join(full_str)
 
 
+class SplitPlan:
+    """
+    What a copy would do for a single split, see TablePlan.
+    """
+
+    def __init__(
+        self,
+        split_id: int,
+        estimated_rows: int,
+        estimated_bytes: float,
+        cache_hit: Optional[bool],
+        reused: bool = False,
+    ):
+        self.split_id: int = split_id
+        self.estimated_rows: int = estimated_rows
+        self.estimated_bytes: float = estimated_bytes
+        # None if unknown, since the splits were estimated and not generated.
+        self.cache_hit: Optional[bool] = cache_hit
+        # Copied from splits read with another split size instead of read, see SqlServerToCsv.reuse_splits.
+        self.reused: bool = reused
+
+    @property
+    def to_read(self) -> bool:
+        return self.cache_hit is not True and not self.reused
+
+    def __str__(self):
+        status = "REUSE" if self.reused else {True: "CACHE", False: "RELOAD", None: "UNKNOWN"}[self.cache_hit]
+        return (
+            f"[{status}] split {self.split_id}: ~{self.estimated_rows} rows, "
+            f"~{size_string(self.estimated_bytes)}"
+        )
+
+
+class TablePlan:
+    """
+    What a copy of a table would do, without reading any data.  See SqlServerToCsv.plan_table.
+    """
+
+    def __init__(
+        self,
+        table_name: str,
+        schema_name: str,
+        table_rows: int,
+        table_bytes: Optional[float],
+        split_size: int,
+        split_strategy: str,
+        base_path: str,
+        split_plans: List[SplitPlan],
+        query_plans: dict,
+    ):
+        """
+        :param query_plans: description of a query -> dict of estimated cost, rows and the showplan xml.
+        """
+        self.table_name: str = table_name
+        self.schema_name: str = schema_name
+        self.table_rows: int = table_rows
+        self.table_bytes: Optional[float] = table_bytes
+        self.split_size: int = split_size
+        self.split_strategy: str = split_strategy
+        self.base_path: str = base_path
+        self.split_plans: List[SplitPlan] = split_plans
+        self.query_plans: dict = query_plans
+
+    def __str__(self):
+        return (
+            f"{self.schema_name}.{self.table_name} (~{self.table_rows}) -> {self.base_path} - "
+            f"{self.split_strategy}, {len(self.split_plans)} splits"
+        )
+
+    def full_str(self) -> str:
+        reload = [p for p in self.split_plans if p.to_read]
+        full_str = [
+            f"Plan for {self.schema_name}.{self.table_name}",
+            f"\tRows: ~{self.table_rows}"
+            f"{f', size: ~{size_string(self.table_bytes)}' if self.table_bytes else ''}",
+            f"\tSplit strategy: {self.split_strategy}, split size: {self.split_size}",
+            f"\tDestination: {self.base_path}",
+            f"\tSplits ({len(reload)} of {len(self.split_plans)} to read, "
+            f"~{sum(p.estimated_rows for p in reload)} rows, "
+            f"~{size_string(sum(p.estimated_bytes for p in reload))}):",
+        ]
+        for split_plan in self.split_plans:
+            full_str.append(f"\t\t{split_plan}")
+        full_str.append("\tEstimated query plans:")
+        for name, query_plan in self.query_plans.items():
+            full_str.append(
+                f"\t\t{name}: cost {query_plan['cost']}, rows {query_plan['rows']}"
+                f"{', ' + ', '.join(query_plan['operators']) if query_plan['operators'] else ''}"
+            )
+        return "\n".join(full_str)
+
+
 class DatabaseToBigquery:
     """
     TODO: Make into a more generic base class to support more databases.
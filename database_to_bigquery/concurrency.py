@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+from time import time, sleep
+from typing import Optional
+
+logger = logging.getLogger("DatabaseToBigquery")
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD (additive increase, multiplicative decrease) controller for the number of splits read concurrently.
+
+    Starts with a few concurrent queries and adds one every time a split finishes without signs of the database
+    struggling.  If time to first row or the rows/s of a single split degrade by more than latency_tolerance compared
+    to the best observed values, the concurrency is cut by backoff_factor.  This lets us use an idle SQL server fully
+    while backing off when production traffic needs it.
+
+    Can also be used with a fixed limit (minimum == maximum), to only apply the rows/s cap.
+    """
+
+    def __init__(
+        self,
+        initial: int = 2,
+        minimum: int = 1,
+        maximum: int = 8,
+        max_rows_per_second: int = -1,
+        backoff_factor: float = 0.5,
+        latency_tolerance: float = 2.0,
+    ):
+        """
+        :param initial: concurrency to start with.
+        :param minimum: never go below this many concurrent queries.
+        :param maximum: hard cap on concurrent queries towards the database.
+        :param max_rows_per_second: hard cap on rows/s read across all splits, -1 for no cap.
+        :param backoff_factor: multiply concurrency with this when the database is struggling.
+        :param latency_tolerance: how much worse than the best observed latency/throughput we accept.
+        """
+        self.minimum: int = max(1, minimum)
+        self.maximum: int = max(self.minimum, maximum)
+        self.limit: int = min(max(initial, self.minimum), self.maximum)
+        self.max_rows_per_second: int = max_rows_per_second
+        self.backoff_factor: float = backoff_factor
+        self.latency_tolerance: float = latency_tolerance
+        self.active: int = 0
+        self.best_first_row: Optional[float] = None
+        self.best_rows_per_second: Optional[float] = None
+        self.decisions: list = []
+        self._condition = threading.Condition()
+        self._throttle_lock = threading.Lock()
+        self._throttle_start: Optional[float] = None
+        self._throttle_rows: int = 0
+
+    @property
+    def adaptive(self) -> bool:
+        return self.minimum != self.maximum
+
+    def acquire(self):
+        """
+        Block until there is room for one more concurrent query.
+        """
+        with self._condition:
+            while self.active >= self.limit:
+                self._condition.wait()
+            self.active += 1
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+
+    def _set_limit(self, limit: int, reason: str):
+        limit = min(max(limit, self.minimum), self.maximum)
+        if limit != self.limit:
+            logger.info(f"Concurrency {self.limit} -> {limit}: {reason}")
+            self.decisions.append((time(), self.limit, limit, reason))
+        self.limit = limit
+        self._condition.notify_all()
+
+    def on_split_done(self, rows: int, elapsed: float, first_row_elapsed: float):
+        """
+        Feed the result of a split that was read from the database to the controller.
+
+        :param rows: rows read in the split.
+        :param elapsed: seconds spent reading the split.
+        :param first_row_elapsed: seconds from query start until the first row arrived.
+        """
+        if not self.adaptive or rows <= 0 or elapsed <= 0:
+            return
+        rows_per_second = rows / elapsed
+        with self._condition:
+            if self.best_first_row is None or first_row_elapsed < self.best_first_row:
+                self.best_first_row = first_row_elapsed
+            if (
+                self.best_rows_per_second is None
+                or rows_per_second > self.best_rows_per_second
+            ):
+                self.best_rows_per_second = rows_per_second
+
+            # Allow some absolute slack on first row, sub second timings are mostly noise.
+            first_row_limit = max(self.best_first_row * self.latency_tolerance, 1.0)
+            if first_row_elapsed > first_row_limit:
+                self._set_limit(
+                    int(self.limit * self.backoff_factor),
+                    f"time to first row {first_row_elapsed:.2f}s > {first_row_limit:.2f}s",
+                )
+            elif rows_per_second < self.best_rows_per_second / self.latency_tolerance:
+                self._set_limit(
+                    int(self.limit * self.backoff_factor),
+                    f"split read {rows_per_second:.0f} rows/s, best is {self.best_rows_per_second:.0f} rows/s",
+                )
+            else:
+                self._set_limit(
+                    self.limit + 1,
+                    f"split read {rows_per_second:.0f} rows/s, first row after {first_row_elapsed:.2f}s",
+                )
+
+    def throttle(self, rows: int):
+        """
+        Account for rows read, and sleep if we are above max_rows_per_second.
+        """
+        if self.max_rows_per_second <= 0:
+            return
+        with self._throttle_lock:
+            now = time()
+            if self._throttle_start is None:
+                self._throttle_start = now
+            self._throttle_rows += rows
+            wait = self._throttle_rows / self.max_rows_per_second - (
+                now - self._throttle_start
+            )
+        if wait > 0:
+            sleep(wait)
+
+    def summary(self) -> str:
+        return (
+            f"concurrency settled at {self.limit} "
+            f"(min {self.minimum}, max {self.maximum}) after {len(self.decisions)} changes"
+        )
+
+
+class SplitProgress:
+    """
+    Tracks how far a worker has come reading a range of rows of a split, and allows another thread to cut off the
+    remaining rows so they can be handed to idle workers (work stealing).
+
+    Rows are addressed by internal_row, the ROW_NUMBER() of the row in the split view.  row_to is exclusive.  If
+    open_end is set, row_to is only an estimate used for timing, and the range reads to the end of the split.  This
+    covers rows added to the source after the splits were generated.
+    """
+
+    def __init__(
+        self,
+        split_id: int,
+        part_id: str,
+        row_from: int,
+        row_to: int,
+        open_end: bool = False,
+    ):
+        self.split_id: int = split_id
+        self.part_id: str = part_id
+        self.row_from: int = row_from
+        self.row_to: int = row_to
+        self.open_end: bool = open_end
+        self.done: int = 0
+        self.started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.started = time()
+
+    def restart(self):
+        """
+        Read the range again from the start, after the read failed.  Rows cut off in the meantime stay cut off.
+        """
+        with self._lock:
+            self.done = 0
+        self.start()
+
+    def advance(self, rows: int) -> int:
+        """
+        Claim the next rows for writing.
+
+        :param rows: number of rows the worker has fetched.
+        :return: how many of the rows the worker should write, less than rows if the range has been cut.
+        """
+        with self._lock:
+            position = self.row_from + self.done
+            take = rows if self.open_end else max(0, min(rows, self.row_to - position))
+            self.done += take
+            return take
+
+    def remaining_seconds(self) -> Optional[float]:
+        """
+        Estimated seconds until this range is done, based on the rate so far.  None if we do not know yet.
+        """
+        if self.started is None or self.done == 0:
+            return None
+        elapsed = time() - self.started
+        with self._lock:
+            remaining = max(self.row_to - self.row_from - self.done, 0)
+        return remaining / (self.done / elapsed) if elapsed > 0 else None
+
+    def cut(self, pieces: int, margin: int, min_rows: int) -> list:
+        """
+        Cut the unread rows of this range into pieces.  This range keeps the first piece, the rest is returned.
+
+        :param pieces: how many pieces to cut the remaining rows into, including the one we keep.
+        :param margin: rows beyond the current position that are left to this worker, since they are likely fetched.
+        :param min_rows: do not create pieces smaller than this.
+        :return: a list of SplitProgress for other workers to read, part_id is left to the caller.  Empty if not
+                 worth cutting.
+        """
+        with self._lock:
+            cut_at = self.row_from + self.done + margin
+            remaining = self.row_to - cut_at
+            pieces = min(pieces, remaining // max(min_rows, 1))
+            if pieces < 2:
+                return []
+            size = remaining // pieces
+            bounds = [cut_at + i * size for i in range(pieces)] + [self.row_to]
+            open_end = self.open_end
+            self.row_to = bounds[1]
+            self.open_end = False
+            return [
+                SplitProgress(
+                    split_id=self.split_id,
+                    part_id="",
+                    row_from=bounds[i],
+                    row_to=bounds[i + 1],
+                    open_end=open_end and i == pieces - 1,
+                )
+                for i in range(1, pieces)
+            ]
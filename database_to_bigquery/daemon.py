@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from time import time
+from typing import Callable, List, Optional
+
+logger = logging.getLogger("DatabaseToBigquery")
+
+
+class IntervalSchedule:
+    """
+    Run every seconds, counted from the start of the previous run.  The first run is right away.
+    """
+
+    def __init__(self, seconds: float):
+        if seconds <= 0:
+            raise ValueError(f"Interval must be positive, got {seconds}")
+        self.seconds: float = seconds
+
+    def first_run(self, now: float) -> float:
+        return now
+
+    def next_after(self, timestamp: float) -> float:
+        return timestamp + self.seconds
+
+    def __str__(self):
+        return f"every {self.seconds}s"
+
+
+class CronSchedule:
+    """
+    Cron schedule with the five standard fields: minute hour day-of-month month day-of-week, in local time.
+    Fields support *, lists (1,2), ranges (1-5) and steps (*/15, 1-10/2, 5/10).  Sunday is 0 or 7.  If both day
+    fields are restricted a day matches if either matches, as in cron.
+    """
+
+    FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expression: str):
+        parts = expression.split()
+        if len(parts) != len(self.FIELDS):
+            raise ValueError(f"Cron expression needs {len(self.FIELDS)} fields, got '{expression}'")
+        self.expression: str = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = [
+            self._parse(part, low, high) for part, (low, high) in zip(parts, self.FIELDS)
+        ]
+        self.weekdays = {d % 7 for d in weekdays}
+        self.any_day: bool = parts[2] == "*"
+        self.any_weekday: bool = parts[4] == "*"
+
+    @staticmethod
+    def _parse(field: str, low: int, high: int) -> set:
+        values = set()
+        for item in field.split(","):
+            step = 1
+            if "/" in item:
+                item, step = item.split("/", 1)
+                step = int(step)
+            if item == "*":
+                start, end = low, high
+            elif "-" in item:
+                start, end = (int(x) for x in item.split("-", 1))
+            else:
+                start = int(item)
+                end = high if step != 1 else start
+            if start < low or end > high or start > end or step < 1:
+                raise ValueError(f"Invalid cron field '{field}', values must be within {low}-{high}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        weekday = moment.isoweekday() % 7 in self.weekdays
+        if self.any_day:
+            return weekday
+        if self.any_weekday:
+            return day
+        return day or weekday
+
+    def first_run(self, now: float) -> float:
+        return self.next_after(now)
+
+    def next_after(self, timestamp: float) -> float:
+        moment = datetime.fromtimestamp(timestamp).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Any valid expression matches within 4 years, 29th of february being the worst case.
+        limit = moment + timedelta(days=4 * 366)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment.timestamp()
+        raise ValueError(f"Cron expression '{self.expression}' never matches")
+
+    def __str__(self):
+        return f"cron '{self.expression}'"
+
+
+def parse_schedule(options: dict):
+    """
+    The schedule of a table in the daemon config, from the key cron (an expression) or interval (seconds).
+    """
+    if options.get("cron"):
+        return CronSchedule(options["cron"])
+    if options.get("interval"):
+        return IntervalSchedule(float(options["interval"]))
+    raise ValueError("Every table needs a schedule, set cron or interval")
+
+
+class SyncJob:
+    """
+    A table synced by the daemon on a schedule.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        schedule,
+        run: Callable[[], object],
+        evict: Optional[Callable[[], None]] = None,
+    ):
+        """
+        :param name: name shown in status.
+        :param schedule: IntervalSchedule or CronSchedule.
+        :param run: the sync, its return value is shown as the last result.
+        :param evict: release warm state (connections, cached metadata) kept between runs.
+        """
+        self.name: str = name
+        self.schedule = schedule
+        self.run: Callable[[], object] = run
+        self.evict: Optional[Callable[[], None]] = evict
+        self.next_run: float = schedule.first_run(time())
+        self.queued: bool = False
+        self.started: Optional[float] = None
+        self.last_start: Optional[float] = None
+        self.last_end: Optional[float] = None
+        self.last_result: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self.runs: int = 0
+        self.failures: int = 0
+        self.warm: bool = False
+
+    @property
+    def busy(self) -> bool:
+        return self.queued or self.started is not None
+
+    def status(self) -> dict:
+        def timestamp(t: Optional[float]) -> Optional[str]:
+            return datetime.fromtimestamp(t).isoformat() if t else None
+
+        state = "idle"
+        if self.started is not None:
+            state = "running"
+        elif self.queued:
+            state = "queued"
+        return {
+            "name": self.name,
+            "schedule": str(self.schedule),
+            "state": state,
+            "running_for": time() - self.started if self.started is not None else None,
+            "next_run": timestamp(self.next_run),
+            "last_start": timestamp(self.last_start),
+            "last_end": timestamp(self.last_end),
+            "last_result": self.last_result,
+            "last_error": self.last_error,
+            "runs": self.runs,
+            "failures": self.failures,
+            "warm": self.warm,
+        }
+
+
+class SyncDaemon:
+    """
+    Runs sync jobs on their schedules, at most max_concurrent_syncs at a time, in one long running process.  Jobs keep
+    their state (connection pools, clients, metadata) warm between runs.  The state of jobs not run for warm_ttl
+    seconds is evicted, as is the least recently used when more than max_warm jobs are warm.
+
+    Health and progress are served as json over http on status_port:  /health and /status.
+    """
+
+    # /health fails if the scheduler loop has not run for this long.
+    HEALTH_MAX_LOOP_AGE = 60
+
+    def __init__(
+        self,
+        jobs: List[SyncJob],
+        max_concurrent_syncs: int = 2,
+        status_port: int = 8080,
+        max_warm: int = 8,
+        warm_ttl: float = 3600,
+    ):
+        """
+        :param jobs: the jobs to run.
+        :param max_concurrent_syncs: number of jobs that run at the same time, the rest wait in queue.
+        :param status_port: port for /health and /status, 0 to not serve them.
+        :param max_warm: number of jobs that keep warm state between runs.
+        :param warm_ttl: evict warm state of jobs that have not run for this many seconds.
+        """
+        self.jobs: List[SyncJob] = jobs
+        self.max_concurrent_syncs: int = max(max_concurrent_syncs, 1)
+        self.status_port: int = status_port
+        self.max_warm: int = max_warm
+        self.warm_ttl: float = warm_ttl
+        self.started: float = time()
+        self.last_loop: float = time()
+        self._stop = threading.Event()
+
+    def stop(self):
+        logger.info("Stopping sync daemon, waiting for running syncs")
+        self._stop.set()
+
+    def _run(self, job: SyncJob):
+        job.queued = False
+        job.started = time()
+        logger.info(f"{job.name}: Starting sync")
+        try:
+            job.last_result = str(job.run())
+            job.last_error = None
+            logger.info(f"{job.name}: {job.last_result}")
+        except Exception as e:
+            logger.exception(f"{job.name}: Sync failed")
+            job.failures += 1
+            job.last_error = f"{e}"
+        finally:
+            job.last_start = job.started
+            job.last_end = time()
+            job.runs += 1
+            job.warm = job.evict is not None
+            next_run = job.schedule.next_after(job.last_start)
+            if next_run < job.last_end:
+                # Took longer than the schedule, skip the runs we missed.
+                next_run = job.schedule.next_after(job.last_end)
+            job.next_run = next_run
+            job.started = None
+
+    def _evict(self, now: float):
+        warm = sorted(
+            [j for j in self.jobs if j.warm and not j.busy],
+            key=lambda j: j.last_end,
+        )
+        excess = len([j for j in self.jobs if j.warm]) - self.max_warm
+        for job in warm:
+            if now - job.last_end > self.warm_ttl or excess > 0:
+                self._evict_job(job)
+                excess -= 1
+
+    def _evict_job(self, job: SyncJob):
+        logger.info(f"{job.name}: Evicting warm state")
+        try:
+            job.evict()
+        except Exception as e:
+            logger.warning(f"{job.name}: Unable to evict warm state: {e}")
+        job.warm = False
+
+    def health(self) -> dict:
+        return {
+            "healthy": time() - self.last_loop < self.HEALTH_MAX_LOOP_AGE,
+            "uptime": time() - self.started,
+            "running": len([j for j in self.jobs if j.started is not None]),
+            "queued": len([j for j in self.jobs if j.queued]),
+            "failing": [j.name for j in self.jobs if j.last_error is not None],
+        }
+
+    def status(self) -> dict:
+        return dict(self.health(), jobs=[j.status() for j in self.jobs])
+
+    def _serve_status(self):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        daemon = self
+
+        class StatusHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/health":
+                    body = daemon.health()
+                    code = 200 if body["healthy"] else 503
+                elif self.path == "/status":
+                    body = daemon.status()
+                    code = 200
+                else:
+                    body = {"error": "use /health or /status"}
+                    code = 404
+                payload = json.dumps(body, default=str).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        server = ThreadingHTTPServer(("", self.status_port), StatusHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logger.info(f"Serving /health and /status on port {self.status_port}")
+        return server
+
+    def run_forever(self, poll_seconds: float = 1.0):
+        """
+        Run jobs as they are due until stop is called.  Running syncs are finished and the warm state of every job is
+        evicted before returning.
+        """
+        import concurrent.futures
+
+        server = self._serve_status() if self.status_port else None
+        executor = concurrent.futures.ThreadPoolExecutor(self.max_concurrent_syncs)
+        for job in self.jobs:
+            logger.info(f"{job.name}: Scheduled {job.schedule}, first run at {datetime.fromtimestamp(job.next_run)}")
+        try:
+            while not self._stop.is_set():
+                now = time()
+                self.last_loop = now
+                due = [j for j in self.jobs if not j.busy and now >= j.next_run]
+                # Longest first by the previous run, so a slow table does not start last and hold up the others.
+                for job in sorted(due, key=lambda j: (j.last_end or 0) - (j.last_start or 0), reverse=True):
+                    job.queued = True
+                    executor.submit(self._run, job)
+                self._evict(now)
+                self._stop.wait(poll_seconds)
+        finally:
+            executor.shutdown(wait=True)
+            # Close connections and stop upload threads before exiting.
+            for job in self.jobs:
+                if job.warm:
+                    self._evict_job(job)
+            if server:
+                server.shutdown()
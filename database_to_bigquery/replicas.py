@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+from datetime import datetime
+from time import time
+from typing import Callable, List, Optional
+
+logger = logging.getLogger("DatabaseToBigquery")
+
+
+class Replica:
+    """
+    A read-only endpoint, e.g. a readable secondary of an availability group, and what we observed of it.
+    """
+
+    def __init__(self, host: str):
+        self.host: str = host
+        # Smoothed rows/s of split reads, None until the first split finished.
+        self.rows_per_second: Optional[float] = None
+        self.in_flight: int = 0
+        self.rows: int = 0
+        # Out of rotation until this time, with the reason why.
+        self.out_until: float = 0
+        self.out_reason: Optional[str] = None
+        self.lag_seconds: Optional[float] = None
+        # Last commit redone on the replica, and when it was read.  See ReplicaPool.caught_up.
+        self.position: Optional[datetime] = None
+        self.position_checked: float = 0
+
+    def __str__(self):
+        throughput = f"{self.rows_per_second:.0f} rows/s" if self.rows_per_second else "unmeasured"
+        lag = f", lag {self.lag_seconds:.0f}s" if self.lag_seconds is not None else ""
+        out = f", out of rotation: {self.out_reason}" if self.out_until > time() else ""
+        return f"{self.host} ({throughput}, {self.rows} rows{lag}{out})"
+
+
+class ReplicaPool:
+    """
+    Distributes split reads over read-only replicas, weighted by the throughput observed on each.
+
+    acquire picks the replica with the fewest split reads in flight relative to its rows/s, so a replica that reads
+    twice as fast gets twice the concurrent splits.  Replicas without measurements count as the average.  A replica
+    falls out of rotation for retry_seconds when connecting to it fails, and while it lags more than max_lag_seconds
+    behind the primary.  acquire can also be limited to replicas that have caught up with a commit position.  If no
+    replica is in rotation, acquire returns None and the primary is read.
+    """
+
+    # Weight of the newest measurement in the smoothed rows/s.
+    SMOOTHING = 0.3
+    # How often the position of a replica that has not caught up is read again.
+    POSITION_CHECK_SECONDS = 1
+
+    def __init__(
+        self,
+        hosts: List[str],
+        lag: Optional[Callable[[str], Optional[float]]] = None,
+        max_lag_seconds: float = -1,
+        retry_seconds: float = 300,
+        check_seconds: float = 60,
+        position: Optional[Callable[[str], Optional[datetime]]] = None,
+    ):
+        """
+        :param hosts: the replica hosts.
+        :param lag: host -> seconds the replica is behind the primary, None if unknown.  Raises if the host can not
+                    be reached.
+        :param max_lag_seconds: take replicas that lag more out of rotation, -1 to never check.
+        :param retry_seconds: how long a replica that failed stays out of rotation.
+        :param check_seconds: how often the lag is checked.
+        :param position: host -> last commit redone on the replica, None if unknown.  Raises if the host can not be
+                         reached.
+        """
+        self.replicas: List[Replica] = [Replica(host) for host in hosts]
+        self.lag: Optional[Callable[[str], Optional[float]]] = lag
+        self.max_lag_seconds: float = max_lag_seconds
+        self.retry_seconds: float = retry_seconds
+        self.check_seconds: float = check_seconds
+        self.position: Optional[Callable[[str], Optional[datetime]]] = position
+        self._lock = threading.Lock()
+        self._checked: float = 0
+        self._checking: bool = False
+
+    def check(self, force: bool = False):
+        """
+        Check the lag of every replica, if check_seconds passed since the last check.
+        """
+        if self.lag is None or self.max_lag_seconds < 0:
+            return
+        with self._lock:
+            if self._checking or (not force and time() - self._checked < self.check_seconds):
+                return
+            self._checking = True
+        try:
+            for replica in self.replicas:
+                if replica.out_until > time() and replica.out_reason and not replica.out_reason.startswith("lag"):
+                    continue
+                try:
+                    replica.lag_seconds = self.lag(replica.host)
+                except Exception as e:
+                    self.fail(replica, f"{e}")
+                    continue
+                if replica.lag_seconds is not None and replica.lag_seconds > self.max_lag_seconds:
+                    if replica.out_until <= time():
+                        logger.warning(
+                            f"Read replica {replica.host} lags {replica.lag_seconds:.0f}s, out of rotation"
+                        )
+                    # Until the next check, which puts it back if it caught up.
+                    replica.out_until = time() + self.check_seconds
+                    replica.out_reason = f"lag {replica.lag_seconds:.0f}s"
+                elif replica.out_reason and replica.out_reason.startswith("lag"):
+                    logger.info(f"Read replica {replica.host} caught up, back in rotation")
+                    replica.out_until = 0
+                    replica.out_reason = None
+        finally:
+            with self._lock:
+                self._checked = time()
+                self._checking = False
+
+    def caught_up(self, replica: Replica, min_position: Optional[datetime]) -> bool:
+        """
+        If replica has redone every commit up to min_position.  Positions only move forward, so once caught up the
+        replica stays caught up.
+        """
+        if min_position is None:
+            return True
+        if replica.position is not None and replica.position >= min_position:
+            return True
+        if self.position is None or time() - replica.position_checked < self.POSITION_CHECK_SECONDS:
+            return False
+        replica.position_checked = time()
+        try:
+            replica.position = self.position(replica.host)
+        except Exception as e:
+            self.fail(replica, f"{e}")
+            return False
+        return replica.position is not None and replica.position >= min_position
+
+    def acquire(self, min_position: Optional[datetime] = None) -> Optional[Replica]:
+        """
+        :param min_position: only pick replicas that have redone every commit up to this, see caught_up.
+        """
+        self.check()
+        now = time()
+        caught_up = [r for r in self.replicas if r.out_until <= now and self.caught_up(r, min_position)]
+        with self._lock:
+            available = [r for r in caught_up if r.out_until <= now]
+            if not available:
+                return None
+            measured = [r.rows_per_second for r in available if r.rows_per_second]
+            average = sum(measured) / len(measured) if measured else 1.0
+            replica = min(available, key=lambda r: (r.in_flight + 1) / (r.rows_per_second or average))
+            replica.in_flight += 1
+            return replica
+
+    def release(self, replica: Replica):
+        with self._lock:
+            replica.in_flight -= 1
+
+    def record(self, replica: Replica, rows: int, elapsed: float):
+        """
+        A split read of rows in elapsed seconds finished on replica, update its throughput.
+        """
+        if rows <= 0 or elapsed <= 0:
+            return
+        with self._lock:
+            replica.rows += rows
+            rows_per_second = rows / elapsed
+            if replica.rows_per_second is None:
+                replica.rows_per_second = rows_per_second
+            else:
+                replica.rows_per_second += self.SMOOTHING * (rows_per_second - replica.rows_per_second)
+
+    def fail(self, replica: Replica, reason: str):
+        logger.warning(
+            f"Read replica {replica.host} failed, out of rotation for {self.retry_seconds:.0f}s: {reason}"
+        )
+        with self._lock:
+            replica.out_until = time() + self.retry_seconds
+            replica.out_reason = reason
+
+    def __str__(self):
+        return ", ".join(str(r) for r in self.replicas)
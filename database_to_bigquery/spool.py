@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import shutil
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable, List, Optional
+
+import backoff
+
+logger = logging.getLogger("DatabaseToBigquery")
+
+
+class SpoolUploader:
+    """
+    Uploads content files that were spooled to local disk, in parallel and with retries.
+
+    Reading a split then only holds the database connection while fetching rows, and a failing upload is retried from
+    disk instead of reading the split from the database again.
+    """
+
+    UPLOAD_TRIES = 8
+    COPY_BUFFER_SIZE = 16 * 1024 * 1024
+
+    def __init__(self, directory: str, max_bytes: int = -1, threads: int = 4):
+        """
+        :param directory: local directory to spool to, e.g. on tmpfs.
+        :param max_bytes: cap on bytes spooled and not yet uploaded, -1 for no cap.  Writers reserve bytes as they
+                          write them, see reserve.  Content files started while the spool is full are written to the
+                          destination directly.
+        :param threads: number of parallel uploads.
+        """
+        self.directory: str = directory
+        self.max_bytes: int = max_bytes
+        self.spooled_bytes: int = 0
+        self.threads: int = max(threads, 1)
+        os.makedirs(directory, exist_ok=True)
+        self._executor = ThreadPoolExecutor(self.threads)
+        # Waits for the uploads of a split, then writes its crc.  Never waited on by uploads, so it can not deadlock.
+        self._finisher = ThreadPoolExecutor(1)
+        self._lock = threading.Lock()
+        self._uploads = {}
+        self._pending: List[Future] = []
+
+    def spool_path(self, location: str) -> Optional[str]:
+        """
+        Local path to spool the content file for location to, None if the spool is full.
+        """
+        with self._lock:
+            if 0 < self.max_bytes <= self.spooled_bytes:
+                logger.info(f"Spool is full, writing {location} directly")
+                return None
+        return os.path.join(self.directory, f"{uuid.uuid4().hex}-{os.path.basename(location)}")
+
+    def reserve(self, size: int) -> bool:
+        """
+        Count size bytes about to be written to a spooled file, False if that would exceed max_bytes.  The bytes are
+        released when the file is uploaded, or with release.
+        """
+        with self._lock:
+            if 0 < self.max_bytes < self.spooled_bytes + size:
+                return False
+            self.spooled_bytes += size
+            return True
+
+    def release(self, size: int):
+        with self._lock:
+            self.spooled_bytes -= size
+
+    def upload(self, local_path: str, location: str, reserved: int = 0) -> Future:
+        """
+        Upload a spooled file to location in the background.  The local file is removed once uploaded.
+
+        :param reserved: bytes of the file already counted with reserve.
+        """
+        size = os.path.getsize(local_path)
+        with self._lock:
+            self.spooled_bytes += size - reserved
+            future = self._executor.submit(self._upload, local_path, location, size)
+            self._uploads[location] = future
+            self._pending.append(future)
+        return future
+
+    def _copy(self, local_path: str, location: str):
+        import smart_open
+
+        with open(local_path, "rb") as source, smart_open.open(location, "wb") as destination:
+            shutil.copyfileobj(source, destination, self.COPY_BUFFER_SIZE)
+
+    def _upload(self, local_path: str, location: str, size: int):
+        try:
+            backoff.on_exception(
+                backoff.expo, Exception, max_tries=self.UPLOAD_TRIES, max_value=60
+            )(self._copy)(local_path, location)
+            logger.info(f"Uploaded spooled {location} ({size} bytes)")
+        finally:
+            os.remove(local_path)
+            with self._lock:
+                self.spooled_bytes -= size
+
+    def after(self, locations: List[str], fn: Callable[[], None]):
+        """
+        Call fn once the uploads of locations have succeeded, right away if none of them were spooled.
+        """
+        with self._lock:
+            uploads = [self._uploads[l] for l in locations if l in self._uploads]
+        if not uploads:
+            fn()
+            return
+
+        def finish():
+            wait(uploads)
+            for upload in uploads:
+                # Raises if the upload failed, and fn is not called.
+                upload.result()
+            fn()
+
+        with self._lock:
+            self._pending.append(self._finisher.submit(finish))
+
+    def wait(self):
+        """
+        Wait for every upload and fn given to after.  Raises the first failure.
+        """
+        while True:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                self._uploads = {l: f for l, f in self._uploads.items() if not f.done()}
+            if not pending:
+                return
+            wait(pending)
+            for future in pending:
+                future.result()
+
+    def shutdown(self):
+        """
+        Wait for the uploads and stop their threads.  The spool can still be used after, threads are started again
+        on the next upload.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, ThreadPoolExecutor(self.threads)
+            finisher, self._finisher = self._finisher, ThreadPoolExecutor(1)
+        executor.shutdown(wait=True)
+        finisher.shutdown(wait=True)
@@ -1,20 +1,21 @@
 # -*- coding: utf-8 -*-
 # import pymssql
 import json
-from typing import Tuple, List, Optional
+from typing import Callable, Dict, Iterable, Iterator, Tuple, List, Optional, Set, TYPE_CHECKING
 import logging
-import smart_open
-from sqlalchemy.exc import OperationalError
 import csv
-import decimal
+import functools
+import hashlib
+import io
 import platform
 import os
-import pyodbc
+import threading
 import backoff
+import contextlib
+from contextlib import contextmanager
+from datetime import date, datetime
 from time import time
-from google.cloud import bigquery
-from sqlalchemy import create_engine
-from sqlalchemy import engine
+from database_to_bigquery import arrow_fetch
 from database_to_bigquery.base import (
     DatabaseToCsv,
     elapsed_string,
@@ -22,8 +23,24 @@ from database_to_bigquery.base import (
     CopyResult,
     SplitResult,
     IngestResult,
+    SplitPlan,
+    TablePlan,
     DatabaseToBigquery,
 )
+from database_to_bigquery.concurrency import AdaptiveConcurrency, SplitProgress
+from database_to_bigquery.replicas import Replica, ReplicaPool
+from database_to_bigquery.spool import SpoolUploader
+from database_to_bigquery.type_mapping import (
+    TypeMapping,
+    SQL_SS_TIMESTAMPOFFSET,
+    datetimeoffset_converter,
+)
+
+# The heavy dependencies (sqlalchemy, pyodbc, google-cloud-bigquery and smart_open) are imported where they are used,
+# so importing this module stays cheap.  This matters for serverless runs where cold start is a large share of runtime.
+if TYPE_CHECKING:
+    from sqlalchemy import engine
+    from google.cloud import bigquery
 
 logger = logging.getLogger("DatabaseToBigquery")
 logger.setLevel(logging.INFO)
@@ -38,6 +55,253 @@ def retry_https_status_codes():
     return [503]
 
 
+def encode_watermark(value) -> Optional[dict]:
+    """
+    Encode a watermark value (rowversion or date) so it can be stored as json, with its type.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (bytes, bytearray)):
+        return {"type": "bytes", "value": bytes(value).hex()}
+    # datetime is a date as well.
+    if isinstance(value, datetime):
+        return {"type": "datetime", "value": value.isoformat()}
+    if isinstance(value, date):
+        return {"type": "date", "value": value.isoformat()}
+    if isinstance(value, int):
+        return {"type": "int", "value": value}
+    return {"type": "str", "value": str(value)}
+
+
+def decode_watermark(encoded: Optional[dict]):
+    """
+    Decode a watermark value stored with encode_watermark, to be used as a query parameter.  Dates are bound as dates,
+    a string with fractional seconds does not convert to DATETIME or SMALLDATETIME.
+    """
+    if encoded is None:
+        return None
+    if encoded["type"] == "bytes":
+        return bytes.fromhex(encoded["value"])
+    if encoded["type"] == "datetime":
+        return datetime.fromisoformat(encoded["value"])
+    if encoded["type"] == "date":
+        return date.fromisoformat(encoded["value"])
+    if encoded["type"] == "int":
+        return int(encoded["value"])
+    return encoded["value"]
+
+
+class RollingContentFile:
+    """
+    File like destination for the csv rows of a split, that rolls over to a new content file when the current one
+    has max_rows rows or max_bytes bytes.  Every content file starts with header.
+
+    Rolls over between writes, which is between rows since the csv writer writes a row at a time.  Rows with large
+    values are written in pieces with write_row.
+
+    With a spool, content files are written to local disk and handed to the spool for upload when complete.  If the
+    spool fills up while a file is written, the file continues at its destination, see _spill.
+    """
+
+    def __init__(
+        self,
+        location: Callable[[int], str],
+        header: str,
+        max_bytes: int = -1,
+        max_rows: int = -1,
+        spool: Optional[SpoolUploader] = None,
+    ):
+        """
+        :param location: part number -> location of the content file.
+        :param header: the csv header.
+        :param max_bytes: roll over after this many bytes (utf-8) in a file, -1 for no limit.
+        :param max_rows: roll over after this many rows in a file, -1 for no limit.
+        :param spool: Optional spool to write through.
+        """
+        self.location: Callable[[int], str] = location
+        self.header: str = header
+        self.max_bytes: int = max_bytes
+        self.max_rows: int = max_rows
+        self.locations: List[str] = []
+        self.spool: Optional[SpoolUploader] = spool
+        self._file = None
+        self._spool_path: Optional[str] = None
+        # Bytes of the spooled file reserved in a spool with a cap.
+        self._reserved: int = 0
+        self._bytes: int = 0
+        self._rows: int = 0
+
+    def _roll(self):
+        import smart_open
+
+        self.close()
+        self.locations.append(self.location(len(self.locations)))
+        if len(self.locations) > 1:
+            logger.info(f"Rolling over to content file {self.locations[-1]}")
+        self._spool_path = self.spool.spool_path(self.locations[-1]) if self.spool else None
+        if self._spool_path:
+            self._file = open(self._spool_path, "w", encoding="utf-8", newline="")
+        else:
+            self._file = smart_open.open(
+                self.locations[-1], "w", encoding="utf-8", newline=""
+            )
+        self._write(self.header)
+        self._bytes = 0
+        self._rows = 0
+
+    def _write(self, data: str):
+        """
+        Write to the current content file, counting bytes if they are limited.
+        """
+        spool_capped = self._spool_path is not None and self.spool.max_bytes > 0
+        if self.max_bytes > 0 or spool_capped:
+            size = len(data.encode("utf-8"))
+            self._bytes += size
+            if spool_capped:
+                if self.spool.reserve(size):
+                    self._reserved += size
+                else:
+                    self._spill()
+        return self._file.write(data)
+
+    def _spill(self):
+        """
+        The spool is full.  Copy what was spooled of the current content file to its destination, and write the rest
+        there directly.  Works in the middle of a row, so a large split or row never overfills the spool.
+        """
+        import shutil
+        import smart_open
+
+        logger.info(f"Spool is full, writing the rest of {self.locations[-1]} directly")
+        self._file.close()
+        destination = smart_open.open(self.locations[-1], "w", encoding="utf-8", newline="")
+        with open(self._spool_path, encoding="utf-8", newline="") as spooled:
+            shutil.copyfileobj(spooled, destination, SpoolUploader.COPY_BUFFER_SIZE)
+        os.remove(self._spool_path)
+        self.spool.release(self._reserved)
+        self._reserved = 0
+        self._spool_path = None
+        self._file = destination
+
+    def _roll_if_full(self, rows: int = 1):
+        if self._rows > 0 and (
+            (0 < self.max_rows <= self._rows) or (0 < self.max_bytes <= self._bytes)
+        ):
+            self._roll()
+        self._rows += rows
+
+    def write(self, data: str):
+        self._roll_if_full()
+        return self._write(data)
+
+    def write_row(self, pieces: Iterable[str]):
+        """
+        Write a single row given in pieces, so a row with large values is never in memory as one string.
+        """
+        self._roll_if_full()
+        for piece in pieces:
+            self._write(piece)
+
+    def write_rows(self, data: str, rows: int):
+        """
+        Write several csv rows at once.  Rolls over before the rows, so a file can be up to one write over the limits.
+        """
+        self._roll_if_full(rows)
+        return self._write(data)
+
+    def close(self, upload: bool = True):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            if self._spool_path:
+                if upload:
+                    self.spool.upload(self._spool_path, self.locations[-1], reserved=self._reserved)
+                else:
+                    os.remove(self._spool_path)
+                    self.spool.release(self._reserved)
+                self._spool_path = None
+            self._reserved = 0
+
+    def __enter__(self):
+        # Always at least one file, empty splits get a file with only the header.
+        self._roll()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Do not upload a spooled file that was cut short by an error.
+        self.close(upload=exc_type is None)
+
+
+def csv_row_pieces(
+    row: dict, columns: List[str], encoders: Dict[str, Callable], chunked: Dict[str, Callable], chunk_size: int
+) -> Iterator[str]:
+    """
+    A csv row in pieces, the same as the csv writer would write it.  Values of columns in chunked that are longer
+    than chunk_size are encoded in pieces of chunk_size, the other values are written by the csv writer.
+    """
+    small = []
+    separator = ""
+    for name in columns:
+        value = row[name]
+        if name in chunked and value is not None and len(value) > chunk_size:
+            if small:
+                yield separator + csv_fields(small)
+                separator = ","
+                small = []
+            yield separator
+            separator = ","
+            yield from chunked[name](value, chunk_size)
+        else:
+            small.append(encoders[name](value))
+    if small:
+        yield separator + csv_fields(small)
+    yield "\r\n"
+
+
+def csv_fields(values: list) -> str:
+    """
+    Part of a csv row, without line terminator.
+    """
+    if len(values) == 1 and values[0] in (None, ""):
+        # The csv writer quotes a row of a single empty field, which is not what it does within a row.
+        return ""
+    fields = io.StringIO()
+    # The line terminator decides which values are quoted, so it is written and cut off rather than left out.
+    csv.writer(fields, quotechar='"').writerow(values)
+    return fields.getvalue()[:-2]
+
+
+def has_large_value(row: dict, chunked: Dict[str, Callable], chunk_size: int) -> bool:
+    for name in chunked:
+        value = row[name]
+        if value is not None and len(value) > chunk_size:
+            return True
+    return False
+
+
+def comparable_value(value):
+    """
+    A split min/max value as read back from a crc, in a form that compares like in SQL Server.  None if unknown.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    return None
+
+
+def is_retryable_connect_error(e: Exception) -> bool:
+    """
+    Only retry sqlalchemy OperationalErrors that are caused by a timeout.
+    """
+    from sqlalchemy.exc import OperationalError
+
+    return isinstance(e, OperationalError) and "timeout" in f"{e}"
+
+
 class SqlServerToCsv(DatabaseToCsv):
     """
     TODO: a lot of the concepts in this class can/should be moved to base class.
@@ -53,9 +317,62 @@ class SqlServerToCsv(DatabaseToCsv):
     TABLE_ROWS_MAX_SIZE_CRC = 100000000
     TABLE_ROWS_SHOULD_HAVE_SPLITS = 10000000
     CSV_CONTENT_POSTFIX = "content"
+    CRC_CONTENT_FILES = "content_files"
+    HISTORY_POSTFIX = "history"
+    # crc of dynamic sources in single scan mode, see __init__.
+    CRC_SINGLE_SCAN = "SINGLE_SCAN"
+    # SQL Server types that change on every update of a row.
+    ROWVERSION_TYPES = ["TIMESTAMP", "ROWVERSION"]
+    INCREMENTAL_FOLDER = "incremental"
+    WATERMARK_POSTFIX = "watermark"
+    # Types of incremental columns that can be held back by incremental_lag_seconds.
+    INCREMENTAL_DATE_TYPES = ["DATE", "DATETIME", "DATETIME2", "SMALLDATETIME", "DATETIMEOFFSET"]
 
     SPLIT_NO_SPLIT = -1
     SPLIT_DYNAMIC = 0
+    PAGE_SIZE = 8192
+
+    # How rows are assigned to splits.  ROW_NUMBER sorts the table by the split keys, HASH puts rows in buckets by
+    # CHECKSUM of the split keys, which needs no sort.  AUTO uses HASH when every column is a split key, i.e. the
+    # table has no primary key.
+    SPLIT_STRATEGY_AUTO = "auto"
+    SPLIT_STRATEGY_ROW_NUMBER = "row_number"
+    SPLIT_STRATEGY_HASH = "hash"
+    # PARTITION aligns splits to the partitions of a partitioned table, so each split query only touches one
+    # partition.  Split ids are partition number * PARTITION_SPLIT_FACTOR + sub split within the partition.
+    SPLIT_STRATEGY_PARTITION = "partition"
+    PARTITION_SPLIT_FACTOR = 100000
+
+    # Transaction isolation of all queries towards the database.  SNAPSHOT reads from a single shared snapshot, see
+    # consistent_snapshot.  READ_COMMITTED_SNAPSHOT needs the READ_COMMITTED_SNAPSHOT database option, and gives
+    # every query its own snapshot.  READ_UNCOMMITTED is the same as NOLOCK, only safe for static sources.
+    ISOLATION_SNAPSHOT = "snapshot"
+    ISOLATION_READ_COMMITTED_SNAPSHOT = "read_committed_snapshot"
+    ISOLATION_READ_UNCOMMITTED = "read_uncommitted"
+    SQLALCHEMY_ISOLATION_LEVELS = {
+        ISOLATION_SNAPSHOT: "SNAPSHOT",
+        ISOLATION_READ_COMMITTED_SNAPSHOT: "READ COMMITTED",
+        ISOLATION_READ_UNCOMMITTED: "READ UNCOMMITTED",
+    }
+
+    ADAPTIVE_INITIAL_THREADS = 2
+
+    FETCH_BATCH_SIZE = 500
+    # Tables with large object columns are fetched in smaller batches, since every value of a batch is in memory.
+    LOB_FETCH_BATCH_SIZE = 50
+    # Large object values longer than this many characters (bytes for binary) are encoded and written in pieces.
+    LOB_CHUNK_SIZE = 1024 * 1024
+
+    # How split queries are fetched and converted to csv.  ROWS fetches rows with pyodbc and converts a value at a
+    # time.  ARROW fetches record batches with arrow-odbc and converts a column at a time, see arrow_fetch.
+    FETCH_ENGINE_ROWS = "rows"
+    FETCH_ENGINE_ARROW = "arrow"
+    ARROW_BATCH_SIZE = 10000
+    # A split is a straggler if we estimate it needs STRAGGLER_FACTOR times longer than the median split to finish.
+    STRAGGLER_FACTOR = 2.0
+    STRAGGLER_MIN_SECONDS = 60
+    STRAGGLER_MIN_ROWS = 50000
+    STRAGGLER_CHECK_SECONDS = 5
 
     def __init__(
             self,
@@ -65,6 +382,24 @@ class SqlServerToCsv(DatabaseToCsv):
             database: str,
             destination: str,
             extra_crc_fields: Optional[List[str]] = None,
+            type_overrides: Optional[dict] = None,
+            single_scan: bool = False,
+            isolation_level: Optional[str] = None,
+            content_file_max_bytes: int = -1,
+            content_file_max_rows: int = -1,
+            metadata_ttl: float = 0,
+            include_columns: Optional[List[str]] = None,
+            exclude_columns: Optional[List[str]] = None,
+            computed_columns: Optional[dict] = None,
+            spool_directory: Optional[str] = None,
+            spool_max_bytes: int = -1,
+            spool_upload_threads: int = 4,
+            lob_fetch_batch_size: int = LOB_FETCH_BATCH_SIZE,
+            lob_chunk_size: int = LOB_CHUNK_SIZE,
+            fetch_engine: str = FETCH_ENGINE_ROWS,
+            read_replicas: Optional[List[str]] = None,
+            replica_max_lag_seconds: float = -1,
+            replica_planning: bool = False,
     ):
         """
 
@@ -75,7 +410,47 @@ class SqlServerToCsv(DatabaseToCsv):
         :param destination:
         :param extra_crc_fields: Optional list of extra fields that will be used for crc in splits.
                                  will do min/max on the field in the group by. Will be gracefully ignored if field doesnt exist.
+        :param type_overrides: Optional dict of column name or SQL Server type -> BigQuery type.
+        :param single_scan: for dynamic sources, plan splits with counts, key ranges and the max of the rowversion
+                            column only, instead of a CHECKSUM_AGG over every column, so a changed split is scanned
+                            once instead of twice.  Dynamic sources need a rowversion column, see check_single_scan.
+        :param isolation_level: Optional transaction isolation, one of the ISOLATION_* values.  None uses the
+                                default of the driver, READ COMMITTED.
+        :param content_file_max_bytes: roll a split over to a new content file after this many bytes, -1 for one
+                                       file per split.  Smaller files make uploads, retries and BigQuery loads
+                                       more parallel.
+        :param content_file_max_rows: roll a split over to a new content file after this many rows, -1 for no limit.
+        :param metadata_ttl: keep the columns of a table in memory for this many seconds, for long running processes
+                             that copy the same table again.  0 reads them every time.
+        :param include_columns: Optional list of columns to read, all other columns are left out.
+        :param exclude_columns: Optional list of columns to leave out.  Left out columns are not part of any query.
+        :param computed_columns: Optional dict of column name -> SQL expression, read as extra columns.  Loaded as
+                                 STRING unless the column name is in type_overrides.
+        :param spool_directory: Optional local directory (disk or tmpfs) to write content files to before they are
+                                uploaded in the background, see SpoolUploader.
+        :param spool_max_bytes: cap on bytes in spool_directory waiting for upload, -1 for no cap.
+        :param spool_upload_threads: number of parallel uploads from the spool.
+        :param lob_fetch_batch_size: rows per fetch for tables with (N)VARCHAR(MAX), VARBINARY(MAX) or other large
+                                     object columns, instead of FETCH_BATCH_SIZE.
+        :param lob_chunk_size: large object values longer than this are encoded and written to the csv in pieces of
+                               this size, instead of being copied whole a few times on the way.
+        :param fetch_engine: one of the FETCH_ENGINE_* values.  The arrow engine needs pyarrow and arrow-odbc, and
+                             falls back to the rows engine when they are missing or the copy needs the rows engine,
+                             see fetch_engine_for.
+        :param read_replicas: Optional list of read-only hosts, e.g. readable secondaries of an availability group.
+                              Split queries are spread over them, see ReplicaPool, metadata queries stay on host.
+        :param replica_max_lag_seconds: take a replica out of rotation while it is more than this many seconds
+                                        behind host, -1 to not check.
+        :param replica_planning: also run the split planning queries, i.e. the crc aggregation, on the replicas.
         """
+        if fetch_engine not in (self.FETCH_ENGINE_ROWS, self.FETCH_ENGINE_ARROW):
+            raise ValueError(
+                f"Unsupported fetch engine {fetch_engine}, use {self.FETCH_ENGINE_ROWS} or {self.FETCH_ENGINE_ARROW}"
+            )
+        if isolation_level is not None and isolation_level not in self.SQLALCHEMY_ISOLATION_LEVELS:
+            raise ValueError(
+                f"Unsupported isolation level {isolation_level}, use one of {', '.join(self.SQLALCHEMY_ISOLATION_LEVELS)}"
+            )
         self.username: str = username
         self.password: str = password
         self.host: str = host
@@ -83,76 +458,392 @@ class SqlServerToCsv(DatabaseToCsv):
         self.destination: str = destination
         self.port = os.getenv("DB_PORT", "1433")
         self.connection_driver = os.getenv("DB_DRIVER", driver)
+        self._sql_engine = None
+        self._sql_engine_lock = threading.Lock()
+        self.strip_char_type = True
+        self.type_mapping = TypeMapping(
+            overrides=type_overrides, strip_char_type=self.strip_char_type
+        )
+        # binary types are loaded as BYTES, add types here to leave them out.
+        self.ignore_mssql_types = []
+        self.single_scan: bool = single_scan
+        self.content_file_max_bytes: int = content_file_max_bytes
+        self.content_file_max_rows: int = content_file_max_rows
+        self.metadata_ttl: float = metadata_ttl
+        self.include_columns: Optional[List[str]] = include_columns
+        self.exclude_columns: List[str] = exclude_columns or []
+        self.computed_columns: dict = computed_columns or {}
+        self.spool: Optional[SpoolUploader] = None
+        if spool_directory:
+            self.spool = SpoolUploader(
+                directory=spool_directory,
+                max_bytes=spool_max_bytes,
+                threads=spool_upload_threads,
+            )
+        self.lob_fetch_batch_size: int = lob_fetch_batch_size
+        self.lob_chunk_size: int = lob_chunk_size
+        self.fetch_engine: str = fetch_engine
+        self.replicas: Optional[ReplicaPool] = None
+        if read_replicas:
+            self.replicas = ReplicaPool(
+                hosts=read_replicas,
+                lag=self.replica_lag_seconds,
+                max_lag_seconds=replica_max_lag_seconds,
+                position=self.commit_position,
+            )
+        self.replica_planning: bool = replica_planning
+        self._replica_engines: dict = {}
+        # If split reads can go to replicas, and the position they must have caught up with, see allow_replica_reads.
+        self._replica_reads: bool = False
+        self._replica_position: Optional[datetime] = None
+        self._metadata_cache: dict = {}
+        self.isolation_level: Optional[str] = isolation_level
+        # Connections in the shared snapshot while copying with ISOLATION_SNAPSHOT, see consistent_snapshot.
+        self._snapshot = None
+        self._lock_wait_stats = True
+        if extra_crc_fields:
+            self.extra_crc_fields = [f for f in extra_crc_fields]
+        else:
+            self.extra_crc_fields = None
+
+    @property
+    def sql_engine(self) -> "engine.Engine":
+        """
+        The sqlalchemy engine is created on first use, so runs that never touch the database do not pay for
+        importing sqlalchemy/pyodbc.
+        """
+        if self._sql_engine is None:
+            with self._sql_engine_lock:
+                if self._sql_engine is None:
+                    self._sql_engine = self._create_engine(self.host)
+        return self._sql_engine
 
-        # This method seems to handle cases where instance name is supplied better than sqlalchemy create engine with
-        # an url string.
-        self.sql_engine = create_engine(
-            "mssql://",
-            creator=lambda x: pyodbc.connect(
+    def replica_engine(self, host: str) -> "engine.Engine":
+        """
+        Engine for a read replica, connecting with ApplicationIntent=ReadOnly.
+        """
+        with self._sql_engine_lock:
+            if host not in self._replica_engines:
+                self._replica_engines[host] = self._create_engine(host, read_only=True)
+            return self._replica_engines[host]
+
+    def _create_engine(self, host: str, read_only: bool = False) -> "engine.Engine":
+        import pyodbc
+        from sqlalchemy import create_engine
+
+        # This method seems to handle cases where instance name is supplied better than sqlalchemy create
+        # engine with an url string.
+        def creator(*args):
+            options = {"ApplicationIntent": "ReadOnly"} if read_only else {}
+            connection = pyodbc.connect(
                 driver=self.connection_driver,
-                server=self.host,
+                server=host,
                 database=self.database,
                 uid=self.username,
                 pwd=self.password,
                 port=self.port,
-            ),
+                **options,
+            )
+            connection.add_output_converter(
+                SQL_SS_TIMESTAMPOFFSET, datetimeoffset_converter
+            )
+            return connection
+
+        engine_options = {}
+        if self.isolation_level:
+            engine_options["isolation_level"] = self.SQLALCHEMY_ISOLATION_LEVELS[
+                self.isolation_level
+            ]
+        return create_engine("mssql://", creator=creator, **engine_options)
+
+    def dispose(self):
+        """
+        Close the pooled connections, stop the spool upload threads and forget cached metadata.  The engine is created
+        again on next use.
+        """
+        if self.spool:
+            self.spool.shutdown()
+        with self._sql_engine_lock:
+            if self._sql_engine is not None:
+                self._sql_engine.dispose()
+                self._sql_engine = None
+            for replica_engine in self._replica_engines.values():
+                replica_engine.dispose()
+            self._replica_engines = {}
+        self._metadata_cache = {}
+
+    def connect(self, replica: Optional[Replica] = None) -> "engine.Connection":
+        """
+        :param replica: Optional read replica to connect to instead of the primary.  Not retried, a replica that can
+                        not be connected to is taken out of rotation and the query goes elsewhere right away.
+        """
+        if replica is None:
+            return self._connect_primary()
+        logger.info(
+            f"Connecting to {self.database} on {replica.host} as user {self.username}"
         )
-        self.strip_char_type = True
-        # bigquery doesnt really have blobs/lobs/..
-        self.ignore_mssql_types = ["VARBINARY"]
-        if extra_crc_fields:
-            self.extra_crc_fields = [f for f in extra_crc_fields]
-        else:
-            self.extra_crc_fields = None
+        return self.replica_engine(replica.host).connect()
 
     @backoff.on_exception(
         backoff.expo,
-        OperationalError,
+        Exception,
         max_tries=8,
         jitter=None,
         max_time=300,
-        giveup=lambda e: "timeout" not in f"{e}",
+        giveup=lambda e: not is_retryable_connect_error(e),
     )
-    def connect(self) -> engine.Connection:
+    def _connect_primary(self) -> "engine.Connection":
         logger.info(
             f"Connecting to {self.database} on {self.host} as user {self.username}"
         )
         return self.sql_engine.connect()
 
-    def safe_cast(self, the_value):
+    @contextmanager
+    def query_connection(self, replica: Optional[Replica] = None, primary_fallback: bool = True):
         """
-        Cast the value to something bigquery can handle
+        Connection for reading splits.  While a shared snapshot is open, this is one of the snapshot connections, so
+        every split sees the database at the same point in time.  Otherwise a connection to replica, or to the
+        primary if replica is None or can not be connected to.
+
+        :param primary_fallback: connect to the primary if replica can not be connected to, otherwise raise.  Split
+                                 reads handle a failing replica themselves, see write_split_to_destination.
         """
-        if isinstance(the_value, decimal.Decimal):
-            # Cast to string so we dont loose precision by casting to float.
-            return str(the_value)
+        snapshot = self._snapshot
+        if snapshot is None:
+            connection = None
+            if replica:
+                try:
+                    connection = self.connect(replica)
+                except Exception as e:
+                    if not primary_fallback:
+                        raise
+                    self.replicas.fail(replica, f"{e}")
+            if connection is None:
+                connection = self.connect()
+            with connection:
+                yield connection
         else:
-            if isinstance(the_value, str):
-                # bigquery fails if loading null terminations.
-                return the_value.replace(b"\x00".decode(), "")
-            return the_value
+            connection = snapshot.get()
+            try:
+                yield connection
+            finally:
+                snapshot.put(connection)
+
+    @contextmanager
+    def read_replica(self, planning: bool = False):
+        """
+        Pick a read replica for a split read, or planning query if replica_planning, and release it afterwards.
+        Yields None if there are no replicas in rotation, the query then goes to the primary.
+
+        Split reads while a shared snapshot is open always use the snapshot connections on the primary.  Split reads of
+        a dynamic source only use replicas that have caught up with the split planning, see copy_table.
+        """
+        if self.replicas is None or self._snapshot is not None or (planning and not self.replica_planning):
+            yield None
+            return
+        if not planning and not self._replica_reads:
+            yield None
+            return
+        replica = self.replicas.acquire(min_position=None if planning else self._replica_position)
+        try:
+            yield replica
+        finally:
+            if replica:
+                self.replicas.release(replica)
+
+    def commit_position(self, host: Optional[str] = None) -> Optional[datetime]:
+        """
+        Time of the last commit of the database in the availability group, on host or the primary.  On a replica this
+        is the last commit redone there.  None if the database is not in an availability group.
+        """
+        sql = (
+            "SELECT last_commit_time FROM sys.dm_hadr_database_replica_states "
+            "WHERE is_local = 1 AND database_id = DB_ID()"
+        )
+        with self.connect(Replica(host) if host else None) as connection:
+            return connection.execute(sql).scalar()
+
+    def replica_lag_seconds(self, host: str) -> Optional[float]:
+        """
+        How far the replica on host is behind the primary, from the last commit time of the database on each in the
+        availability group.  None if the database is not in an availability group.
+        """
+        primary_commit = self.commit_position()
+        replica_commit = self.commit_position(host)
+        if primary_commit is None or replica_commit is None:
+            return None
+        return max((primary_commit - replica_commit).total_seconds(), 0)
+
+    def allow_replica_reads(self, table: str, static_source: bool):
+        """
+        Decide if the split reads of this copy can go to replicas.  Call after planning the splits.
+
+        A split read after its crc is planned sees the same or newer rows, and newer rows are found by the next copy,
+        whose crc no longer matches.  A lagging replica can return older rows, which would be stored under the newer
+        crc and never read again.  So split reads of a dynamic source only go to replicas that have redone every commit
+        the primary had when planning finished, and stay on the primary if that can not be known.
+        """
+        self._replica_reads = True
+        self._replica_position = None
+        if self.replicas is None or static_source:
+            return
+        self._replica_position = self.commit_position()
+        if self._replica_position is None:
+            logger.warning(
+                f"{table}: {self.database} is not in an availability group, can not tell if a replica has caught up "
+                f"with the splits.  Reading the splits of this dynamic source from the primary"
+            )
+            self._replica_reads = False
+
+    @contextmanager
+    def consistent_snapshot(self, table: str, schema: str, connections: int):
+        """
+        Open connections in SNAPSHOT transactions that share (nearly) the same snapshot, to be used by
+        query_connection until the context exits.
+
+        SQL Server can not share a snapshot between sessions, and the snapshot of a transaction is taken at its first
+        read.  So all connections are opened first, and then read from the table right after each other.  The time
+        between the first and last read is logged as the skew of the snapshot.  Every split read afterwards, on any
+        of the connections, sees the data as of that point, and takes no shared locks.
+
+        :param connections: number of connections, the number of concurrent split queries.
+        """
+        import queue
+
+        opened = []
+        try:
+            for _ in range(max(connections, 1)):
+                connection = self.connect()
+                opened.append((connection, connection.begin()))
+            start = time()
+            for connection, _ in opened:
+                connection.execute(f"SELECT TOP 1 1 FROM {schema}.{table}").fetchall()
+            logger.info(
+                f"{table}: Opened {len(opened)} connections on a shared snapshot, skew {time() - start:.3f}s"
+            )
+            self._snapshot = queue.Queue()
+            for connection, _ in opened:
+                self._snapshot.put(connection)
+            yield
+        finally:
+            self._snapshot = None
+            for connection, transaction in opened:
+                try:
+                    transaction.rollback()
+                    connection.close()
+                except Exception as e:
+                    logger.warning(f"{table}: Unable to close snapshot connection: {e}")
+
+    def check_single_scan(self, table: str, static_source: bool, columns_type: List[Column]):
+        """
+        Single scan detects updates of a dynamic source by the max rowversion of a split, which changes on every
+        update.  Without a rowversion column updates that keep the count and key range of a split would go unnoticed.
+        """
+        if not self.single_scan or static_source:
+            return
+        if not any(c.data_type in self.ROWVERSION_TYPES for c in columns_type):
+            raise ValueError(
+                f"{table} has no rowversion column, single scan can not detect updates in a dynamic source.  "
+                f"Turn off single_scan, or add a rowversion column"
+            )
+
+    def check_isolation_level(self, static_source: bool):
+        """
+        Check that the database allows the configured isolation level, so we fail before planning splits.
+        """
+        if self.isolation_level == self.ISOLATION_READ_UNCOMMITTED:
+            if not static_source:
+                logger.warning(
+                    "Reading a dynamic source with READ UNCOMMITTED (NOLOCK), rows can be read twice or missed "
+                    "if they are changed while reading"
+                )
+            return
+        if self.isolation_level is None:
+            return
+        with self.connect() as connection:
+            database = connection.execute(
+                "SELECT snapshot_isolation_state, is_read_committed_snapshot_on FROM sys.databases WHERE name = DB_NAME()"
+            ).first()
+        if self.isolation_level == self.ISOLATION_SNAPSHOT and database["snapshot_isolation_state"] != 1:
+            raise ValueError(
+                f"Snapshot isolation is not allowed in {self.database}, "
+                f"ALTER DATABASE {self.database} SET ALLOW_SNAPSHOT_ISOLATION ON"
+            )
+        if (
+                self.isolation_level == self.ISOLATION_READ_COMMITTED_SNAPSHOT
+                and not database["is_read_committed_snapshot_on"]
+        ):
+            logger.warning(
+                f"READ_COMMITTED_SNAPSHOT is off in {self.database}, reads will take shared locks.  "
+                f"ALTER DATABASE {self.database} SET READ_COMMITTED_SNAPSHOT ON"
+            )
+
+    def session_lock_wait_ms(self, connection: "engine.Connection") -> Optional[int]:
+        """
+        Milliseconds the session of connection has waited on locks, from sys.dm_exec_session_wait_stats
+        (SQL Server 2016 and later).  None if not available.
+        """
+        if not self._lock_wait_stats:
+            return None
+        try:
+            return connection.execute(
+                "SELECT COALESCE(SUM(wait_time_ms), 0) FROM sys.dm_exec_session_wait_stats "
+                "WHERE session_id = @@SPID AND wait_type LIKE 'LCK%'"
+            ).scalar()
+        except Exception as e:
+            logger.warning(f"Unable to read lock waits, not measuring them: {e}")
+            self._lock_wait_stats = False
+            return None
+
+    def fetch_batch_size(self, columns_type: List[Column]) -> int:
+        if any(c.is_lob for c in columns_type):
+            return self.lob_fetch_batch_size
+        if self.fetch_engine_for(columns_type) == self.FETCH_ENGINE_ARROW:
+            return self.ARROW_BATCH_SIZE
+        return self.FETCH_BATCH_SIZE
+
+    def fetch_engine_for(self, columns_type: List[Column], log: bool = False) -> str:
+        """
+        The fetch engine used for a table.  The arrow engine is only used when it can do the same as the rows engine.
+        """
+        if self.fetch_engine == self.FETCH_ENGINE_ROWS:
+            return self.FETCH_ENGINE_ROWS
+        reason = None
+        if self.isolation_level == self.ISOLATION_SNAPSHOT:
+            reason = "the shared snapshot is held by pyodbc connections"
+        elif any(c.is_lob for c in columns_type):
+            reason = "large object values are written in chunks"
+        elif any(c.data_type == "DATETIMEOFFSET" for c in columns_type):
+            reason = "arrow-odbc does not read DATETIMEOFFSET values with their offset"
+        elif not arrow_fetch.available():
+            reason = "pyarrow or arrow-odbc is not installed"
+        if reason:
+            if log:
+                logger.warning(f"Using the {self.FETCH_ENGINE_ROWS} fetch engine, {reason}")
+            return self.FETCH_ENGINE_ROWS
+        return self.FETCH_ENGINE_ARROW
+
+    def odbc_connection_string(self, replica: Optional[Replica] = None) -> str:
+        """
+        Connection string for arrow-odbc, the same connection as the pyodbc connections of sql_engine, or of
+        replica_engine for a replica.
+        """
+        host = replica.host if replica else self.host
+        server = host if "\\" in host else f"{host},{self.port}"
+        read_only = "ApplicationIntent=ReadOnly;" if replica else ""
+        return f"Driver={self.connection_driver};Server={server};Database={self.database};{read_only}"
 
-    def row_to_bq(self, mssql_row: dict, mssql_datatypes: dict) -> dict:
+    def row_to_bq(self, mssql_row: dict, encoders: dict) -> dict:
         """
         Convert a row of data to something that is compatible with bigquery
         :param mssql_row:
-        :param mssql_datatypes:
+        :param encoders: column name -> encoder, from self.type_mapping.encoders
         :return: a row with datatyoes that are compatible with BigQuery
         """
-        bq_row = {}
-        for k, v in mssql_row.items():
-            if mssql_datatypes[k].upper() == "CHAR" and self.strip_char_type:
-                if v:
-                    bq_row[k] = v.strip()
-                else:
-                    bq_row[k] = None
-            else:
-                bq_row[k] = self.safe_cast(v)
-
-        return bq_row
+        return {k: encoders[k](v) for k, v in mssql_row.items()}
 
     def _get_columns_with_access(
-            self, connection: engine.Connection, tbl_schema: str, tbl_name: str
+            self, connection: "engine.Connection", tbl_schema: str, tbl_name: str
     ) -> Optional[List[str]]:
         try:
             res = next(
@@ -168,14 +859,27 @@ class SqlServerToCsv(DatabaseToCsv):
             self, tbl_schema: str, tbl_name: str
     ) -> Tuple[List[Column], List[str]]:
         """
-        Gets a list of columns belonging to the table tbl_name
+        Gets a list of columns belonging to the table tbl_name, from memory if read less than metadata_ttl ago.
         :param tbl_schema: schema where the table resides.
         :param tbl_name: name of the table
         :return: A tuple containing a list of columns + list of primary keys
         """
+        key = (tbl_schema, tbl_name)
+        cached = self._metadata_cache.get(key)
+        if cached is not None and time() - cached[0] < self.metadata_ttl:
+            return list(cached[1]), list(cached[2])
+        columns, pk_list = self._read_columns(tbl_schema=tbl_schema, tbl_name=tbl_name)
+        if self.metadata_ttl > 0:
+            self._metadata_cache[key] = (time(), columns, pk_list)
+        return list(columns), list(pk_list)
+
+    def _read_columns(
+            self, tbl_schema: str, tbl_name: str
+    ) -> Tuple[List[Column], List[str]]:
         with self.connect() as connection:
             schema_res = connection.execute(
-                "SELECT C.column_name, C.data_type from INFORMATION_SCHEMA.COLUMNS as C WHERE TABLE_SCHEMA=? AND TABLE_NAME=?",
+                "SELECT C.column_name, C.data_type, C.numeric_precision, C.numeric_scale, C.character_maximum_length "
+                "from INFORMATION_SCHEMA.COLUMNS as C WHERE TABLE_SCHEMA=? AND TABLE_NAME=?",
                 (tbl_schema, tbl_name),
             )
             columns: List[Column] = []
@@ -185,10 +889,17 @@ class SqlServerToCsv(DatabaseToCsv):
                 column = Column(
                     name=schema_row["column_name"],
                     data_type=schema_row["data_type"].upper(),
+                    precision=schema_row["numeric_precision"],
+                    scale=schema_row["numeric_scale"],
+                    max_length=schema_row["character_maximum_length"],
                 )
-                if schema_row["data_type"].upper() not in self.ignore_mssql_types:
+                if schema_row["data_type"].upper() not in self.ignore_mssql_types and self.is_projected(column.name):
                     columns.append(column)
                 debug_data.append(column)
+            if debug_data:
+                self.check_projection(tbl_schema, tbl_name, debug_data)
+            for name, expression in self.computed_columns.items():
+                columns.append(Column(name=name, data_type="COMPUTED", expression=expression))
             if len(columns) == 0:
                 print(
                     f"Oh no. No columns on table {tbl_name} after filtering.  Dumping debug stack!"
@@ -205,6 +916,11 @@ class SqlServerToCsv(DatabaseToCsv):
             pk_list = []
             for pk_row in pk_res:
                 pk_column = pk_row["COLUMN_NAME"]
+                if pk_column not in columns:
+                    raise ValueError(
+                        f"Primary key {pk_column} of {tbl_schema}.{tbl_name} is left out by the column "
+                        f"projection, it is needed to split the table"
+                    )
                 pk_list.append(pk_column)
                 columns[columns.index(pk_column)].pk = True
 
@@ -220,7 +936,7 @@ class SqlServerToCsv(DatabaseToCsv):
                         f"The table or view {tbl_schema}.{tbl_name} has no primary keys, will try to use all"
                         f" columns as sorting keys..."
                     )
-                    pk_from_env = [c.name for c in columns]
+                    pk_from_env = [c.name for c in columns if not c.expression]
                 for pk_row in pk_from_env:
                     pk_column: str = pk_row
                     pk_list.append(pk_column)
@@ -228,17 +944,159 @@ class SqlServerToCsv(DatabaseToCsv):
 
             return columns, pk_list
 
+    @staticmethod
+    def is_keyless(columns_type: List[Column]) -> bool:
+        """
+        If every column of the table is a key, i.e. the table has no primary key and all its columns are used instead.
+        Computed columns are never keys.
+        """
+        return all(c.pk for c in columns_type if not c.expression)
+
+    def is_projected(self, column_name: str) -> bool:
+        """
+        If the column is read, according to include_columns and exclude_columns.  Names match case insensitively, like
+        SQL Server does.
+        """
+        name = column_name.lower()
+        if self.include_columns is not None and name not in [c.lower() for c in self.include_columns]:
+            return False
+        return name not in [c.lower() for c in self.exclude_columns]
+
+    def check_projection(self, tbl_schema: str, tbl_name: str, columns: List[Column]):
+        """
+        Fail on include_columns and exclude_columns that are not columns of the table, rather than silently reading
+        more or fewer columns than configured.
+        """
+        names = {c.name.lower() for c in columns}
+        unknown = [
+            c for c in (self.include_columns or []) + self.exclude_columns if c.lower() not in names
+        ]
+        if unknown:
+            raise ValueError(
+                f"Columns {', '.join(unknown)} in include_columns or exclude_columns do not exist in "
+                f"{tbl_schema}.{tbl_name}"
+            )
+
+    def select_expressions(self, columns_type: List[Column]) -> List[str]:
+        """
+        The select list of columns, with computed columns as expression AS name.
+        """
+        return [
+            f"{c.expression} AS {c.name}" if c.expression else c.name
+            for c in columns_type
+        ]
+
+    def get_partitioning(self, tbl_schema: str, tbl_name: str) -> Optional[dict]:
+        """
+        Get the partition function and column of a partitioned table, from the heap or clustered index.
+
+        :param tbl_schema: schema where the table resides.
+        :param tbl_name: name of the table
+        :return: a dict with partition_function, partition_column and partition boundaries, None if not partitioned.
+        """
+        sql = (
+            "SELECT pf.name AS function_name, c.name AS column_name, pf.boundary_value_on_right AS on_right "
+            "FROM sys.indexes AS i "
+            "JOIN sys.partition_schemes AS ps ON ps.data_space_id = i.data_space_id "
+            "JOIN sys.partition_functions AS pf ON pf.function_id = ps.function_id "
+            "JOIN sys.index_columns AS ic ON ic.object_id = i.object_id AND ic.index_id = i.index_id "
+            "AND ic.partition_ordinal = 1 "
+            "JOIN sys.columns AS c ON c.object_id = ic.object_id AND c.column_id = ic.column_id "
+            "WHERE i.object_id = OBJECT_ID(?) AND i.index_id IN (0, 1)"
+        )
+        with self.connect() as connection:
+            partitioning = connection.execute(sql, f"{tbl_schema}.{tbl_name}").first()
+            if partitioning is None:
+                return None
+            boundary_res = connection.execute(
+                "SELECT prv.boundary_id, prv.value FROM sys.partition_range_values AS prv "
+                "JOIN sys.partition_functions AS pf ON pf.function_id = prv.function_id "
+                "WHERE pf.name = ? ORDER BY prv.boundary_id",
+                partitioning["function_name"],
+            )
+            boundaries = {row["boundary_id"]: row["value"] for row in boundary_res}
+        return {
+            "partition_function": partitioning["function_name"],
+            "partition_column": partitioning["column_name"],
+            "on_right": bool(partitioning["on_right"]),
+            "boundaries": boundaries,
+        }
+
+    def partition_range(self, partitioning: dict, partition: int) -> str:
+        """
+        The range of values in a partition, as a string.  Part of the split crc, since partition numbers shift when
+        partitions are split or merged.
+        """
+        boundaries = partitioning["boundaries"]
+        # RANGE RIGHT: partition k holds [boundary k-1, boundary k).  RANGE LEFT: (boundary k-1, boundary k].
+        low = boundaries.get(partition - 1, "")
+        high = boundaries.get(partition, "")
+        if partitioning["on_right"]:
+            return f"[{low}, {high})"
+        return f"({low}, {high}]"
+
+    def get_partition_stats(self, tbl_schema: str, tbl_name: str) -> Optional[dict]:
+        """
+        Rows and pages per partition from sys.dm_db_partition_stats, without reading the table.
+
+        :return: a dict of partition number -> dict of rows and pages, or None if we do not have access.
+        """
+        sql = (
+            "SELECT partition_number, SUM(row_count) AS rows, SUM(used_page_count) AS pages "
+            "FROM sys.dm_db_partition_stats WHERE object_id = OBJECT_ID(?) AND index_id IN (0, 1) "
+            "GROUP BY partition_number"
+        )
+        try:
+            with self.connect() as connection:
+                res = connection.execute(sql, f"{tbl_schema}.{tbl_name}")
+                return {
+                    row["partition_number"]: {"rows": row["rows"], "pages": row["pages"]}
+                    for row in res
+                }
+        except Exception as e:
+            logger.warning(
+                f"Unable to read sys.dm_db_partition_stats for {tbl_schema}.{tbl_name} (needs VIEW DATABASE STATE): {e}"
+            )
+            return None
+
     def _generate_view_sql(
-            self, table: str, schema: str, columns: list, split_keys: list, split_size: int
+            self,
+            table: str,
+            schema: str,
+            columns: list,
+            split_keys: list,
+            split_size: int,
+            with_row_number: bool = False,
+            buckets: int = 0,
+            partitioning: Optional[dict] = None,
+            partition: Optional[int] = None,
     ):
-        if split_size > 0:
-            sql_view = f"WITH splits AS (SELECT (ROW_NUMBER() OVER(ORDER BY {','.join(split_keys)})) / {split_size} + 1 as internal_split,{','.join(columns)} from {schema}.{table})"
+        """
+        :param with_row_number: also expose the row number as internal_row, so a split can be read in ranges.  Not
+                                used when generating splits, since it would change the CHECKSUM(*) of the split.
+        :param buckets: if > 0, split into this many hash buckets instead of by row number.
+        :param partitioning: if set, split by table partition, see get_partitioning.
+        :param partition: only read this partition, so SQL Server can do partition elimination.
+        """
+        if partitioning:
+            partition_exp = f"$PARTITION.{partitioning['partition_function']}({partitioning['partition_column']})"
+            internal_split = f"{partition_exp} * {self.PARTITION_SPLIT_FACTOR}"
+            if split_size > 0:
+                internal_split += f" + ROW_NUMBER() OVER(PARTITION BY {partition_exp} ORDER BY {','.join(split_keys)}) / {split_size}"
+            where = f" WHERE {partition_exp} = {int(partition)}" if partition else ""
+            sql_view = f"WITH splits AS (SELECT {internal_split} as internal_split,{','.join(columns)} from {schema}.{table}{where})"
+        elif buckets > 0:
+            # modulo before ABS, ABS(CHECKSUM(..)) overflows for the lowest int.
+            sql_view = f"WITH splits AS (SELECT ABS(CHECKSUM({','.join(split_keys)}) % {buckets}) + 1 as internal_split,{','.join(columns)} from {schema}.{table})"
+        elif split_size > 0:
+            row_number = f"ROW_NUMBER() OVER(ORDER BY {','.join(split_keys)})"
+            internal_row = f"{row_number} as internal_row," if with_row_number else ""
+            sql_view = f"WITH splits AS (SELECT {internal_row}({row_number}) / {split_size} + 1 as internal_split,{','.join(columns)} from {schema}.{table})"
         else:
             sql_view = f"WITH splits AS (SELECT 1 AS internal_split,{','.join(columns)} from {schema}.{table})"
         return sql_view
 
-    # TODO: maybe tmp table to lock records.
-    def generate_splits(
+    def generate_splits_sql(
             self,
             table: str,
             static_source: bool,
@@ -246,18 +1104,20 @@ class SqlServerToCsv(DatabaseToCsv):
             columns_type: List[Column],
             split_keys: list,
             split_size: int,
-    ) -> dict:
+            buckets: int = 0,
+            partitioning: Optional[dict] = None,
+    ) -> str:
         """
-        Split table into chunks.
-        Generate a split for empty sources as well.
+        The query that aggregates the table into splits, with a count and crc per split.
         """
-        splits = {}
         sql_view = self._generate_view_sql(
             table=table,
             schema=schema,
-            columns=[c.name for c in columns_type],
+            columns=self.select_expressions(columns_type),
             split_keys=split_keys,
             split_size=split_size,
+            buckets=buckets,
+            partitioning=partitioning,
         )
         minmax_keys = [c for c in split_keys]
         if self.extra_crc_fields:
@@ -272,26 +1132,82 @@ class SqlServerToCsv(DatabaseToCsv):
         checksum_exp = f"CHECKSUM_AGG(CHECKSUM(*)) as crc "
         if static_source:
             checksum_exp = "'STATIC' as crc "
+        elif self.single_scan:
+            # Only keys and counts, so SQL Server can use the narrowest index.  A rowversion column changes on every
+            # update, so its max catches updates that keep the count and keys of the split.
+            for c in columns_type:
+                if c.data_type in self.ROWVERSION_TYPES:
+                    sql_minmax += f"MAX({c.name}) as {c.name}_max,"
+            checksum_exp = f"'{self.CRC_SINGLE_SCAN}' as crc "
+        sql_buckets = f"{buckets} AS buckets," if buckets > 0 else ""
         sql = (
             f"select {split_size} AS split_size,"
+            f"{sql_buckets}"
             f"internal_split, "
             f"count(*) as cnt,"
             f"{sql_minmax}"
             f"{checksum_exp}"
             f"from splits group by internal_split"
         )
+        return f"{sql_view} {sql}"
+
+    def internal_columns(self, columns_type: List[Column]) -> str:
+        """
+        The columns of a split as stored in its crc.  Includes how each column is mapped to BigQuery, so changing a
+        type override reads the splits again instead of loading content encoded for the old type.
+        """
+        return " | ".join([self.type_mapping.describe(c) for c in columns_type])
+
+    # TODO: maybe tmp table to lock records.
+    def generate_splits(
+            self,
+            table: str,
+            static_source: bool,
+            schema: str,
+            columns_type: List[Column],
+            split_keys: list,
+            split_size: int,
+            buckets: int = 0,
+            partitioning: Optional[dict] = None,
+    ) -> dict:
+        """
+        Split table into chunks.
+        Generate a split for empty sources as well.
 
-        sql_from_view = f"{sql_view} {sql}"
+        :param buckets: if > 0, split into this many hash buckets instead of by row number.
+        :param partitioning: if set, split by table partition, see get_partitioning.
+        """
+        splits = {}
+        partition_stats = None
+        if partitioning and split_size <= 0:
+            # One split per partition, rows and pages of the partition are part of the crc.
+            partition_stats = self.get_partition_stats(schema, table)
+            if static_source and partition_stats is not None:
+                return self._generate_partition_stats_splits(
+                    table, schema, columns_type, split_size, partitioning, partition_stats
+                )
+        sql_from_view = self.generate_splits_sql(
+            table=table,
+            static_source=static_source,
+            schema=schema,
+            columns_type=columns_type,
+            split_keys=split_keys,
+            split_size=split_size,
+            buckets=buckets,
+            partitioning=partitioning,
+        )
         logger.info(f"GENERATED SPLIT SQL: {sql_from_view}")
-        with self.connect() as connection:
+        with self.read_replica(planning=True) as replica, self.query_connection(replica) as connection:
             split_res = connection.execute(sql_from_view)
             cnt = 0
             for split in split_res:
                 cnt += 1
                 split_dict = dict(split)
-                split_dict["internal_columns"] = " | ".join(
-                    [f"{c}" for c in columns_type]
-                )
+                split_dict["internal_columns"] = self.internal_columns(columns_type)
+                if partitioning:
+                    self._add_partition_to_split(
+                        split_dict, partitioning, partition_stats
+                    )
                 splits[split["internal_split"]] = split_dict
                 logger.info(
                     f"Split with id {split['internal_split']} has crc = {split_dict}"
@@ -301,28 +1217,95 @@ class SqlServerToCsv(DatabaseToCsv):
                     f"Source table {schema}.{table} is EMPTY. generating an empty split"
                 )
                 splits[1] = {"split_size": split_size, "internal_split": 1, "cnt": 0}
+                if buckets > 0:
+                    splits[1]["buckets"] = buckets
+                if partitioning:
+                    splits[1]["partition_function"] = partitioning["partition_function"]
+                    splits[1]["partition_column"] = partitioning["partition_column"]
+        return splits
+
+    def _add_partition_to_split(
+            self, split: dict, partitioning: dict, partition_stats: Optional[dict]
+    ):
+        partition = split["internal_split"] // self.PARTITION_SPLIT_FACTOR
+        split["partition_function"] = partitioning["partition_function"]
+        split["partition_column"] = partitioning["partition_column"]
+        split["partition"] = partition
+        split["partition_range"] = self.partition_range(partitioning, partition)
+        if partition_stats is not None:
+            stats = partition_stats.get(partition, {"rows": 0, "pages": 0})
+            split["partition_rows"] = stats["rows"]
+            split["partition_pages"] = stats["pages"]
+
+    def _generate_partition_stats_splits(
+            self,
+            table: str,
+            schema: str,
+            columns_type: List[Column],
+            split_size: int,
+            partitioning: dict,
+            partition_stats: dict,
+    ) -> dict:
+        """
+        Generate one split per non empty partition from sys.dm_db_partition_stats, without reading the table.
+        Used for static sources, where the rows and pages of a partition is a good enough crc.
+        """
+        splits = {}
+        for partition, stats in sorted(partition_stats.items()):
+            if stats["rows"] == 0:
+                continue
+            split_id = partition * self.PARTITION_SPLIT_FACTOR
+            split = {
+                "split_size": split_size,
+                "internal_split": split_id,
+                "cnt": stats["rows"],
+                "crc": "STATIC",
+                "internal_columns": self.internal_columns(columns_type),
+            }
+            self._add_partition_to_split(split, partitioning, partition_stats)
+            splits[split_id] = split
+            logger.info(f"Split with id {split_id} has crc = {split}")
+        if not splits:
+            logger.warning(
+                f"Source table {schema}.{table} is EMPTY. generating an empty split"
+            )
+            splits[1] = {
+                "split_size": split_size,
+                "internal_split": 1,
+                "cnt": 0,
+                "partition_function": partitioning["partition_function"],
+                "partition_column": partitioning["partition_column"],
+            }
         return splits
 
     def destination_result_exists(self, split: dict, destination_file: str) -> bool:
         split_id = split["internal_split"]
         split_size = split["split_size"]
-        split_data = json.dumps(split, default=str).encode()
+        split_data = json.dumps(split, default=str)
         crc_location = self.crc_location(
-            self.base_destination(destination_file, split_size), split_id
+            self.split_destination(destination_file, split), split_id
         )
         content_location = self.content_location(
-            self.base_destination(destination_file, split_size), split_id
+            self.split_destination(destination_file, split), split_id
         )
+        import smart_open
+
         try:
             with smart_open.open(f"{crc_location}", encoding="utf-8") as crc:
                 existing_content = crc.read()
-                if existing_content == split_data.decode():
+                existing_split = json.loads(existing_content)
+                # crc files written before content files were tracked only have the one content file.
+                content_files = existing_split.pop(
+                    self.CRC_CONTENT_FILES, [content_location]
+                )
+                if existing_split == json.loads(split_data):
                     logger.info(
                         f"{destination_file}: A resultset exists at destination, and CRC is matching, verifying csv."
                     )
-                    # This will throw if file not exists.
-                    with smart_open.open(content_location, encoding="utf-8") as tmp:
-                        logger.info(f"{destination_file}: Content file is present.")
+                    for content_file in content_files:
+                        # This will throw if file not exists.
+                        with smart_open.open(content_file, encoding="utf-8") as tmp:
+                            logger.info(f"{destination_file}: Content file {content_file} is present.")
                     return True
                 else:
                     logger.info(
@@ -330,13 +1313,19 @@ class SqlServerToCsv(DatabaseToCsv):
                     )
                     logger.info(f"{existing_content}")
                     logger.info(f" != ")
-                    logger.info(f"{split_data.decode()}")
+                    logger.info(f"{split_data}")
 
         except Exception:
             pass
         return False
 
-    def base_destination(self, destination_file: str, split_size: int) -> str:
+    def base_destination(
+            self,
+            destination_file: str,
+            split_size: int,
+            buckets: int = 0,
+            partitioned: bool = False,
+    ) -> str:
         """
         base destination is destination/destination_file/split/destination_file*
 
@@ -345,82 +1334,447 @@ class SqlServerToCsv(DatabaseToCsv):
 
         :param split_size: The split size we are using.
         :param destination_file: the folder where to place the data.
+        :param buckets: The number of hash buckets, if splitting by hash.
+        :param partitioned: If splits are aligned to the table partitions.
         :return: a string representing the base destination.
         """
         split_folder = f"{split_size}/" if split_size > 0 else ""
+        if buckets > 0:
+            split_folder = f"hash{buckets}/"
+        elif partitioned:
+            split_folder = f"partition{split_size if split_size > 0 else ''}/"
         return f"{self.destination}/{destination_file}/{split_folder}{destination_file}"
 
+    def split_destination(self, destination_file: str, split: dict) -> str:
+        """
+        base_destination of the split, see base_destination.
+        """
+        return self.base_destination(
+            destination_file,
+            split["split_size"],
+            buckets=split.get("buckets", 0),
+            partitioned="partition_function" in split,
+        )
+
     def content_location(self, base_destination: str, split_id: int) -> str:
         return f"{base_destination}-{self.CSV_CONTENT_POSTFIX}-{split_id}.csv"
 
     def crc_location(self, base_destination: str, split_id: int) -> str:
         return f"{base_destination}-{split_id}.crc"
 
-    def write_split_to_destination(
-            self,
+    def list_destination(self, prefix: str) -> List[str]:
+        """
+        List files at the destination starting with prefix.
+        """
+        if prefix.startswith("gs://"):
+            from google.cloud import storage
+
+            bucket_name, blob_prefix = prefix[len("gs://"):].split("/", 1)
+            return [
+                f"gs://{bucket_name}/{blob.name}"
+                for blob in storage.Client().list_blobs(bucket_name, prefix=blob_prefix)
+            ]
+        import glob
+
+        # Like listing GCS by prefix, this includes files in sub folders of a prefix ending in /.
+        return [
+            location
+            for location in glob.glob(f"{glob.escape(prefix)}**", recursive=True)
+            if os.path.isfile(location)
+        ]
+
+    def remove_orphaned_files(self, base_location: str, split_results: List[SplitResult]):
+        """
+        Remove content and crc files in base_location that do not belong to any of the splits.  These are left behind
+        when the number of splits goes down, and would otherwise be picked up by the load wildcard.
+        """
+        keep = set()
+        for split_result in split_results:
+            keep.update(split_result.content_files)
+            keep.add(split_result.crc_file)
+        content_prefix = f"{base_location}-{self.CSV_CONTENT_POSTFIX}-"
+        for location in self.list_destination(f"{base_location}-"):
+            if location in keep:
+                continue
+            if location.startswith(content_prefix) or location.endswith(".crc"):
+                self.remove_destination(location)
+
+    def remove_destination(self, location: str):
+        """
+        Remove a file at the destination.  Failing to remove is logged, not raised.
+        """
+        try:
+            if location.startswith("gs://"):
+                from google.cloud import storage
+
+                bucket_name, blob_name = location[len("gs://"):].split("/", 1)
+                storage.Client().bucket(bucket_name).blob(blob_name).delete()
+            else:
+                os.remove(location)
+            logger.info(f"Removed stale file {location}")
+        except Exception as e:
+            logger.warning(f"Unable to remove stale file {location}: {e}")
+
+    def crc_content_files(self, crc_location: str, default: List[str]) -> List[str]:
+        """
+        The content files listed in an existing crc, or default if the crc does not list them or does not exist.
+        """
+        import smart_open
+
+        try:
+            with smart_open.open(crc_location, encoding="utf-8") as crc:
+                return json.loads(crc.read()).get(self.CRC_CONTENT_FILES, default)
+        except Exception:
+            return default
+
+    def when_uploaded(self, locations: List[str], fn: Callable[[], None]):
+        """
+        Call fn once the content files at locations are at the destination.  Right away, unless they are spooled.
+        """
+        if self.spool:
+            self.spool.after(locations, fn)
+        else:
+            fn()
+
+    def write_split_crc(
+            self,
+            split: dict,
+            destination_folder: str,
+            content_files: List[str],
+    ):
+        """
+        Write the crc of a split, together with the content files that holds the data of the split.
+        Content files listed in the previous crc that are no longer part of the split are removed, since the load
+        picks up every content file by wildcard.
+
+        :param split: The split
+        :param destination_folder: The destination folder.
+        :param content_files: All content files written for the split.
+        """
+        import smart_open
+
+        crc_location = self.crc_location(
+            self.split_destination(destination_folder, split),
+            split["internal_split"],
+        )
+        previous_files = self.crc_content_files(crc_location, default=[])
+        with smart_open.open(crc_location, "w", encoding="utf-8") as split_crc:
+            logger.info(
+                f"{destination_folder}: Writing CRC to destination {crc_location}"
+            )
+            crc = dict(split, **{self.CRC_CONTENT_FILES: content_files})
+            split_data = json.dumps(crc, default=str)
+            logger.info(f"{destination_folder}: crc payload = {split_data}")
+            split_crc.write(split_data)
+        for previous_file in previous_files:
+            if previous_file not in content_files:
+                self.remove_destination(previous_file)
+
+    def split_query_sql(
+            self,
+            split: dict,
+            table: str,
+            schema: str,
+            columns_type: List[Column],
+            split_keys: list,
+            progress: Optional[SplitProgress] = None,
+    ) -> Tuple[str, list]:
+        """
+        The query that reads the rows of a split, or of the row range in progress.
+
+        :return: a tuple of the sql and its parameters.
+        """
+        columns = [c.name for c in columns_type]
+        partitioning = None
+        if "partition_function" in split:
+            partitioning = {
+                "partition_function": split["partition_function"],
+                "partition_column": split["partition_column"],
+            }
+        sql = f"select {','.join(columns)} from splits where internal_split=?"
+        params = [split["internal_split"]]
+        if progress:
+            sql += " and internal_row >= ?"
+            params.append(progress.row_from)
+            if not progress.open_end:
+                sql += " and internal_row < ?"
+                params.append(progress.row_to)
+            sql += " order by internal_row"
+        sql_view = self._generate_view_sql(
+            table=table,
+            schema=schema,
+            columns=self.select_expressions(columns_type),
+            split_keys=split_keys,
+            split_size=split["split_size"],
+            with_row_number=progress is not None,
+            buckets=split.get("buckets", 0),
+            partitioning=partitioning,
+            partition=split.get("partition"),
+        )
+        return f"{sql_view} {sql}", params
+
+    def write_split_to_destination(
+            self,
             split: dict,
             destination_folder: str,
             table: str,
             schema: str,
             columns_type: List[Column],
             split_keys: list,
-    ) -> int:
+            concurrency: Optional[AdaptiveConcurrency] = None,
+            progress: Optional[SplitProgress] = None,
+            primary: bool = False,
+    ) -> Tuple[int, float, int, List[str]]:
+        """
+        Read the split from the database and write it to the destination, followed by the crc.
+
+        The rows are written to content files of at most content_file_max_bytes/content_file_max_rows, named
+        -content-{split}.csv, -content-{split}-1.csv, and so on.
+
+        If progress is given only the row range of progress is read, into content files named by progress.part_id.
+        The range can be cut while reading.  The crc is then not written, since other parts of the split might still
+        be running, and it is up to the caller to write it.
+
+        A split read from a read replica that fails, connecting or while reading, takes the replica out of rotation
+        and is read again from the primary.
+
+        :param primary: read from the primary, not a read replica.
+        :return: a tuple with number of rows written, seconds until the first row was received, milliseconds
+                 spent waiting on locks (-1 if unknown) and the content files written.
+        """
         split_id = split["internal_split"]
-        split_size = split["split_size"]
         expected_rows = split["cnt"] if split["cnt"] > 0 else 1
         columns = [c.name for c in columns_type]
-        location = self.base_destination(destination_folder, split_size)
-        content_location = self.content_location(location, split_id)
-        crc_location = self.crc_location(location, split_id)
-
-        with smart_open.open(
-                content_location, "w", encoding="utf-8", newline=""
-        ) as split_destination:
-            cnt = 0
-            logger.info(f"Going to write {expected_rows} rows to {content_location}")
-            writer = csv.DictWriter(
-                split_destination, fieldnames=columns, quotechar='"'
-            )
-            writer.writeheader()
-            sql_view = self._generate_view_sql(
+        location = self.split_destination(destination_folder, split)
+        content_id = split_id
+        sql_from_view, params = self.split_query_sql(
+            split=split,
+            table=table,
+            schema=schema,
+            columns_type=columns_type,
+            split_keys=split_keys,
+            progress=progress,
+        )
+        if progress:
+            content_id = progress.part_id
+            expected_rows = max(progress.row_to - progress.row_from, 1)
+            progress.start()
+
+        header = io.StringIO()
+        csv.DictWriter(header, fieldnames=columns, quotechar='"').writeheader()
+        content_files = RollingContentFile(
+            location=lambda part: self.content_location(
+                location, f"{content_id}-{part}" if part > 0 else content_id
+            ),
+            header=header.getvalue(),
+            max_bytes=self.content_file_max_bytes,
+            max_rows=self.content_file_max_rows,
+            spool=self.spool,
+        )
+        replica = None
+        try:
+            with content_files:
+                split_destination = content_files
+                cnt = 0
+                logger.info(f"Going to write {expected_rows} rows to {content_files.locations[0]}")
+                writer = csv.DictWriter(
+                    split_destination, fieldnames=columns, quotechar='"'
+                )
+                logger.debug(f"{destination_folder}: GENERATED SQL: {sql_from_view}")
+                with contextlib.nullcontext() if primary else self.read_replica() as replica:
+                    query_start = time()
+                    if self.fetch_engine_for(columns_type) == self.FETCH_ENGINE_ARROW:
+                        cnt, first_row_elapsed = self.write_arrow_split(
+                            sql=sql_from_view,
+                            params=params,
+                            columns_type=columns_type,
+                            destination=content_files,
+                            table=table,
+                            split_id=split_id,
+                            expected_rows=expected_rows,
+                            concurrency=concurrency,
+                            progress=progress,
+                            replica=replica,
+                        )
+                        # The query runs on a connection of arrow-odbc, not one we can read the wait stats of.
+                        lock_wait = -1
+                    else:
+                        with self.query_connection(replica, primary_fallback=False) as connection:
+                            lock_wait_start = self.session_lock_wait_ms(connection)
+                            split_res = connection.execute(sql_from_view, tuple(params))
+                            encoders = self.type_mapping.encoders(columns_type)
+                            chunked = self.type_mapping.chunked_encoders(columns_type)
+                            print_msg = 10  # percent
+
+                            # Processing of split 23 took 0:03:21.707622 size=1000
+                            # Processing of split 23 took 0:03:30.559677 size=100
+                            if True:
+                                batch_size = self.fetch_batch_size(columns_type)
+                                split_rows = split_res.fetchmany(size=batch_size)
+                                first_row_elapsed = time() - query_start
+                                while split_rows:
+                                    cut = False
+                                    if progress:
+                                        take = progress.advance(len(split_rows))
+                                        cut = take < len(split_rows)
+                                        split_rows = split_rows[:take]
+                                    if concurrency:
+                                        concurrency.throttle(len(split_rows))
+                                    for split_row in split_rows:
+                                        if chunked and has_large_value(split_row, chunked, self.lob_chunk_size):
+                                            split_destination.write_row(
+                                                csv_row_pieces(
+                                                    split_row, columns, encoders, chunked, self.lob_chunk_size
+                                                )
+                                            )
+                                        else:
+                                            writer.writerow(self.row_to_bq(split_row, encoders))
+                                        cnt += 1
+                                        if cnt / expected_rows * 100 >= print_msg:
+                                            logger.info(
+                                                f"{table} {cnt} / {expected_rows} [{print_msg}%]"
+                                            )
+                                            print_msg += 10
+                                    if cut:
+                                        logger.info(
+                                            f"{table}: split {split_id} was cut at row {progress.row_to}, "
+                                            f"rest is read by others"
+                                        )
+                                        split_res.close()
+                                        break
+                                    split_rows = split_res.fetchmany(size=batch_size)
+                            lock_wait = -1
+                            if lock_wait_start is not None:
+                                lock_wait_end = self.session_lock_wait_ms(connection)
+                                if lock_wait_end is not None:
+                                    lock_wait = lock_wait_end - lock_wait_start
+                    if replica:
+                        self.replicas.record(replica, rows=cnt, elapsed=time() - query_start)
+        except Exception as e:
+            if replica is None:
+                raise
+            self.replicas.fail(replica, f"{e}")
+            logger.warning(f"{table}: Reading split {split_id} from the primary, read replica {replica.host} failed")
+            if progress:
+                progress.restart()
+            return self.write_split_to_destination(
+                split=split,
+                destination_folder=destination_folder,
                 table=table,
                 schema=schema,
-                columns=columns,
+                columns_type=columns_type,
                 split_keys=split_keys,
-                split_size=split_size,
+                concurrency=concurrency,
+                progress=progress,
+                primary=True,
             )
-            sql = f"select {','.join(columns)} from splits where internal_split=?"
+        if progress is None:
+            self.when_uploaded(
+                content_files.locations,
+                lambda: self.write_split_crc(
+                    split=split,
+                    destination_folder=destination_folder,
+                    content_files=content_files.locations,
+                ),
+            )
+        return cnt, first_row_elapsed, lock_wait, content_files.locations
 
-            sql_from_view = f"{sql_view} {sql}"
-            logger.debug(f"{destination_folder}: GENERATED SQL: {sql_from_view}")
-            with self.connect() as connection:
-                split_res = connection.execute(sql_from_view, split_id)
-                mssql_datatypes = {c.name: c.data_type for c in columns_type}
-                print_msg = 10  # percent
-
-                # Processing of split 23 took 0:03:21.707622 size=1000
-                # Processing of split 23 took 0:03:30.559677 size=100
-                if True:
-                    batch_size = 500
-                    split_rows = split_res.fetchmany(size=batch_size)
-                    while split_rows:
-                        for split_row in split_rows:
-                            writer.writerow(self.row_to_bq(split_row, mssql_datatypes))
-                            cnt += 1
-                            if cnt / expected_rows * 100 >= print_msg:
-                                logger.info(
-                                    f"{table} {cnt} / {expected_rows} [{print_msg}%]"
-                                )
-                                print_msg += 10
-                        split_rows = split_res.fetchmany(size=batch_size)
-        with smart_open.open(crc_location, "w", encoding="utf-8") as split_crc:
-            logger.info(
-                f"{destination_folder}: Writing CRC to destination {crc_location}"
+    def write_arrow_split(
+            self,
+            sql: str,
+            params: list,
+            columns_type: List[Column],
+            destination: RollingContentFile,
+            table: str,
+            split_id: int,
+            expected_rows: int,
+            concurrency: Optional[AdaptiveConcurrency] = None,
+            progress: Optional[SplitProgress] = None,
+            replica: Optional[Replica] = None,
+    ) -> Tuple[int, float]:
+        """
+        The fetch loop of write_split_to_destination for the arrow engine.  Fetches record batches, encodes them a
+        column at a time and writes each batch to destination as one block of csv.  Reads from replica if given.
+
+        :return: a tuple with number of rows written and seconds until the first batch was received.
+        """
+        if self.isolation_level:
+            sql = f"SET TRANSACTION ISOLATION LEVEL {self.SQLALCHEMY_ISOLATION_LEVELS[self.isolation_level]}; {sql}"
+        query_start = time()
+        batches = arrow_fetch.read_batches(
+            connection_string=self.odbc_connection_string(replica),
+            username=self.username,
+            password=self.password,
+            sql=sql,
+            params=params,
+            batch_size=self.ARROW_BATCH_SIZE,
+        )
+        first_row_elapsed = -1
+        cnt = 0
+        print_msg = 10  # percent
+        for batch in batches:
+            if first_row_elapsed < 0:
+                first_row_elapsed = time() - query_start
+            cut = False
+            if progress:
+                take = progress.advance(batch.num_rows)
+                cut = take < batch.num_rows
+                batch = batch.slice(0, take)
+            if concurrency:
+                concurrency.throttle(batch.num_rows)
+            encoded = arrow_fetch.encode_batch(batch, columns_type, self.type_mapping)
+            destination.write_rows(arrow_fetch.batch_to_csv(encoded), batch.num_rows)
+            cnt += batch.num_rows
+            if cnt / expected_rows * 100 >= print_msg:
+                logger.info(f"{table} {cnt} / {expected_rows} [{print_msg}%]")
+                print_msg = (int(cnt / expected_rows * 10) + 1) * 10
+            if cut:
+                logger.info(
+                    f"{table}: split {split_id} was cut at row {progress.row_to}, rest is read by others"
+                )
+                break
+        if first_row_elapsed < 0:
+            first_row_elapsed = time() - query_start
+        return cnt, first_row_elapsed
+
+    def _read_split(
+            self,
+            split: dict,
+            columns_type: List[Column],
+            primary_keys: List[str],
+            table: str,
+            schema: str,
+            destination_folder: str,
+            concurrency: Optional[AdaptiveConcurrency] = None,
+            progress: Optional[SplitProgress] = None,
+    ) -> Tuple[int, float, int, List[str]]:
+        """
+        write_split_to_destination, within the limits of the concurrency controller.
+        """
+        if concurrency:
+            concurrency.acquire()
+        try:
+            query_start = time()
+            rows, first_row_elapsed, lock_wait, content_files = self.write_split_to_destination(
+                split=split,
+                destination_folder=destination_folder,
+                table=table,
+                schema=schema,
+                columns_type=columns_type,
+                split_keys=primary_keys,
+                concurrency=concurrency,
+                progress=progress,
             )
-            split_data = json.dumps(split, default=str)
-            logger.info(f"{destination_folder}: crc payload = {split_data}")
-            split_crc.write(split_data)
-        return cnt
+            if concurrency:
+                concurrency.on_split_done(
+                    rows=rows,
+                    elapsed=time() - query_start,
+                    first_row_elapsed=first_row_elapsed,
+                )
+        finally:
+            if concurrency:
+                concurrency.release()
+        return rows, first_row_elapsed, lock_wait, content_files
 
     def process_split(
             self,
@@ -430,6 +1784,9 @@ class SqlServerToCsv(DatabaseToCsv):
             table: str,
             schema: str,
             destination_folder: str,
+            concurrency: Optional[AdaptiveConcurrency] = None,
+            progress: Optional[SplitProgress] = None,
+            cache_checked: bool = False,
     ) -> SplitResult:
         """
         Process the split as specified by split.  in theory, the split can come from another process or machine to
@@ -441,33 +1798,29 @@ class SqlServerToCsv(DatabaseToCsv):
         :param table: The table to process
         :param schema: The schema where the table exists.
         :param destination_folder: The destination folder to put this.
+        :param concurrency: Optional controller that limits concurrent queries and rows/s, and learns from the split.
+        :param progress: Optional progress of the split, see write_split_to_destination.
+        :param cache_checked: The split was already looked up at the destination and is not there, read it.
         :return:
         """
         split_id = split["internal_split"]
-        split_size = split["split_size"]
-        cache_hit = False
-        rows = -1
-        base_destination = self.base_destination(
-            destination_file=destination_folder, split_size=split_size
-        )
+        base_destination = self.split_destination(destination_folder, split)
         logger.info(f"{destination_folder}: Processing split {split_id}")
         start = time()
-        if self.destination_result_exists(
-                split=split, destination_file=destination_folder
-        ):
-            logger.info(
-                f"{destination_folder}: Nothing to do here, file already exists with correct crc."
-            )
-            cache_hit = True
-        else:
-            rows = self.write_split_to_destination(
-                split=split,
-                destination_folder=destination_folder,
-                table=table,
-                schema=schema,
-                columns_type=columns_type,
-                split_keys=primary_keys,
-            )
+        if not cache_checked:
+            cached = self.cached_split_result(split, destination_folder)
+            if cached:
+                return cached
+        rows, first_row_elapsed, lock_wait, content_files = self._read_split(
+            split=split,
+            columns_type=columns_type,
+            primary_keys=primary_keys,
+            table=table,
+            schema=schema,
+            destination_folder=destination_folder,
+            concurrency=concurrency,
+            progress=progress,
+        )
         end = time()
         elapsed = end - start
 
@@ -479,8 +1832,779 @@ class SqlServerToCsv(DatabaseToCsv):
             content_file=self.content_location(base_destination, split_id),
             crc_file=self.crc_location(base_destination, split_id),
             elapsed=elapsed,
-            cache_hit=cache_hit,
+            cache_hit=False,
             row_count=rows,
+            first_row_elapsed=first_row_elapsed,
+            content_files=content_files,
+            lock_wait=lock_wait,
+            split_id=split_id,
+        )
+
+    def cached_split_result(self, split: dict, destination_folder: str) -> Optional[SplitResult]:
+        """
+        The result of a split that is already at the destination with a matching crc, None if it has to be read.
+        """
+        split_id = split["internal_split"]
+        base_destination = self.split_destination(destination_folder, split)
+        start = time()
+        if not self.destination_result_exists(
+                split=split, destination_file=destination_folder
+        ):
+            return None
+        logger.info(
+            f"{destination_folder}: Nothing to do here, file already exists with correct crc."
+        )
+        return SplitResult(
+            content_file=self.content_location(base_destination, split_id),
+            crc_file=self.crc_location(base_destination, split_id),
+            elapsed=time() - start,
+            cache_hit=True,
+            row_count=-1,
+            content_files=self.crc_content_files(
+                self.crc_location(base_destination, split_id), default=None
+            ),
+            split_id=split_id,
+        )
+
+    def copy_destination(self, source: str, target: str):
+        """
+        Copy a file at the destination.  On GCS the copy is done by GCS, without downloading the file.
+        """
+        if source.startswith("gs://"):
+            from google.cloud import storage
+
+            client = storage.Client()
+            source_bucket, source_name = source[len("gs://"):].split("/", 1)
+            target_bucket, target_name = target[len("gs://"):].split("/", 1)
+            source_blob = client.bucket(source_bucket).blob(source_name)
+            target_blob = client.bucket(target_bucket).blob(target_name)
+            # Large files are copied in several calls.
+            token, _, _ = target_blob.rewrite(source_blob)
+            while token is not None:
+                token, _, _ = target_blob.rewrite(source_blob, token=token)
+        else:
+            import shutil
+
+            shutil.copyfile(source, target)
+        logger.info(f"Copied {source} to {target}")
+
+    def is_range_split(self, split: dict, primary_keys: List[str]) -> bool:
+        """
+        If the split holds every row in a range of a single key, so it is defined by the min, max and count of the
+        key, whatever the split size.  Hash bucket and partition splits are not ranges, and with composite keys the
+        min and max of each column do not pin down the range.
+        """
+        return len(primary_keys) == 1 and "buckets" not in split and "partition_function" not in split
+
+    def split_identity(self, split: dict) -> dict:
+        """
+        The split as stored in its crc, without what depends on the split size.  Splits with the same identity have
+        the same rows.
+        """
+        identity = json.loads(json.dumps(split, default=str))
+        identity.pop("split_size", None)
+        identity.pop("internal_split", None)
+        identity.pop(self.CRC_CONTENT_FILES, None)
+        return identity
+
+    def reuse_index(self, destination_folder: str, base_location: str) -> dict:
+        """
+        The crc of every split under destination_folder with another split size than base_location, by base
+        destination and then split id.  Each is a dict with the split identity and content files.
+        """
+        import smart_open
+
+        index = {}
+        for location in self.list_destination(f"{self.destination}/{destination_folder}/"):
+            if not location.endswith(".crc") or location.startswith(f"{base_location}-"):
+                continue
+            try:
+                with smart_open.open(location, encoding="utf-8") as crc:
+                    stored = json.loads(crc.read())
+            except Exception as e:
+                logger.warning(f"Unable to read {location}, not reusing it: {e}")
+                continue
+            split_id = stored.get("internal_split")
+            if split_id is None or self.CRC_CONTENT_FILES not in stored:
+                continue
+            base = location[: -len(f"-{split_id}.crc")]
+            index.setdefault(base, {})[split_id] = {
+                "identity": self.split_identity(stored),
+                "content_files": stored[self.CRC_CONTENT_FILES],
+            }
+        return index
+
+    def find_reusable(self, split: dict, key: str, index: dict) -> Optional[List[dict]]:
+        """
+        Stored splits that together hold exactly the rows of split: one with the same identity, or consecutive
+        splits of a smaller split size that cover the same key range.  None if there are none.
+
+        Consecutive splits of one copy have no rows between them.  If their counts add up to the count of split and
+        the key range matches, they hold the same rows as long as the table did not change, which the crc checks:
+        CHECKSUM_AGG is a XOR, so the crc of the composed range is the XOR of the crc of the parts.
+        """
+        identity = self.split_identity(split)
+        key_min, key_max = f"{key}_min", f"{key}_max"
+        for stored_splits in index.values():
+            for stored in stored_splits.values():
+                if stored["identity"] == identity:
+                    return [stored]
+        if identity.get("cnt", 0) <= 0:
+            return None
+        for stored_splits in index.values():
+            first_id = next(
+                (i for i, s in stored_splits.items() if s["identity"].get(key_min) == identity.get(key_min)),
+                None,
+            )
+            if first_id is None:
+                continue
+            parts = []
+            split_id = first_id
+            rows = 0
+            while split_id in stored_splits and rows < identity["cnt"]:
+                parts.append(stored_splits[split_id])
+                rows += stored_splits[split_id]["identity"].get("cnt", 0)
+                if stored_splits[split_id]["identity"].get(key_max) == identity.get(key_max):
+                    break
+                split_id += 1
+            if len(parts) > 1 and parts[-1]["identity"].get(key_max) == identity.get(key_max):
+                if self.composes(identity, [p["identity"] for p in parts], key):
+                    return parts
+        return None
+
+    def composes(self, identity: dict, parts: List[dict], key: str) -> bool:
+        """
+        If the identities of consecutive parts add up to identity, see find_reusable.
+        """
+        if sum(p.get("cnt", 0) for p in parts) != identity.get("cnt"):
+            return False
+        for field, value in identity.items():
+            values = [p.get(field) for p in parts]
+            if field == "cnt" or field in (f"{key}_min", f"{key}_max"):
+                continue
+            if field == "crc" and all(isinstance(v, int) for v in values + [value]):
+                crc = 0
+                for v in values:
+                    crc ^= v
+                if crc != value:
+                    return False
+            elif field.endswith("_min") or field.endswith("_max"):
+                comparable = [comparable_value(v) for v in values]
+                if None in comparable or comparable_value(value) is None:
+                    return False
+                combined = min(comparable) if field.endswith("_min") else max(comparable)
+                if combined != comparable_value(value):
+                    return False
+            elif any(v != value for v in values):
+                return False
+        return all(set(p) == set(identity) for p in parts)
+
+    def find_reusable_splits(
+            self,
+            splits: List[dict],
+            primary_keys: List[str],
+            destination_folder: str,
+            base_location: str,
+    ) -> Dict[int, List[dict]]:
+        """
+        The stored splits of other split sizes that hold the rows of each of splits, see find_reusable.
+
+        :return: split id -> the stored splits, for the splits that can be reused.
+        """
+        if not splits or not all(self.is_range_split(split, primary_keys) for split in splits):
+            return {}
+        index = self.reuse_index(destination_folder, base_location)
+        if not index:
+            return {}
+        reusable = {}
+        for split in splits:
+            parts = self.find_reusable(split, primary_keys[0], index)
+            if parts is not None:
+                reusable[split["internal_split"]] = parts
+        return reusable
+
+    def reuse_splits(
+            self,
+            splits: dict,
+            primary_keys: List[str],
+            destination_folder: str,
+            base_location: str,
+            uncached: Optional[Set[int]] = None,
+    ) -> Tuple[List[SplitResult], Set[int]]:
+        """
+        Copy the content of splits that were read before with another split size, instead of reading them again.
+        Splits already at the destination are returned as cache hits.  Splits that are neither are left to be read.
+
+        :param uncached: Ids of splits already looked up at the destination and not there, not looked up again.
+        :return: the results, and the ids of the splits looked up and not at the destination, including uncached.  Those
+                 that were not reused can be read without looking them up again.
+
+        This way changing the split size, or a dynamic split size that grows with the table, does not read the whole
+        table again.  Content is copied from other split size folders rather than loaded from them, since the load
+        picks up the content files of the current split size by wildcard.
+        """
+        results = []
+        missing = []
+        uncached = set(uncached or ())
+        for split in splits.values():
+            if not self.is_range_split(split, primary_keys):
+                return results, uncached
+            if split["internal_split"] in uncached:
+                missing.append(split)
+                continue
+            cached = self.cached_split_result(split, destination_folder)
+            if cached:
+                results.append(cached)
+            else:
+                missing.append(split)
+                uncached.add(split["internal_split"])
+        reusable = self.find_reusable_splits(missing, primary_keys, destination_folder, base_location)
+        for split in missing:
+            start = time()
+            split_id = split["internal_split"]
+            parts = reusable.get(split_id)
+            if parts is None:
+                continue
+            content_files = []
+            try:
+                for part in parts:
+                    for source in part["content_files"]:
+                        target = self.content_location(
+                            base_location,
+                            f"{split_id}-{len(content_files)}" if content_files else split_id,
+                        )
+                        self.copy_destination(source, target)
+                        content_files.append(target)
+            except Exception as e:
+                logger.warning(f"Unable to reuse split {split_id}, reading it instead: {e}")
+                continue
+            self.write_split_crc(
+                split=split,
+                destination_folder=destination_folder,
+                content_files=content_files,
+            )
+            logger.info(f"{destination_folder}: Reused split {split_id} from {len(parts)} split(s) read before")
+            results.append(
+                SplitResult(
+                    content_file=content_files[0],
+                    crc_file=self.crc_location(base_location, split_id),
+                    elapsed=time() - start,
+                    cache_hit=False,
+                    row_count=split["cnt"],
+                    content_files=content_files,
+                    split_id=split_id,
+                    reused=True,
+                )
+            )
+        return results, uncached
+
+    def history_location(self, base_destination: str) -> str:
+        return f"{base_destination}-{self.HISTORY_POSTFIX}.json"
+
+    def split_digest(self, split: dict) -> str:
+        """
+        Digest of the crc of a split, to recognize it in the history.
+        """
+        return hashlib.sha1(
+            json.dumps(split, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+
+    def read_history(self, base_location: str) -> dict:
+        """
+        Timings of the splits of previous copies, split id -> dict of digest, cnt, elapsed and rows/s, see
+        write_history.  Empty if there is no history.
+        """
+        import smart_open
+
+        try:
+            with smart_open.open(self.history_location(base_location), encoding="utf-8") as history:
+                return {int(k): v for k, v in json.loads(history.read())["splits"].items()}
+        except Exception:
+            return {}
+
+    def write_history(
+            self,
+            base_location: str,
+            splits: dict,
+            split_results: List[SplitResult],
+            history: dict,
+    ):
+        """
+        Store the timing of every split read in this copy.  Cache hits keep the timing of when they were last read,
+        with the new digest, so we still know how long they take once they change.
+        """
+        import smart_open
+
+        history = dict(history)
+        for split_result in split_results:
+            split = splits.get(split_result.split_id)
+            if split is None:
+                continue
+            entry = dict(history.get(split_result.split_id, {}))
+            entry["digest"] = self.split_digest(split)
+            entry["cnt"] = split["cnt"]
+            if not split_result.cache_hit and not split_result.reused:
+                entry["elapsed"] = split_result.elapsed
+            history[split_result.split_id] = entry
+        location = self.history_location(base_location)
+        try:
+            with smart_open.open(location, "w", encoding="utf-8") as history_file:
+                history_file.write(json.dumps({"splits": history}))
+        except Exception as e:
+            logger.warning(f"Unable to write split history to {location}: {e}")
+
+    def predict_split_seconds(self, splits: dict, history: dict) -> dict:
+        """
+        Predict how long every split takes to read from the history: the last timing of the split scaled to its
+        current number of rows, or the average rows/s of the table for splits without timing.  Known cache hits,
+        splits with the same digest as last time, are predicted to take 0 seconds.
+
+        :return: split id -> seconds, None if there is no history to predict from.
+        """
+        timed = [h for h in history.values() if h.get("elapsed") and h.get("cnt")]
+        seconds_per_row = None
+        if timed:
+            seconds_per_row = sum(h["elapsed"] for h in timed) / sum(h["cnt"] for h in timed)
+        predictions = {}
+        for split_id, split in splits.items():
+            entry = history.get(split_id, {})
+            if entry.get("digest") == self.split_digest(split):
+                predictions[split_id] = 0
+            elif entry.get("elapsed") and entry.get("cnt"):
+                predictions[split_id] = entry["elapsed"] * split["cnt"] / entry["cnt"]
+            elif seconds_per_row is not None:
+                predictions[split_id] = seconds_per_row * split["cnt"]
+            else:
+                predictions[split_id] = None
+        return predictions
+
+    @staticmethod
+    def predict_makespan(seconds: List[float], threads: int) -> float:
+        """
+        Wall clock time to run jobs of seconds on threads workers, longest first.
+        """
+        import heapq
+
+        workers = [0.0] * max(threads, 1)
+        for job in sorted(seconds, reverse=True):
+            heapq.heappush(workers, heapq.heappop(workers) + job)
+        return max(workers)
+
+    def process_splits_work_stealing(
+            self,
+            threads: int,
+            splits: dict,
+            columns_type: List[Column],
+            primary_keys: List[str],
+            table: str,
+            schema: str,
+            destination_folder: str,
+            concurrency: Optional[AdaptiveConcurrency] = None,
+            uncached: Optional[Set[int]] = None,
+    ) -> List[SplitResult]:
+        """
+        Process splits with threads workers.  When workers become idle and a split is far behind the others, the
+        unread rows of the split are cut into pieces and handed to the idle workers.
+
+        Each piece writes its own content file next to the split content file, so the load wildcard picks them up.
+        The crc of a split is written when all its pieces are done, and lists all its content files.
+
+        :param uncached: ids of splits already looked up at the destination and not there, see process_split.
+        :return: a list of split results, one per split.
+        """
+        import concurrent.futures
+        import statistics
+
+        executor = concurrent.futures.ThreadPoolExecutor(threads)
+        futures = {}
+        state = {}
+        split_results = []
+        completed_elapsed = []
+
+        def submit(split: dict, progress: SplitProgress, piece: bool):
+            if piece:
+                future = executor.submit(
+                    self._read_split,
+                    split,
+                    columns_type,
+                    primary_keys,
+                    table,
+                    schema,
+                    destination_folder,
+                    concurrency,
+                    progress,
+                )
+            else:
+                future = executor.submit(
+                    self.process_split,
+                    split,
+                    columns_type,
+                    primary_keys,
+                    table,
+                    schema,
+                    destination_folder,
+                    concurrency,
+                    progress,
+                    cache_checked=progress.split_id in (uncached or set()),
+                )
+            futures[future] = progress
+
+        for split_id, split in splits.items():
+            split_size = split["split_size"]
+            row_from = max((split_id - 1) * split_size, 1)
+            state[split_id] = {
+                "split": split,
+                "pending": 1,
+                "parts": 0,
+                "rows": 0,
+                "content_files": [],
+                "lock_wait": -1,
+                "result": None,
+                "result_time": None,
+            }
+            submit(
+                split,
+                SplitProgress(
+                    split_id=split_id,
+                    part_id=f"{split_id}",
+                    row_from=row_from,
+                    row_to=row_from + split["cnt"],
+                    open_end=True,
+                ),
+                piece=False,
+            )
+
+        try:
+            while futures:
+                done, _ = concurrent.futures.wait(
+                    list(futures),
+                    timeout=self.STRAGGLER_CHECK_SECONDS,
+                    return_when=concurrent.futures.FIRST_COMPLETED,
+                )
+                for future in done:
+                    progress = futures.pop(future)
+                    split_state = state[progress.split_id]
+                    res = future.result()
+                    if isinstance(res, SplitResult):
+                        split_state["result"] = res
+                        split_state["result_time"] = time()
+                        if res.cache_hit:
+                            split_results.append(res)
+                            logger.info(f"Split {len(split_results)} / {len(splits)} Done!")
+                            logger.info(f"{res}")
+                            continue
+                        rows = res.row_count
+                        lock_wait = res.lock_wait
+                        content_files = res.content_files
+                    else:
+                        rows, _, lock_wait, content_files = res
+                    split_state["rows"] += rows
+                    if lock_wait >= 0:
+                        split_state["lock_wait"] = max(split_state["lock_wait"], 0) + lock_wait
+                    split_state["content_files"].extend(content_files)
+                    split_state["pending"] -= 1
+                    if split_state["pending"] == 0:
+                        content_files = sorted(split_state["content_files"])
+                        self.when_uploaded(
+                            content_files,
+                            functools.partial(
+                                self.write_split_crc,
+                                split=split_state["split"],
+                                destination_folder=destination_folder,
+                                content_files=content_files,
+                            ),
+                        )
+                        primary = split_state["result"]
+                        res = SplitResult(
+                            content_file=primary.content_file,
+                            crc_file=primary.crc_file,
+                            elapsed=primary.elapsed + time() - split_state["result_time"],
+                            cache_hit=False,
+                            row_count=split_state["rows"],
+                            first_row_elapsed=primary.first_row_elapsed,
+                            content_files=content_files,
+                            lock_wait=split_state["lock_wait"],
+                            split_id=progress.split_id,
+                        )
+                        completed_elapsed.append(res.elapsed)
+                        split_results.append(res)
+                        logger.info(f"Split {len(split_results)} / {len(splits)} Done!")
+                        logger.info(f"{res}")
+
+                idle = threads - len(futures)
+                if idle <= 0 or not futures:
+                    continue
+                threshold = self.STRAGGLER_MIN_SECONDS
+                if completed_elapsed:
+                    threshold = max(
+                        threshold,
+                        statistics.median(completed_elapsed) * self.STRAGGLER_FACTOR,
+                    )
+                stragglers = [
+                    (p.remaining_seconds(), p)
+                    for p in futures.values()
+                    if p.remaining_seconds() is not None
+                ]
+                stragglers = [(r, p) for r, p in stragglers if r > threshold]
+                if not stragglers:
+                    continue
+                remaining, straggler = max(stragglers, key=lambda x: x[0])
+                pieces = straggler.cut(
+                    pieces=idle + 1,
+                    margin=self.fetch_batch_size(columns_type),
+                    min_rows=self.STRAGGLER_MIN_ROWS,
+                )
+                split_state = state[straggler.split_id]
+                for piece in pieces:
+                    split_state["parts"] += 1
+                    split_state["pending"] += 1
+                    piece.part_id = f"{straggler.split_id}_{split_state['parts']}"
+                    submit(split_state["split"], piece, piece=True)
+                if pieces:
+                    logger.info(
+                        f"{table}: split {straggler.split_id} ({straggler.part_id}) needs ~{remaining:.0f}s more, "
+                        f"threshold is {threshold:.0f}s.  Handed {len(pieces)} pieces to idle workers."
+                    )
+        finally:
+            executor.shutdown(wait=True)
+        return split_results
+
+    def incremental_destination(self, destination_file: str) -> str:
+        """
+        base destination for incremental copies, kept apart from the split cache.
+        """
+        return f"{self.destination}/{destination_file}/{self.INCREMENTAL_FOLDER}/{destination_file}"
+
+    def watermark_location(self, base_destination: str) -> str:
+        return f"{base_destination}-{self.WATERMARK_POSTFIX}.json"
+
+    def read_watermark(self, destination_folder: str) -> Optional[dict]:
+        """
+        Read the watermark of the last loaded incremental copy, None if there is none.
+        """
+        import smart_open
+
+        location = self.watermark_location(
+            self.incremental_destination(destination_folder)
+        )
+        try:
+            with smart_open.open(location, encoding="utf-8") as watermark:
+                return json.loads(watermark.read())
+        except Exception:
+            return None
+
+    def write_watermark(self, destination_folder: str, watermark: dict):
+        """
+        Store the watermark.  Call this once the rows up to the watermark are loaded to the destination.
+        """
+        import smart_open
+
+        location = self.watermark_location(
+            self.incremental_destination(destination_folder)
+        )
+        logger.info(f"{destination_folder}: Writing watermark {watermark} to {location}")
+        with smart_open.open(location, "w", encoding="utf-8") as watermark_file:
+            watermark_file.write(json.dumps(watermark))
+
+    def incremental_high_sql(
+            self, table: str, schema: str, column: Column, lag_seconds: float = 0
+    ) -> str:
+        """
+        The query for the watermark of an incremental copy, the highest value of column that is safe to read up to.
+
+        A rowversion is assigned when a row is written, not when the transaction commits, so the max rowversion can be
+        above rows of transactions that are still open.  These would commit below the watermark and never be read.
+        Every rowversion below MIN_ACTIVE_ROWVERSION() is committed, so the watermark is kept below it.
+
+        Dates and other columns have the same race, a row can commit later with a value below the max.  lag_seconds
+        holds back the watermark of date columns by that long, to cover the longest transaction writing the table.
+        """
+        c = column.name
+        if column.data_type in self.ROWVERSION_TYPES:
+            active = "CAST(CAST(MIN_ACTIVE_ROWVERSION() AS BIGINT) - 1 AS BINARY(8))"
+            return (
+                f"SELECT CASE WHEN MAX({c}) < {active} THEN MAX({c}) ELSE {active} END AS high "
+                f"FROM {schema}.{table}"
+            )
+        if lag_seconds > 0 and column.data_type in self.INCREMENTAL_DATE_TYPES:
+            now = "SYSDATETIMEOFFSET()" if column.data_type == "DATETIMEOFFSET" else "SYSDATETIME()"
+            return (
+                f"SELECT MAX({c}) AS high FROM {schema}.{table} "
+                f"WHERE {c} <= DATEADD(MILLISECOND, -{int(lag_seconds * 1000)}, {now})"
+            )
+        return f"SELECT MAX({c}) AS high FROM {schema}.{table}"
+
+    def incremental_rows_sql(
+            self,
+            table: str,
+            schema: str,
+            columns_type: List[Column],
+            incremental_column: str,
+            watermark: dict,
+            previous: dict,
+    ) -> Tuple[str, list]:
+        """
+        The query that reads the rows changed after the previous watermark, up to the watermark.
+
+        :return: a tuple of the sql and its parameters.
+        """
+        sql = f"SELECT {','.join(self.select_expressions(columns_type))} FROM {schema}.{table} WHERE {incremental_column} <= ?"
+        params = [decode_watermark(watermark["value"])]
+        if previous["value"] is not None:
+            sql += f" AND {incremental_column} > ?"
+            params.append(decode_watermark(previous["value"]))
+        return sql, params
+
+    def copy_table_incremental(
+            self,
+            table: str,
+            sql_server_schema: str,
+            destination_folder: str,
+            incremental_column: str,
+            incremental_lag_seconds: float = 0,
+            threads: int = 1,
+            split_size: int = SPLIT_DYNAMIC,
+            max_concurrent_queries: int = 8,
+            adaptive_threads: bool = False,
+            max_rows_per_second: int = -1,
+            split_stealing: bool = False,
+            split_strategy: str = SPLIT_STRATEGY_AUTO,
+    ) -> CopyResult:
+        """
+        Copy the rows of the table that changed since the last copy, by a rowversion or modified date column.
+        The first copy, or a copy after incremental_column changed, reads the entire table with copy_table, in splits.
+
+        Only rows up to the watermark, see incremental_high_sql, are read, so the next copy starts exactly where this
+        one ended.  The first copy reads every row, rows written while it runs are read again by the next copy.  The
+        watermark is not stored by this method, store result.watermark with write_watermark once the rows are loaded.
+
+        :param table: the table/view to copy
+        :param sql_server_schema: the schema where the table exists
+        :param destination_folder: the destination folder
+        :param incremental_column: rowversion or modified date column, that increases when a row is changed.
+        :param incremental_lag_seconds: hold back the watermark of date columns by this long, see incremental_high_sql.
+        :param threads: the remaining parameters are passed to copy_table for the first copy.
+        :return: a CopyResult with one split containing the new rows, or no splits if nothing changed.  For the first
+                 copy the result of copy_table, with the watermark and without previous_watermark.
+        """
+        import smart_open
+
+        start = time()
+        columns_type, primary_keys = self.get_columns(
+            tbl_name=table, tbl_schema=sql_server_schema
+        )
+        if incremental_column not in columns_type:
+            raise RuntimeError(
+                f"Incremental column {incremental_column} does not exist in {sql_server_schema}.{table}"
+            )
+        column = columns_type[columns_type.index(incremental_column)]
+        previous = self.read_watermark(destination_folder)
+        if previous and previous["column"] != incremental_column:
+            logger.warning(
+                f"{table}: Incremental column changed from {previous['column']} to {incremental_column}, "
+                f"reading the entire table"
+            )
+            previous = None
+        base_location = self.incremental_destination(destination_folder)
+        with self.connect() as connection:
+            high = connection.execute(
+                self.incremental_high_sql(
+                    table, sql_server_schema, column, lag_seconds=incremental_lag_seconds
+                )
+            ).first()["high"]
+        watermark = {
+            "column": incremental_column,
+            "value": encode_watermark(high),
+            "sequence": previous["sequence"] + 1 if previous else 1,
+        }
+        if previous is None:
+            logger.info(f"{table}: No watermark, reading the entire table, watermark {watermark['value']}")
+            result = self.copy_table(
+                threads=threads,
+                table=table,
+                sql_server_schema=sql_server_schema,
+                destination_folder=destination_folder,
+                static_source=False,
+                split_size=split_size,
+                max_concurrent_queries=max_concurrent_queries,
+                adaptive_threads=adaptive_threads,
+                max_rows_per_second=max_rows_per_second,
+                split_stealing=split_stealing,
+                split_strategy=split_strategy,
+            )
+            # The content files belong to the split cache, they are not removed by the next copy.
+            watermark[self.CRC_CONTENT_FILES] = []
+            result.watermark = watermark
+            return result
+        if high is None or watermark["value"] == previous["value"]:
+            # high is None when no rows are old enough for incremental_lag_seconds.
+            logger.info(f"{table}: No rows changed since watermark {previous['value']}")
+            watermark["value"] = previous["value"]
+            watermark["sequence"] = previous["sequence"]
+            watermark[self.CRC_CONTENT_FILES] = previous.get(self.CRC_CONTENT_FILES, [])
+            return CopyResult(
+                table_name=table,
+                schema_name=sql_server_schema,
+                table_rows=0,
+                base_path=base_location,
+                elapsed_time=time() - start,
+                split_results=[],
+                column_type=columns_type,
+                watermark=watermark,
+                previous_watermark=previous,
+            )
+
+        columns = [c.name for c in columns_type]
+        sql, params = self.incremental_rows_sql(
+            table, sql_server_schema, columns_type, incremental_column, watermark, previous
+        )
+        if previous["value"] is not None:
+            logger.info(
+                f"{table}: Reading rows with {incremental_column} > {previous['value']['value']}"
+            )
+        content_location = self.content_location(base_location, watermark["sequence"])
+        watermark[self.CRC_CONTENT_FILES] = [content_location]
+        encoders = self.type_mapping.encoders(columns_type)
+        chunked = self.type_mapping.chunked_encoders(columns_type)
+        batch_size = self.fetch_batch_size(columns_type)
+        cnt = 0
+        with smart_open.open(
+                content_location, "w", encoding="utf-8", newline=""
+        ) as destination:
+            writer = csv.DictWriter(destination, fieldnames=columns, quotechar='"')
+            writer.writeheader()
+            with self.connect() as connection:
+                res = connection.execute(sql, tuple(params))
+                rows = res.fetchmany(size=batch_size)
+                while rows:
+                    for row in rows:
+                        if chunked and has_large_value(row, chunked, self.lob_chunk_size):
+                            for piece in csv_row_pieces(row, columns, encoders, chunked, self.lob_chunk_size):
+                                destination.write(piece)
+                        else:
+                            writer.writerow(self.row_to_bq(row, encoders))
+                    cnt += len(rows)
+                    rows = res.fetchmany(size=batch_size)
+        elapsed = time() - start
+        logger.info(f"{table}: Wrote {cnt} changed rows to {content_location}")
+        return CopyResult(
+            table_name=table,
+            schema_name=sql_server_schema,
+            table_rows=cnt,
+            base_path=base_location,
+            elapsed_time=elapsed,
+            split_results=[
+                SplitResult(
+                    content_file=content_location,
+                    crc_file=self.watermark_location(base_location),
+                    elapsed=elapsed,
+                    cache_hit=False,
+                    row_count=cnt,
+                )
+            ],
+            column_type=columns_type,
+            watermark=watermark,
+            previous_watermark=previous,
         )
 
     def get_rows(self, table: str, schema: str) -> int:
@@ -517,6 +2641,284 @@ class SqlServerToCsv(DatabaseToCsv):
         )
         return min(split_size, self.SPLIT_MAX_SIZE)
 
+    def calculate_hash_buckets(self, row_count: int, split_size: int) -> int:
+        """
+        Number of hash buckets so that buckets holds at most split_size rows.  Rounded up to a power of two, since
+        changing the number of buckets means reading the entire table again.
+
+        :param row_count: The number of rows in the table.
+        :param split_size: The wanted split size.
+        :return: the number of buckets.
+        """
+        buckets = 1
+        while buckets * split_size < row_count:
+            buckets *= 2
+        return buckets
+
+    def choose_split_strategy(
+            self,
+            table: str,
+            sql_server_schema: str,
+            split_size: int,
+            split_strategy: str,
+            table_rows: int,
+            columns_type: List[Column],
+            primary_keys: List[str],
+    ) -> Tuple[int, Optional[dict]]:
+        """
+        Decide how rows are assigned to splits, see SPLIT_STRATEGY_*.
+
+        :return: a tuple of number of hash buckets (0 if not hashing) and partitioning (None if not by partition).
+        """
+        buckets = 0
+        partitioning = None
+        if split_strategy == self.SPLIT_STRATEGY_PARTITION:
+            partitioning = self.get_partitioning(
+                tbl_schema=sql_server_schema, tbl_name=table
+            )
+            if partitioning is None:
+                logger.warning(
+                    f"{table}: Split strategy is partition, but the table is not partitioned.  Using row numbers."
+                )
+            else:
+                logger.info(
+                    f"{table}: Splitting by partition function {partitioning['partition_function']} "
+                    f"on {partitioning['partition_column']}, {len(partitioning['boundaries']) + 1} partitions"
+                    f"{f', sub split by {split_size} rows' if split_size > 0 else ''}"
+                )
+        elif split_size > 0 and (
+                split_strategy == self.SPLIT_STRATEGY_HASH
+                or (
+                        split_strategy == self.SPLIT_STRATEGY_AUTO
+                        and self.is_keyless(columns_type)
+                )
+        ):
+            buckets = self.calculate_hash_buckets(table_rows, split_size)
+            logger.info(
+                f"{table}: Splitting into {buckets} hash buckets of the split keys, to avoid sorting the table"
+            )
+        return buckets, partitioning
+
+    def estimate_query_plan(self, sql: str, params: Optional[list] = None) -> dict:
+        """
+        Get the estimated execution plan of a query with SET SHOWPLAN_XML, without running it.
+
+        :param sql: the query.
+        :param params: integer parameters, inlined since showplan does not work with parameterized queries.
+        :return: a dict with estimated cost, rows, the physical operators in the plan and the showplan xml.
+        """
+        import xml.etree.ElementTree as ElementTree
+
+        for param in params or []:
+            sql = sql.replace("?", str(int(param)), 1)
+        with self.connect() as connection:
+            try:
+                connection.execute("SET SHOWPLAN_XML ON")
+                plan_xml = connection.execute(sql).first()[0]
+                connection.execute("SET SHOWPLAN_XML OFF")
+            except Exception:
+                # The connection may still be in showplan mode, where queries return plans instead of rows.  Close it
+                # instead of returning it to the pool.
+                connection.invalidate()
+                raise
+        namespace = "{http://schemas.microsoft.com/sqlserver/2004/07/showplan}"
+        root = ElementTree.fromstring(plan_xml)
+        statement = next(root.iter(f"{namespace}StmtSimple"))
+        operators = []
+        for rel_op in root.iter(f"{namespace}RelOp"):
+            if rel_op.get("PhysicalOp") not in operators:
+                operators.append(rel_op.get("PhysicalOp"))
+        logger.debug(f"Showplan for {sql}: {plan_xml}")
+        return {
+            "cost": statement.get("StatementSubTreeCost"),
+            "rows": statement.get("StatementEstRows"),
+            "operators": operators,
+            "xml": plan_xml,
+        }
+
+    def _estimate_splits(
+            self,
+            table_rows: int,
+            split_size: int,
+            buckets: int,
+            partitioning: Optional[dict],
+            partition_stats: Optional[dict],
+    ) -> dict:
+        """
+        Estimate the splits from the number of rows, without running the split planning query.
+        """
+        splits = {}
+        if partitioning and partition_stats:
+            for partition, stats in sorted(partition_stats.items()):
+                sub_splits = max(stats["rows"] // split_size + 1, 1) if split_size > 0 else 1
+                for sub_split in range(sub_splits):
+                    split_id = partition * self.PARTITION_SPLIT_FACTOR + sub_split
+                    splits[split_id] = {
+                        "split_size": split_size,
+                        "internal_split": split_id,
+                        "cnt": stats["rows"] // sub_splits,
+                    }
+                    self._add_partition_to_split(splits[split_id], partitioning, None)
+        elif buckets > 0:
+            for split_id in range(1, buckets + 1):
+                splits[split_id] = {
+                    "split_size": split_size,
+                    "buckets": buckets,
+                    "internal_split": split_id,
+                    "cnt": table_rows // buckets,
+                }
+        elif split_size > 0:
+            for split_id in range(1, table_rows // split_size + 2):
+                splits[split_id] = {
+                    "split_size": split_size,
+                    "internal_split": split_id,
+                    "cnt": min(split_size, max(table_rows - (split_id - 1) * split_size, 0)),
+                }
+        else:
+            splits[1] = {"split_size": split_size, "internal_split": 1, "cnt": table_rows}
+        return splits
+
+    def plan_table(
+            self,
+            table: str,
+            sql_server_schema: str,
+            destination_folder: str,
+            static_source: bool,
+            split_size: int = -1,
+            split_strategy: str = SPLIT_STRATEGY_AUTO,
+            generate_splits: bool = True,
+            showplan: bool = True,
+    ) -> TablePlan:
+        """
+        Show what copy_table would do, without extracting any data: the split strategy and size, estimated rows and
+        bytes per split from the catalog, which splits are cache hits at the destination, and the estimated
+        execution plans of the split planning query and the largest split query.
+
+        :param table: the table/view to plan
+        :param sql_server_schema: the schema where the table exists
+        :param destination_folder: the destination folder
+        :param static_source: if this is true, source table will get no new data.
+        :param split_size: as in copy_table.
+        :param split_strategy: as in copy_table.
+        :param generate_splits: run the split planning query, to get exact splits and cache hits.  This reads the
+                                table (and computes CHECKSUM for dynamic sources), if False splits are estimated.
+        :param showplan: get estimated execution plans with SET SHOWPLAN_XML.
+        :return: the plan.
+        """
+        partition_stats = self.get_partition_stats(sql_server_schema, table)
+        table_bytes = None
+        if partition_stats:
+            table_rows = sum(s["rows"] for s in partition_stats.values())
+            table_bytes = sum(s["pages"] for s in partition_stats.values()) * self.PAGE_SIZE
+        else:
+            # Views, or no access to the catalog.
+            table_rows = self.get_rows(table=table, schema=sql_server_schema)
+        if split_size == self.SPLIT_DYNAMIC:
+            split_size = self.calculate_dynamic_split(table_rows)
+        columns_type, primary_keys = self.get_columns(
+            tbl_name=table, tbl_schema=sql_server_schema
+        )
+        self.check_single_scan(table, static_source, columns_type)
+        buckets, partitioning = self.choose_split_strategy(
+            table=table,
+            sql_server_schema=sql_server_schema,
+            split_size=split_size,
+            split_strategy=split_strategy,
+            table_rows=table_rows,
+            columns_type=columns_type,
+            primary_keys=primary_keys,
+        )
+        if partitioning:
+            strategy = f"{self.SPLIT_STRATEGY_PARTITION} ({partitioning['partition_function']})"
+        elif buckets > 0:
+            strategy = f"{self.SPLIT_STRATEGY_HASH} ({buckets} buckets)"
+        elif split_size > 0:
+            strategy = self.SPLIT_STRATEGY_ROW_NUMBER
+        else:
+            strategy = "no split"
+        row_bytes = table_bytes / table_rows if table_bytes and table_rows else 0
+
+        query_plans = {}
+        if showplan:
+            query_plans["split planning query"] = self.estimate_query_plan(
+                self.generate_splits_sql(
+                    table=table,
+                    static_source=static_source,
+                    schema=sql_server_schema,
+                    columns_type=columns_type,
+                    split_keys=primary_keys,
+                    split_size=split_size,
+                    buckets=buckets,
+                    partitioning=partitioning,
+                )
+            )
+        if generate_splits:
+            splits = self.generate_splits(
+                table=table,
+                static_source=static_source,
+                schema=sql_server_schema,
+                columns_type=columns_type,
+                split_keys=primary_keys,
+                split_size=split_size,
+                buckets=buckets,
+                partitioning=partitioning,
+            )
+        else:
+            splits = self._estimate_splits(
+                table_rows, split_size, buckets, partitioning, partition_stats
+            )
+        base_location = self.base_destination(
+            destination_folder,
+            split_size,
+            buckets=buckets,
+            partitioned=partitioning is not None,
+        )
+        cache_hits = {}
+        reusable = {}
+        if generate_splits:
+            cache_hits = {
+                split_id: self.destination_result_exists(split, destination_folder)
+                for split_id, split in splits.items()
+            }
+            # Splits copy_table would copy from another split size instead of reading them, see reuse_splits.
+            reusable = self.find_reusable_splits(
+                [split for split_id, split in splits.items() if not cache_hits[split_id]],
+                primary_keys,
+                destination_folder,
+                base_location,
+            )
+        split_plans = [
+            SplitPlan(
+                split_id=split_id,
+                estimated_rows=split["cnt"],
+                estimated_bytes=split["cnt"] * row_bytes,
+                cache_hit=cache_hits.get(split_id),
+                reused=split_id in reusable,
+            )
+            for split_id, split in splits.items()
+        ]
+        if showplan:
+            largest = max(splits.values(), key=lambda x: x["cnt"])
+            sql, params = self.split_query_sql(
+                split=largest,
+                table=table,
+                schema=sql_server_schema,
+                columns_type=columns_type,
+                split_keys=primary_keys,
+            )
+            query_plans[f"split query (split {largest['internal_split']})"] = self.estimate_query_plan(sql, params)
+        return TablePlan(
+            table_name=table,
+            schema_name=sql_server_schema,
+            table_rows=table_rows,
+            table_bytes=table_bytes,
+            split_size=split_size,
+            split_strategy=strategy,
+            base_path=base_location,
+            split_plans=split_plans,
+            query_plans=query_plans,
+        )
+
     def copy_table(
             self,
             threads: int,
@@ -525,6 +2927,11 @@ class SqlServerToCsv(DatabaseToCsv):
             destination_folder: str,
             static_source: bool,
             split_size: int = -1,
+            max_concurrent_queries: int = 8,
+            adaptive_threads: bool = False,
+            max_rows_per_second: int = -1,
+            split_stealing: bool = False,
+            split_strategy: str = SPLIT_STRATEGY_AUTO,
     ) -> CopyResult:
         """
         Copy a table from SQL server to a destination folder, containing one or more files.
@@ -533,15 +2940,23 @@ class SqlServerToCsv(DatabaseToCsv):
 
         A Best effort will be made to split the table up into N chunks with max size of split_size.
 
-        :param threads: number of worker threads to use
+        :param threads: number of worker threads to use, 1 or less reads the splits one at a time.
         :param table: the table/view to copy
         :param sql_server_schema: the schema where the table existss
         :param destination_folder: the destination folder
         :param static_source: if this is true, source table will get no new data.
         :param split_size: how many splits to do.  -1 means no splits.
+        :param max_concurrent_queries: hard cap on concurrent split queries with adaptive_threads.
+        :param adaptive_threads: tune the number of threads while running, instead of using threads.
+        :param max_rows_per_second: hard cap on rows/s read from the database, -1 means no cap.
+        :param split_stealing: cut slow splits into pieces for idle threads, see process_splits_work_stealing.
+        :param split_strategy: how rows are assigned to splits, one of the SPLIT_STRATEGY_* values.
         :return:
         """
         start = time()
+        self.check_isolation_level(static_source)
+        if self.replicas:
+            self.replicas.check(force=True)
         if 0 < split_size < self.SPLIT_MIN_SIZE:
             logger.warning(
                 f"Split size is set to {split_size} rows, which is less than the suggested minimum low "
@@ -560,65 +2975,196 @@ class SqlServerToCsv(DatabaseToCsv):
             logger.warning(f"The source table contains {table_rows} and you would benifit from using splits. "
                            f"You might want to re-run with option split_size: 0")
 
-        base_location = self.base_destination(destination_folder, split_size)
         columns_type, primary_keys = self.get_columns(
             tbl_name=table, tbl_schema=sql_server_schema
         )
-        splits = self.generate_splits(
+        self.check_single_scan(table, static_source, columns_type)
+        if self.fetch_engine_for(columns_type, log=True) == self.FETCH_ENGINE_ARROW:
+            logger.info(f"{table}: Fetching with the {self.FETCH_ENGINE_ARROW} engine")
+        buckets, partitioning = self.choose_split_strategy(
             table=table,
-            static_source=static_source,
-            schema=sql_server_schema,
-            columns_type=columns_type,
-            split_keys=primary_keys,
+            sql_server_schema=sql_server_schema,
             split_size=split_size,
+            split_strategy=split_strategy,
+            table_rows=table_rows,
+            columns_type=columns_type,
+            primary_keys=primary_keys,
         )
-        split_results = []
-        cnt = 0
+        if split_stealing and (buckets > 0 or partitioning):
+            logger.warning(f"{table}: Split stealing needs row number splits, disabling it")
+            split_stealing = False
+        base_location = self.base_destination(
+            destination_folder,
+            split_size,
+            buckets=buckets,
+            partitioned=partitioning is not None,
+        )
+        concurrency = None
+        if adaptive_threads:
+            concurrency = AdaptiveConcurrency(
+                initial=self.ADAPTIVE_INITIAL_THREADS,
+                maximum=max_concurrent_queries,
+                max_rows_per_second=max_rows_per_second,
+            )
+            threads = concurrency.maximum
+            logger.info(
+                f"{table}: Adaptive concurrency, starting at {concurrency.limit} up to {concurrency.maximum} threads"
+            )
+        elif max_rows_per_second > 0:
+            concurrency = AdaptiveConcurrency(
+                initial=max(threads, 1),
+                minimum=max(threads, 1),
+                maximum=max(threads, 1),
+                max_rows_per_second=max_rows_per_second,
+            )
 
-        def done_callback(f):
-            callback_res = f.result()
-            split_results.append(callback_res)
-            nonlocal cnt
-            cnt += 1
-            logger.info(f"Split {cnt} / {len(splits)} Done!")
-            logger.info(f"{callback_res}")
+        snapshot = contextlib.nullcontext()
+        if self.isolation_level == self.ISOLATION_SNAPSHOT:
+            # One connection per thread that can query at the same time, the split planning uses one of them as well.
+            snapshot = self.consistent_snapshot(
+                table=table, schema=sql_server_schema, connections=max(threads, 1)
+            )
+        with snapshot:
+            splits = self.generate_splits(
+                table=table,
+                static_source=static_source,
+                schema=sql_server_schema,
+                columns_type=columns_type,
+                split_keys=primary_keys,
+                split_size=split_size,
+                buckets=buckets,
+                partitioning=partitioning,
+            )
+            self.allow_replica_reads(table, static_source)
+            history = self.read_history(base_location)
+            predictions = self.predict_split_seconds(splits, history)
+            split_results = []
+            # Known cache hits are checked before dispatch, so they do not hold a thread from splits that need reading.
+            uncached = set()
+            for split_id, prediction in predictions.items():
+                if prediction == 0:
+                    cached = self.cached_split_result(splits[split_id], destination_folder)
+                    if cached:
+                        split_results.append(cached)
+                    else:
+                        uncached.add(split_id)
+            # Splits read before with another split size are copied, not read again.  Splits looked up at the
+            # destination once are not looked up again when read.
+            reused, uncached = self.reuse_splits(
+                splits={i: s for i, s in splits.items() if i not in {r.split_id for r in split_results}},
+                primary_keys=primary_keys,
+                destination_folder=destination_folder,
+                base_location=base_location,
+                uncached=uncached,
+            )
+            split_results += reused
+            cached_ids = {r.split_id for r in split_results}
+            # Longest first, so a large split does not start last and extend the tail of the copy.
+            pending_predictions = [predictions[i] for i in splits if i not in cached_ids]
+            if None in pending_predictions:
+                order = sorted(splits, key=lambda i: splits[i]["cnt"], reverse=True)
+            else:
+                order = sorted(splits, key=lambda i: predictions[i], reverse=True)
+            pending = {i: splits[i] for i in order if i not in cached_ids}
+            predicted_elapsed = None
+            if None not in pending_predictions:
+                predicted_elapsed = self.predict_makespan(pending_predictions, threads)
+                logger.info(
+                    f"{table}: {len(cached_ids)} known cache hits, {len(pending)} splits to process, "
+                    f"predicted to take {elapsed_string(predicted_elapsed)}"
+                )
+            cnt = len(split_results)
 
-        if threads > 1 and len(splits) > 1:
-            import concurrent.futures
+            def done_callback(f):
+                callback_res = f.result()
+                split_results.append(callback_res)
+                nonlocal cnt
+                cnt += 1
+                logger.info(f"Split {cnt} / {len(splits)} Done!")
+                logger.info(f"{callback_res}")
 
-            logger.warning(
-                f"Using experimental threading feature with {threads} threads"
-            )
-            executor = concurrent.futures.ThreadPoolExecutor(threads)
-            futures = [
-                executor.submit(
-                    self.process_split,
-                    split,
-                    columns_type,
-                    primary_keys,
-                    table,
-                    sql_server_schema,
-                    destination_folder,
+            if split_stealing and threads > 1 and split_size > 0:
+                logger.warning(
+                    f"Using experimental threading feature with {threads} threads and split stealing"
                 )
-                for split_id, split in splits.items()
-            ]
-            for f in futures:
-                f.add_done_callback(done_callback)
-            concurrent.futures.wait(futures)
-        else:
-            for split_id, split in splits.items():
-                res = self.process_split(
-                    split=split,
+                split_results += self.process_splits_work_stealing(
+                    threads=threads,
+                    splits=pending,
                     columns_type=columns_type,
                     primary_keys=primary_keys,
                     table=table,
                     schema=sql_server_schema,
                     destination_folder=destination_folder,
+                    concurrency=concurrency,
+                    uncached=uncached,
                 )
-                cnt += 1
-                logger.info(f"Split {cnt} / {len(splits)} Done!")
-                logger.info(f"{res}")
-                split_results.append(res)
+            elif threads > 1 and len(pending) > 1:
+                import concurrent.futures
+
+                logger.warning(
+                    f"Using experimental threading feature with {threads} threads"
+                )
+                executor = concurrent.futures.ThreadPoolExecutor(threads)
+                futures = [
+                    executor.submit(
+                        self.process_split,
+                        split,
+                        columns_type,
+                        primary_keys,
+                        table,
+                        sql_server_schema,
+                        destination_folder,
+                        concurrency,
+                        cache_checked=split_id in uncached,
+                    )
+                    for split_id, split in pending.items()
+                ]
+                for f in futures:
+                    f.add_done_callback(done_callback)
+                concurrent.futures.wait(futures)
+                executor.shutdown()
+            else:
+                for split_id, split in pending.items():
+                    res = self.process_split(
+                        split=split,
+                        columns_type=columns_type,
+                        primary_keys=primary_keys,
+                        table=table,
+                        schema=sql_server_schema,
+                        destination_folder=destination_folder,
+                        concurrency=concurrency,
+                        cache_checked=split_id in uncached,
+                    )
+                    cnt += 1
+                    logger.info(f"Split {cnt} / {len(splits)} Done!")
+                    logger.info(f"{res}")
+                    split_results.append(res)
+        if self.spool:
+            logger.info(f"{table}: Waiting for {self.spool.spooled_bytes} spooled bytes to upload")
+            self.spool.wait()
+        if concurrency and concurrency.adaptive:
+            logger.info(f"{table}: {concurrency.summary()}")
+        if self.replicas:
+            logger.info(f"{table}: Read replicas: {self.replicas}")
+        self.write_history(base_location, splits, split_results, history)
+        lock_waits = [r.lock_wait for r in split_results if r.lock_wait >= 0]
+        if lock_waits:
+            logger.info(
+                f"{table}: Split queries waited {sum(lock_waits)} ms on locks, max {max(lock_waits)} ms in a split"
+            )
+        content_digest = None
+        if len(split_results) == len(splits):
+            self.remove_orphaned_files(base_location, split_results)
+            content_digest = hashlib.sha1(
+                "".join(
+                    f"{split_id}:{self.split_digest(splits[split_id])},"
+                    for split_id in sorted(splits)
+                ).encode("utf-8")
+            ).hexdigest()
+        else:
+            logger.warning(
+                f"{table}: Only {len(split_results)} of {len(splits)} splits finished, not removing orphaned files"
+            )
         end = time()
         elapsed = end - start
         return CopyResult(
@@ -629,31 +3175,47 @@ class SqlServerToCsv(DatabaseToCsv):
             elapsed_time=elapsed,
             split_results=split_results,
             column_type=columns_type,
+            predicted_elapsed=predicted_elapsed,
+            content_digest=content_digest,
         )
 
 
 class SqlServerToBigquery(DatabaseToBigquery):
     BIGQUERY_SCHEMA_POSTFIX = "schema"
+    STAGING_TABLE_POSTFIX = "__incremental"
+    # Label on the BigQuery table with the fingerprint of the load, see load_fingerprint.
+    FINGERPRINT_LABEL = "database_to_bigquery_fingerprint"
 
-    def __init__(self, sql_server_to_csv: SqlServerToCsv):
+    def __init__(
+            self,
+            sql_server_to_csv: SqlServerToCsv,
+            bigquery_client: Optional["bigquery.Client"] = None,
+    ):
+        """
+        :param sql_server_to_csv: the source.
+        :param bigquery_client: Optional client to use, so long running processes can share one.  Created on first
+                                use if not given.
+        """
         self.sql_server_to_csv = sql_server_to_csv
-        self.bigquery_client = bigquery.Client()
+        self._bigquery_client = bigquery_client
+
+    @property
+    def bigquery_client(self) -> "bigquery.Client":
+        """
+        The BigQuery client is created on first use, so importing google-cloud-bigquery and authenticating is only
+        paid for when we actually talk to BigQuery.
+        """
+        if self._bigquery_client is None:
+            from google.cloud import bigquery
+
+            self._bigquery_client = bigquery.Client()
+        return self._bigquery_client
 
     def bigquery_schema_location(self, base_destination: str) -> str:
         return f"{base_destination}-{self.BIGQUERY_SCHEMA_POSTFIX}.json"
 
     def bq_type(self, sql_server_type: Column):
-        conversion = {
-            "DATETIME": "TIMESTAMP",
-            "NUMBER": "NUMERIC",
-            "DECIMAL": "FLOAT64",
-            "FLOAT": "FLOAT",
-            "INT": "INT64",
-        }
-        for sql_server_type_from, bigquery_type_to in conversion.items():
-            if sql_server_type_from in sql_server_type.data_type:
-                return bigquery_type_to
-        return "STRING"
+        return self.sql_server_to_csv.type_mapping.bigquery_type(sql_server_type)
 
     def calculate_bigquery_schema(self, columns_type: List[Column]) -> list:
         """
@@ -663,6 +3225,8 @@ class SqlServerToBigquery(DatabaseToBigquery):
         :param columns_type: a list of SQL server columns we are reading
         :return: a list of bigquery types
         """
+        from google.cloud import bigquery
+
         bigquery_schema = []
         for column in columns_type:
             bigquery_schema.append(
@@ -684,6 +3248,8 @@ class SqlServerToBigquery(DatabaseToBigquery):
         logger.info(
             f"Writing Schema defintion to destination {bigquery_schema_location}"
         )
+        import smart_open
+
         bigquery_ddl = self.calculate_bigquery_schema(columns_type)
         schema = [
             {"name": c.name, "type": c.field_type, "mode": "NULLABLE"}
@@ -694,17 +3260,45 @@ class SqlServerToBigquery(DatabaseToBigquery):
         ) as bigquery_ddl_json:
             bigquery_ddl_json.write(json.dumps(schema, indent=4))
 
-    def should_load_table(self, copy_result: CopyResult, table_id: str):
+    def load_fingerprint(self, copy_result: CopyResult) -> Optional[str]:
+        """
+        Fingerprint of what loading copy_result puts in the table: the crc of every split, where they are and the
+        BigQuery schema.  Fits in a label value.  None if not all splits were copied.
+        """
+        if copy_result.content_digest is None:
+            return None
+        schema = [[c.name, self.bq_type(c)] for c in copy_result.column_type]
+        return hashlib.sha1(
+            json.dumps([copy_result.content_digest, copy_result.base_path, schema]).encode("utf-8")
+        ).hexdigest()
+
+    def should_load_table(self, copy_result: CopyResult, table_id: str, fingerprint: Optional[str]) -> bool:
+        """
+        The table needs loading unless its fingerprint label matches the fingerprint of this copy.  This only reads
+        the table metadata, and catches updates that do not change the number of rows.
+        """
+        if fingerprint is None:
+            return True
         try:
             destination_table = self.bigquery_client.get_table(table_id)
-            if (
-                    copy_result.is_fully_cached()
-                    and destination_table.num_rows == copy_result.table_rows
-            ):
-                return False
-        except:
-            pass
-        return True
+            return (destination_table.labels or {}).get(self.FINGERPRINT_LABEL) != fingerprint
+        except Exception:
+            return True
+
+    def stamp_fingerprint(self, destination_table: "bigquery.Table", fingerprint: Optional[str]):
+        """
+        Label the table with the fingerprint of what was loaded.  None removes the label, for loads we can not
+        fingerprint, so a later copy with an old fingerprint is not skipped.
+        """
+        labels = dict(destination_table.labels or {})
+        if labels.get(self.FINGERPRINT_LABEL) == fingerprint:
+            return
+        labels[self.FINGERPRINT_LABEL] = fingerprint
+        destination_table.labels = labels
+        try:
+            self.bigquery_client.update_table(destination_table, ["labels"])
+        except Exception as e:
+            logger.warning(f"Unable to label {destination_table.table_id} with load fingerprint: {e}")
 
     def ingest_table(
             self,
@@ -715,6 +3309,14 @@ class SqlServerToBigquery(DatabaseToBigquery):
             bigquery_destination_project: str,
             bigquery_destination_dataset: str,
             split_size=SqlServerToCsv.SPLIT_DYNAMIC,
+            max_concurrent_queries: int = 8,
+            adaptive_threads: bool = False,
+            max_rows_per_second: int = -1,
+            split_stealing: bool = False,
+            split_strategy: str = SqlServerToCsv.SPLIT_STRATEGY_AUTO,
+            incremental_column: Optional[str] = None,
+            incremental_merge: bool = False,
+            incremental_lag_seconds: float = 0,
     ) -> IngestResult:
         """
         Ingest the sql_server_table into bigquery.
@@ -735,8 +3337,33 @@ class SqlServerToBigquery(DatabaseToBigquery):
         :param bigquery_destination_project: the bigquery project id where the dataset exist.
         :param bigquery_destination_dataset: the bigquery dataset.
         :param split_size: how big the partitions should be
+        :param max_concurrent_queries: hard cap on concurrent split queries with adaptive_threads.
+        :param adaptive_threads: tune the number of threads while running, see copy_table.
+        :param max_rows_per_second: hard cap on rows/s read from the database, -1 means no cap.
+        :param split_stealing: cut slow splits into pieces for idle threads.
+        :param split_strategy: how rows are assigned to splits, one of SqlServerToCsv.SPLIT_STRATEGY_*.
+        :param incremental_column: if set, only copy rows changed since last run, see ingest_table_incremental.
+        :param incremental_merge: merge changed rows by primary key instead of appending them.
+        :param incremental_lag_seconds: hold back the watermark of a date incremental_column by this long.
         :return: a result object containing the ingestion results.
         """
+        if incremental_column:
+            return self.ingest_table_incremental(
+                sql_server_table=sql_server_table,
+                sql_server_schema=sql_server_schema,
+                bigquery_destination_project=bigquery_destination_project,
+                bigquery_destination_dataset=bigquery_destination_dataset,
+                incremental_column=incremental_column,
+                incremental_merge=incremental_merge,
+                incremental_lag_seconds=incremental_lag_seconds,
+                threads=threads,
+                split_size=split_size,
+                max_concurrent_queries=max_concurrent_queries,
+                adaptive_threads=adaptive_threads,
+                max_rows_per_second=max_rows_per_second,
+                split_stealing=split_stealing,
+                split_strategy=split_strategy,
+            )
         start_all = time()
         result = self.sql_server_to_csv.copy_table(
             threads=threads,
@@ -745,14 +3372,20 @@ class SqlServerToBigquery(DatabaseToBigquery):
             destination_folder=sql_server_table,
             static_source=static_source,
             split_size=split_size,
+            max_concurrent_queries=max_concurrent_queries,
+            adaptive_threads=adaptive_threads,
+            max_rows_per_second=max_rows_per_second,
+            split_stealing=split_stealing,
+            split_strategy=split_strategy,
         )
         table_id = f"{bigquery_destination_project}.{bigquery_destination_dataset}.{sql_server_table}"
+        fingerprint = self.load_fingerprint(result)
 
-        if not self.should_load_table(copy_result=result, table_id=table_id) and (
-                os.getenv("DISABLE_LOAD_CACHE", None) is None
-        ):
+        if not self.should_load_table(
+                copy_result=result, table_id=table_id, fingerprint=fingerprint
+        ) and (os.getenv("DISABLE_LOAD_CACHE", None) is None):
             logger.info(
-                f"Skipping loading result to {table_id}, result is previously cached and rows match."
+                f"Skipping loading result to {table_id}, the table was loaded from the same splits ({fingerprint})."
             )
             end = time()
             return IngestResult(
@@ -766,6 +3399,8 @@ class SqlServerToBigquery(DatabaseToBigquery):
                 ),
             )
 
+        from google.cloud import bigquery
+
         start_bigquery = time()
         self.write_bigquery_schema(
             columns_type=result.column_type,
@@ -793,6 +3428,7 @@ class SqlServerToBigquery(DatabaseToBigquery):
         logger.info("Ingestion job finished.")
 
         destination_table = self.bigquery_client.get_table(table_id)
+        self.stamp_fingerprint(destination_table, fingerprint)
 
         end = time()
         return IngestResult(
@@ -803,3 +3439,143 @@ class SqlServerToBigquery(DatabaseToBigquery):
             timing_bigquery=end - start_bigquery,
             bigquery_schema_location=self.bigquery_schema_location(result.base_path),
         )
+
+    def merge_sql(self, table_id: str, staging_table_id: str, columns_type: List[Column]) -> str:
+        """
+        MERGE the rows of the staging table into the table, by primary key.
+        """
+        keys = " AND ".join([f"T.`{c.name}` = S.`{c.name}`" for c in columns_type if c.pk])
+        update = ", ".join([f"`{c.name}` = S.`{c.name}`" for c in columns_type])
+        columns = ", ".join([f"`{c.name}`" for c in columns_type])
+        values = ", ".join([f"S.`{c.name}`" for c in columns_type])
+        return (
+            f"MERGE `{table_id}` T USING `{staging_table_id}` S ON {keys} "
+            f"WHEN MATCHED THEN UPDATE SET {update} "
+            f"WHEN NOT MATCHED THEN INSERT ({columns}) VALUES ({values})"
+        )
+
+    def ingest_table_incremental(
+            self,
+            sql_server_table: str,
+            sql_server_schema: str,
+            bigquery_destination_project: str,
+            bigquery_destination_dataset: str,
+            incremental_column: str,
+            incremental_merge: bool = False,
+            incremental_lag_seconds: float = 0,
+            threads: int = 1,
+            split_size: int = SqlServerToCsv.SPLIT_DYNAMIC,
+            max_concurrent_queries: int = 8,
+            adaptive_threads: bool = False,
+            max_rows_per_second: int = -1,
+            split_stealing: bool = False,
+            split_strategy: str = SqlServerToCsv.SPLIT_STRATEGY_AUTO,
+    ) -> IngestResult:
+        """
+        Ingest the rows of sql_server_table changed since the last run into bigquery, by a rowversion or modified date
+        column.  The first run loads the entire table, copied in splits like ingest_table, later runs append the
+        changed rows with WRITE_APPEND, or MERGE them by primary key if incremental_merge is set.  Deleted rows are
+        not detected.
+
+        The watermark is stored after the load has finished, so a failed load is retried on the next run.
+
+        :param sql_server_table: the sql server table name to ingest
+        :param sql_server_schema: the schema where the table exists (typically dbo)
+        :param bigquery_destination_project: the bigquery project id where the dataset exist.
+        :param bigquery_destination_dataset: the bigquery dataset.
+        :param incremental_column: rowversion or modified date column, that increases when a row is changed.
+        :param incremental_merge: merge changed rows by primary key instead of appending them.
+        :param incremental_lag_seconds: hold back the watermark of a date incremental_column by this long.
+        :param threads: the remaining parameters are used to copy the entire table on the first run, see ingest_table.
+        :return: a result object containing the ingestion results.
+        """
+        from google.cloud import bigquery
+
+        start_all = time()
+        result = self.sql_server_to_csv.copy_table_incremental(
+            table=sql_server_table,
+            sql_server_schema=sql_server_schema,
+            destination_folder=sql_server_table,
+            incremental_column=incremental_column,
+            incremental_lag_seconds=incremental_lag_seconds,
+            threads=threads,
+            split_size=split_size,
+            max_concurrent_queries=max_concurrent_queries,
+            adaptive_threads=adaptive_threads,
+            max_rows_per_second=max_rows_per_second,
+            split_stealing=split_stealing,
+            split_strategy=split_strategy,
+        )
+        table_id = f"{bigquery_destination_project}.{bigquery_destination_dataset}.{sql_server_table}"
+        schema_location = self.bigquery_schema_location(result.base_path)
+        if not result.split_results:
+            logger.info(f"Skipping loading result to {table_id}, no rows changed.")
+            return IngestResult(
+                copy_result=result,
+                rows_in_table=0,
+                table_id=table_id,
+                timing_all=time() - start_all,
+                timing_bigquery=0,
+                bigquery_schema_location=schema_location,
+            )
+
+        start_bigquery = time()
+        self.write_bigquery_schema(
+            columns_type=result.column_type,
+            bigquery_schema_location=schema_location,
+        )
+        append = result.previous_watermark is not None
+        merge = append and incremental_merge
+        if merge and SqlServerToCsv.is_keyless(result.column_type):
+            logger.warning(
+                f"{table_id}: No primary keys to merge by, appending changed rows instead."
+            )
+            merge = False
+        load_table_id = f"{table_id}{self.STAGING_TABLE_POSTFIX}" if merge else table_id
+        job_config = bigquery.LoadJobConfig(
+            write_disposition=bigquery.WriteDisposition.WRITE_APPEND
+            if append and not merge
+            else bigquery.WriteDisposition.WRITE_TRUNCATE,
+            source_format=bigquery.SourceFormat.CSV,
+            skip_leading_rows=1,
+            schema=self.calculate_bigquery_schema(result.column_type),
+            allow_quoted_newlines=True,
+        )
+        uri = result.split_results[0].content_file
+        if not append:
+            uri = f"{result.base_path}-{SqlServerToCsv.CSV_CONTENT_POSTFIX}*.csv"
+        logger.info(
+            f"Importing {result.table_rows} changed rows to BigQuery table {load_table_id}"
+            f" ({job_config.write_disposition}), with content from {uri}"
+        )
+        load_job = self.bigquery_client.load_table_from_uri(
+            uri, load_table_id, job_config=job_config
+        )
+        load_job.result()
+        if merge:
+            logger.info(f"Merging {load_table_id} into {table_id}")
+            self.bigquery_client.query(
+                self.merge_sql(table_id, load_table_id, result.column_type)
+            ).result()
+            self.bigquery_client.delete_table(load_table_id, not_found_ok=True)
+        logger.info("Ingestion job finished.")
+
+        self.sql_server_to_csv.write_watermark(sql_server_table, result.watermark)
+        if result.previous_watermark:
+            for content_file in result.previous_watermark.get(
+                    SqlServerToCsv.CRC_CONTENT_FILES, []
+            ):
+                self.sql_server_to_csv.remove_destination(content_file)
+
+        destination_table = self.bigquery_client.get_table(table_id)
+        # Rows were added, the table no longer matches the fingerprint of a full load.
+        self.stamp_fingerprint(destination_table, None)
+        end = time()
+        return IngestResult(
+            copy_result=result,
+            rows_in_table=destination_table.num_rows,
+            table_id=table_id,
+            timing_all=end - start_all,
+            timing_bigquery=end - start_bigquery,
+            bigquery_schema_location=schema_location,
+        )
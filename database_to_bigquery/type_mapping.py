@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+import base64
+import decimal
+import struct
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterator, List, Optional
+
+from database_to_bigquery.base import Column
+
+# BigQuery NUMERIC holds precision 38 with scale 9, anything beyond needs BIGNUMERIC.
+NUMERIC_MAX_SCALE = 9
+NUMERIC_MAX_INTEGER_DIGITS = 29
+
+# SQL Server type -> BigQuery type.  Types not in here are loaded as STRING.
+SQL_SERVER_TO_BIGQUERY = {
+    "BIGINT": "INT64",
+    "INT": "INT64",
+    "SMALLINT": "INT64",
+    "TINYINT": "INT64",
+    "BIT": "BOOL",
+    "DECIMAL": "NUMERIC",
+    "NUMERIC": "NUMERIC",
+    "MONEY": "NUMERIC",
+    "SMALLMONEY": "NUMERIC",
+    "FLOAT": "FLOAT64",
+    "REAL": "FLOAT64",
+    "DATE": "DATE",
+    "TIME": "TIME",
+    "DATETIME": "TIMESTAMP",
+    "DATETIME2": "TIMESTAMP",
+    "SMALLDATETIME": "TIMESTAMP",
+    "DATETIMEOFFSET": "TIMESTAMP",
+    "CHAR": "STRING",
+    "NCHAR": "STRING",
+    "VARCHAR": "STRING",
+    "NVARCHAR": "STRING",
+    "TEXT": "STRING",
+    "NTEXT": "STRING",
+    "XML": "STRING",
+    "UNIQUEIDENTIFIER": "STRING",
+    "BINARY": "BYTES",
+    "VARBINARY": "BYTES",
+    "IMAGE": "BYTES",
+    "TIMESTAMP": "BYTES",  # rowversion
+}
+
+# Characters that make the csv module quote a field, with the default dialect.
+CSV_QUOTE_CHARACTERS = ',"\r\n'
+
+# ODBC type of DATETIMEOFFSET, which pyodbc can not read without an output converter.
+SQL_SS_TIMESTAMPOFFSET = -155
+
+
+def datetimeoffset_converter(value: bytes) -> datetime:
+    """
+    pyodbc output converter for DATETIMEOFFSET columns.
+    """
+    year, month, day, hour, minute, second, fraction, tz_hour, tz_minute = struct.unpack(
+        "<6hI2h", value
+    )
+    return datetime(
+        year,
+        month,
+        day,
+        hour,
+        minute,
+        second,
+        fraction // 1000,
+        timezone(timedelta(hours=tz_hour, minutes=tz_minute)),
+    )
+
+
+def encode_string(value):
+    if isinstance(value, str):
+        # bigquery fails if loading null terminations.  Checking first saves a copy of every value without them.
+        if "\x00" in value:
+            return value.replace("\x00", "")
+    return value
+
+
+def encode_char(value):
+    return value.strip() if value else None
+
+
+def encode_numeric(value):
+    if isinstance(value, decimal.Decimal):
+        # Cast to string so we dont loose precision by casting to float.
+        return format(value, "f")
+    return value
+
+
+def encode_bool(value):
+    if value is None:
+        return None
+    return "true" if value else "false"
+
+
+def encode_isoformat(value):
+    if value is None or isinstance(value, str):
+        return value
+    return value.isoformat()
+
+
+def encode_bytes(value):
+    # BigQuery reads BYTES in csv as base64.
+    if value is None:
+        return None
+    return base64.b64encode(value).decode("ascii")
+
+
+def encode_native(value):
+    return value
+
+
+def encode_string_chunks(value: str, chunk_size: int) -> Iterator[str]:
+    """
+    encode_string of a large value, as csv field in pieces of at most chunk_size characters.  Quoted and escaped the
+    way the csv module does it, so the output is the same as writing the whole value with the csv writer.
+    """
+    quote = any(c in value for c in CSV_QUOTE_CHARACTERS)
+    if quote:
+        yield '"'
+    for start in range(0, len(value), chunk_size):
+        chunk = encode_string(value[start : start + chunk_size])
+        yield chunk.replace('"', '""') if quote else chunk
+    if quote:
+        yield '"'
+
+
+def encode_bytes_chunks(value: bytes, chunk_size: int) -> Iterator[str]:
+    """
+    encode_bytes of a large value, as csv field in pieces.  base64 never needs quoting.
+    """
+    # base64 of consecutive pieces concatenates to the base64 of the whole, as long as pieces are a multiple of 3.
+    chunk_size = max(chunk_size - chunk_size % 3, 3)
+    for start in range(0, len(value), chunk_size):
+        yield base64.b64encode(value[start : start + chunk_size]).decode("ascii")
+
+
+BIGQUERY_ENCODERS = {
+    "STRING": encode_string,
+    "INT64": encode_native,
+    "FLOAT64": encode_native,
+    "NUMERIC": encode_numeric,
+    "BIGNUMERIC": encode_numeric,
+    "BOOL": encode_bool,
+    "DATE": encode_isoformat,
+    "TIME": encode_isoformat,
+    "DATETIME": encode_isoformat,
+    # str() of a datetime is understood by BigQuery, and is what has always been written.
+    "TIMESTAMP": encode_string,
+    "BYTES": encode_bytes,
+}
+
+
+# Encoders that can write a large value in pieces, see TypeMapping.chunked_encoders.
+CHUNKED_ENCODERS = {
+    encode_string: encode_string_chunks,
+    encode_bytes: encode_bytes_chunks,
+}
+
+
+class TypeMapping:
+    """
+    Maps SQL Server columns to BigQuery types, and to encoders that convert the values read with pyodbc to what
+    BigQuery expects in a csv file.
+
+    Overrides are keyed by column name or SQL Server type, and map to a BigQuery type.  Column names win over types.
+    """
+
+    def __init__(self, overrides: Optional[Dict[str, str]] = None, strip_char_type: bool = True):
+        """
+        :param overrides: column name or SQL Server type -> BigQuery type.
+        :param strip_char_type: strip the padding of CHAR columns.
+        """
+        self.overrides: Dict[str, str] = {}
+        for key, bigquery_type in (overrides or {}).items():
+            bigquery_type = bigquery_type.upper()
+            if bigquery_type not in BIGQUERY_ENCODERS:
+                raise ValueError(
+                    f"Unsupported BigQuery type {bigquery_type} for {key}, use one of {', '.join(BIGQUERY_ENCODERS)}"
+                )
+            self.overrides[key] = bigquery_type
+        self.strip_char_type: bool = strip_char_type
+
+    def bigquery_type(self, column: Column) -> str:
+        if column.name in self.overrides:
+            return self.overrides[column.name]
+        if column.data_type in self.overrides:
+            return self.overrides[column.data_type]
+        bigquery_type = SQL_SERVER_TO_BIGQUERY.get(column.data_type, "STRING")
+        if bigquery_type == "NUMERIC" and column.scale is not None and column.precision is not None:
+            if (
+                column.scale > NUMERIC_MAX_SCALE
+                or column.precision - column.scale > NUMERIC_MAX_INTEGER_DIGITS
+            ):
+                return "BIGNUMERIC"
+        return bigquery_type
+
+    def encoder(self, column: Column) -> Callable:
+        bigquery_type = self.bigquery_type(column)
+        if column.data_type == "CHAR" and bigquery_type == "STRING" and self.strip_char_type:
+            return encode_char
+        return BIGQUERY_ENCODERS[bigquery_type]
+
+    def describe(self, column: Column) -> str:
+        """
+        The column with its BigQuery type and encoder, part of the split crc so a changed mapping reads the split again.
+        """
+        return f"{column} -> {self.bigquery_type(column)} {self.encoder(column).__name__}"
+
+    def encoders(self, columns_type: List[Column]) -> Dict[str, Callable]:
+        """
+        Encoders for all columns, computed once per split rather than per value.
+        """
+        return {c.name: self.encoder(c) for c in columns_type}
+
+    def chunked_encoders(self, columns_type: List[Column]) -> Dict[str, Callable]:
+        """
+        Chunked encoders for the large object columns that have one, i.e. that are loaded as STRING or BYTES.
+        """
+        chunked = {}
+        for c in columns_type:
+            encoder = self.encoder(c)
+            if c.is_lob and encoder in CHUNKED_ENCODERS:
+                chunked[c.name] = CHUNKED_ENCODERS[encoder]
+        return chunked
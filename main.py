@@ -2,6 +2,7 @@ import os
 from database_to_bigquery.sql_server import SqlServerToCsv, SqlServerToBigquery
 import logging
 from dataclasses import dataclass
+from typing import List, Optional
 import yaml
 
 
@@ -27,6 +28,31 @@ class Config:
     sql_server_schema: str = "dbo"
     threads: int = -1
     static_source: bool = True
+    max_concurrent_queries: int = 8
+    adaptive_threads: bool = False
+    max_rows_per_second: int = -1
+    split_stealing: bool = False
+    split_strategy: str = "auto"
+    incremental_column: Optional[str] = None
+    incremental_merge: bool = False
+    incremental_lag_seconds: float = 0
+    type_overrides: Optional[dict] = None
+    single_scan: bool = False
+    isolation_level: Optional[str] = None
+    content_file_max_mb: int = -1
+    content_file_max_rows: int = -1
+    include_columns: Optional[list] = None
+    exclude_columns: Optional[list] = None
+    computed_columns: Optional[dict] = None
+    spool_directory: Optional[str] = None
+    spool_max_mb: int = -1
+    spool_upload_threads: int = 4
+    lob_fetch_batch_size: int = SqlServerToCsv.LOB_FETCH_BATCH_SIZE
+    lob_chunk_size: int = SqlServerToCsv.LOB_CHUNK_SIZE
+    fetch_engine: str = SqlServerToCsv.FETCH_ENGINE_ROWS
+    read_replicas: Optional[list] = None
+    replica_max_lag_seconds: float = -1
+    replica_planning: bool = False
 
 
 def get_env_config(override_dict) -> Config:
@@ -61,6 +87,85 @@ def get_env_config(override_dict) -> Config:
     threads = int(os.getenv("THREADS", None) or override_dict.get("threads", -1))
 
     static_source = os.getenv("STATIC_SOURCE", None) or override_dict.get("static_source", True)
+    max_concurrent_queries = int(
+        os.getenv("MAX_CONCURRENT_QUERIES", None) or override_dict.get("max_concurrent_queries", 8)
+    )
+    adaptive_threads = str(
+        os.getenv("ADAPTIVE_THREADS", None) or override_dict.get("adaptive_threads", False)
+    ).lower() in ("true", "1", "yes")
+    max_rows_per_second = int(
+        os.getenv("MAX_ROWS_PER_SECOND", None) or override_dict.get("max_rows_per_second", -1)
+    )
+    split_stealing = str(
+        os.getenv("SPLIT_STEALING", None) or override_dict.get("split_stealing", False)
+    ).lower() in ("true", "1", "yes")
+    split_strategy = os.getenv("SPLIT_STRATEGY", None) or override_dict.get("split_strategy", "auto")
+    assert split_strategy in (
+        SqlServerToCsv.SPLIT_STRATEGY_AUTO,
+        SqlServerToCsv.SPLIT_STRATEGY_ROW_NUMBER,
+        SqlServerToCsv.SPLIT_STRATEGY_HASH,
+        SqlServerToCsv.SPLIT_STRATEGY_PARTITION,
+    ), f"SPLIT_STRATEGY must be auto, row_number, hash or partition, not {split_strategy}"
+    incremental_column = os.getenv("INCREMENTAL_COLUMN", None) or override_dict.get("incremental_column", None)
+    incremental_merge = str(
+        os.getenv("INCREMENTAL_MERGE", None) or override_dict.get("incremental_merge", False)
+    ).lower() in ("true", "1", "yes")
+    incremental_lag_seconds = float(
+        os.getenv("INCREMENTAL_LAG_SECONDS", None) or override_dict.get("incremental_lag_seconds", 0)
+    )
+    # TYPE_OVERRIDES=column_or_type=BIGQUERY_TYPE,... in env, or a dict in yaml.
+    type_overrides = override_dict.get("type_overrides", None)
+    if os.getenv("TYPE_OVERRIDES", None):
+        type_overrides = dict(o.split("=", 1) for o in os.getenv("TYPE_OVERRIDES").split(","))
+    single_scan = str(
+        os.getenv("SINGLE_SCAN", None) or override_dict.get("single_scan", False)
+    ).lower() in ("true", "1", "yes")
+    isolation_level = os.getenv("ISOLATION_LEVEL", None) or override_dict.get("isolation_level", None)
+    assert isolation_level is None or isolation_level in SqlServerToCsv.SQLALCHEMY_ISOLATION_LEVELS, (
+        f"ISOLATION_LEVEL must be one of {', '.join(SqlServerToCsv.SQLALCHEMY_ISOLATION_LEVELS)}, not {isolation_level}"
+    )
+    content_file_max_mb = int(
+        os.getenv("CONTENT_FILE_MAX_MB", None) or override_dict.get("content_file_max_mb", -1)
+    )
+    content_file_max_rows = int(
+        os.getenv("CONTENT_FILE_MAX_ROWS", None) or override_dict.get("content_file_max_rows", -1)
+    )
+    # INCLUDE_COLUMNS/EXCLUDE_COLUMNS=a,b in env, or lists in yaml.
+    include_columns = override_dict.get("include_columns", None)
+    if os.getenv("INCLUDE_COLUMNS", None):
+        include_columns = os.getenv("INCLUDE_COLUMNS").split(",")
+    exclude_columns = override_dict.get("exclude_columns", None)
+    if os.getenv("EXCLUDE_COLUMNS", None):
+        exclude_columns = os.getenv("EXCLUDE_COLUMNS").split(",")
+    # COMPUTED_COLUMNS=name=expression;... in env, expressions can contain commas.  A dict in yaml.
+    computed_columns = override_dict.get("computed_columns", None)
+    if os.getenv("COMPUTED_COLUMNS", None):
+        computed_columns = dict(c.split("=", 1) for c in os.getenv("COMPUTED_COLUMNS").split(";"))
+    spool_directory = os.getenv("SPOOL_DIRECTORY", None) or override_dict.get("spool_directory", None)
+    spool_max_mb = int(os.getenv("SPOOL_MAX_MB", None) or override_dict.get("spool_max_mb", -1))
+    spool_upload_threads = int(
+        os.getenv("SPOOL_UPLOAD_THREADS", None) or override_dict.get("spool_upload_threads", 4)
+    )
+    lob_fetch_batch_size = int(
+        os.getenv("LOB_FETCH_BATCH_SIZE", None)
+        or override_dict.get("lob_fetch_batch_size", SqlServerToCsv.LOB_FETCH_BATCH_SIZE)
+    )
+    lob_chunk_size = int(
+        os.getenv("LOB_CHUNK_SIZE", None) or override_dict.get("lob_chunk_size", SqlServerToCsv.LOB_CHUNK_SIZE)
+    )
+    fetch_engine = os.getenv("FETCH_ENGINE", None) or override_dict.get(
+        "fetch_engine", SqlServerToCsv.FETCH_ENGINE_ROWS
+    )
+    # READ_REPLICAS=host1,host2 in env, or a list in yaml.
+    read_replicas = override_dict.get("read_replicas", None)
+    if os.getenv("READ_REPLICAS", None):
+        read_replicas = os.getenv("READ_REPLICAS").split(",")
+    replica_max_lag_seconds = float(
+        os.getenv("REPLICA_MAX_LAG_SECONDS", None) or override_dict.get("replica_max_lag_seconds", -1)
+    )
+    replica_planning = str(
+        os.getenv("REPLICA_PLANNING", None) or override_dict.get("replica_planning", False)
+    ).lower() in ("true", "1", "yes")
 
     return Config(
         db_username=username,
@@ -75,10 +180,35 @@ def get_env_config(override_dict) -> Config:
         sql_server_schema=sql_server_schema,
         threads=threads,
         static_source=static_source,
+        max_concurrent_queries=max_concurrent_queries,
+        adaptive_threads=adaptive_threads,
+        max_rows_per_second=max_rows_per_second,
+        split_stealing=split_stealing,
+        split_strategy=split_strategy,
+        incremental_column=incremental_column,
+        incremental_merge=incremental_merge,
+        incremental_lag_seconds=incremental_lag_seconds,
+        type_overrides=type_overrides,
+        single_scan=single_scan,
+        isolation_level=isolation_level,
+        content_file_max_mb=content_file_max_mb,
+        content_file_max_rows=content_file_max_rows,
+        include_columns=include_columns,
+        exclude_columns=exclude_columns,
+        computed_columns=computed_columns,
+        spool_directory=spool_directory,
+        spool_max_mb=spool_max_mb,
+        spool_upload_threads=spool_upload_threads,
+        lob_fetch_batch_size=lob_fetch_batch_size,
+        lob_chunk_size=lob_chunk_size,
+        fetch_engine=fetch_engine,
+        read_replicas=read_replicas,
+        replica_max_lag_seconds=replica_max_lag_seconds,
+        replica_planning=replica_planning,
     )
 
 
-def get_config(config_path: str) -> Config:
+def read_config_dict(config_path: Optional[str]) -> dict:
     if os.getenv("SECRETMANAGER_URI", None):
         logger.info("Reading config from SECRETMANAGER")
         from google.cloud import secretmanager
@@ -88,21 +218,141 @@ def get_config(config_path: str) -> Config:
         response = client.access_secret_version(request={"name": name})
 
         response_payload = response.payload.data.decode("UTF-8")
-        p = yaml.load(response_payload, Loader=yaml.SafeLoader)
-        return get_env_config(p)
+        return yaml.load(response_payload, Loader=yaml.SafeLoader)
     elif os.getenv("CONFIG_FILE", None):
         logger.info(f"Reading config from {os.getenv('CONFIG_FILE', None)} (set in env)")
         with open(os.getenv("CONFIG_FILE"), "r") as cfg:
-            p = yaml.load(cfg, Loader=yaml.SafeLoader)
-            return get_env_config(p)
+            return yaml.load(cfg, Loader=yaml.SafeLoader)
     elif config_path is not None:
         logger.info(f"Reading config from {config_path} (program argument)")
         with open(config_path, "r") as cfg:
-            p = yaml.load(cfg, Loader=yaml.SafeLoader)
-            return get_env_config(p)
+            return yaml.load(cfg, Loader=yaml.SafeLoader)
     else:
         logger.info(f"No config specified.")
-        return get_env_config({})
+        return {}
+
+
+def get_config(config_path: str) -> Config:
+    return get_env_config(read_config_dict(config_path))
+
+
+def create_sql_server_to_csv(config: Config, metadata_ttl: float = 0) -> SqlServerToCsv:
+    return SqlServerToCsv(
+        username=config.db_username,
+        password=config.db_password,
+        host=config.db_host,
+        database=config.db_database,
+        destination=f"gs://{config.gcp_bucket}/sqlserver/{config.gcp_bq_dataset}",
+        type_overrides=config.type_overrides,
+        single_scan=config.single_scan,
+        isolation_level=config.isolation_level,
+        content_file_max_bytes=config.content_file_max_mb * 1024 * 1024 if config.content_file_max_mb > 0 else -1,
+        content_file_max_rows=config.content_file_max_rows,
+        metadata_ttl=metadata_ttl,
+        include_columns=config.include_columns,
+        exclude_columns=config.exclude_columns,
+        computed_columns=config.computed_columns,
+        spool_directory=config.spool_directory,
+        spool_max_bytes=config.spool_max_mb * 1024 * 1024 if config.spool_max_mb > 0 else -1,
+        spool_upload_threads=config.spool_upload_threads,
+        lob_fetch_batch_size=config.lob_fetch_batch_size,
+        lob_chunk_size=config.lob_chunk_size,
+        fetch_engine=config.fetch_engine,
+        read_replicas=config.read_replicas,
+        replica_max_lag_seconds=config.replica_max_lag_seconds,
+        replica_planning=config.replica_planning,
+    )
+
+
+def ingest(bigquery: SqlServerToBigquery, config: Config):
+    return bigquery.ingest_table(
+        threads=config.threads,
+        sql_server_table=config.db_table,
+        sql_server_schema=config.sql_server_schema,
+        static_source=config.static_source,
+        bigquery_destination_project=config.gcp_target_project,
+        bigquery_destination_dataset=config.gcp_bq_dataset,
+        split_size=config.split_size,
+        max_concurrent_queries=config.max_concurrent_queries,
+        adaptive_threads=config.adaptive_threads,
+        max_rows_per_second=config.max_rows_per_second,
+        split_stealing=config.split_stealing,
+        split_strategy=config.split_strategy,
+        incremental_column=config.incremental_column,
+        incremental_merge=config.incremental_merge,
+        incremental_lag_seconds=config.incremental_lag_seconds,
+    )
+
+
+def table_env_overrides(tables: List[dict]) -> List[str]:
+    """
+    Environment variables that would override an option of a table in the daemon config, DB_TABLE always would.
+    """
+    options = {"db_table"} | {o for t in tables for o in t if o not in ("cron", "interval")}
+    return sorted(o.upper() for o in options if os.getenv(o.upper()))
+
+
+def run_daemon(config_dict: dict):
+    """
+    Sync every table under tables in the config on its schedule, in one long running process.  Table entries take
+    the same options as the top level, which they override.
+    """
+    import signal
+    from database_to_bigquery.daemon import SyncDaemon, SyncJob, parse_schedule
+
+    daemon_options = config_dict.get("daemon", {}) or {}
+    metadata_ttl = float(daemon_options.get("metadata_ttl", 3600))
+    shared = {}
+
+    def bigquery_client():
+        # One client for all tables, it is thread safe and authenticating is not free.
+        if "bigquery_client" not in shared:
+            from google.cloud import bigquery
+
+            shared["bigquery_client"] = bigquery.Client()
+        return shared["bigquery_client"]
+
+    def create_job(table_options: dict) -> SyncJob:
+        table_config = get_env_config(dict(config_dict, **table_options))
+        warm = {}
+
+        def run():
+            if "bigquery" not in warm:
+                warm["bigquery"] = SqlServerToBigquery(
+                    sql_server_to_csv=create_sql_server_to_csv(table_config, metadata_ttl=metadata_ttl),
+                    bigquery_client=bigquery_client(),
+                )
+            return ingest(warm["bigquery"], table_config)
+
+        def evict():
+            bigquery = warm.pop("bigquery", None)
+            if bigquery:
+                bigquery.sql_server_to_csv.dispose()
+
+        return SyncJob(
+            name=f"{table_config.sql_server_schema}.{table_config.db_table}",
+            schedule=parse_schedule(table_options),
+            run=run,
+            evict=evict,
+        )
+
+    tables = config_dict.get("tables", None)
+    assert tables, "Missing tables in config, the daemon needs a list of tables with a cron or interval schedule"
+    overrides = table_env_overrides(tables)
+    assert not overrides, (
+        f"{', '.join(overrides)} set in the environment would override the options of the tables in the config, "
+        f"unset them or move them to the top level of the config"
+    )
+    daemon = SyncDaemon(
+        jobs=[create_job(t) for t in tables],
+        max_concurrent_syncs=int(daemon_options.get("max_concurrent_syncs", 2)),
+        status_port=int(daemon_options.get("status_port", 8080)),
+        max_warm=int(daemon_options.get("max_warm", 8)),
+        warm_ttl=float(daemon_options.get("warm_ttl", 3600)),
+    )
+    signal.signal(signal.SIGTERM, lambda *_: daemon.stop())
+    signal.signal(signal.SIGINT, lambda *_: daemon.stop())
+    daemon.run_forever()
 
 
 if __name__ == "__main__":
@@ -111,8 +361,27 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='A test program.')
 
     parser.add_argument("-c", "--config", help="path to yaml config file", type=str, default=None)
+    parser.add_argument(
+        "--plan",
+        help="show splits, cache hits and estimated query plans without extracting data",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--plan-estimate-only",
+        help="with --plan, estimate splits from catalog stats instead of running the split planning query",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--daemon",
+        help="keep running and sync the tables in the config on their schedules",
+        action="store_true",
+    )
 
     args = parser.parse_args()
+    if args.daemon:
+        run_daemon(read_config_dict(args.config))
+        raise SystemExit(0)
+
     config = get_config(config_path=args.config)
 
     logger.info(
@@ -121,23 +390,22 @@ if __name__ == "__main__":
         f"\n\rstatic_table: {config.static_source}"
     )
 
-    sql_server_to_csv = SqlServerToCsv(
-        username=config.db_username,
-        password=config.db_password,
-        host=config.db_host,
-        database=config.db_database,
-        destination=f"gs://{config.gcp_bucket}/sqlserver/{config.gcp_bq_dataset}",
-    )
+    sql_server_to_csv = create_sql_server_to_csv(config)
+
+    if args.plan:
+        plan = sql_server_to_csv.plan_table(
+            table=config.db_table,
+            sql_server_schema=config.sql_server_schema,
+            destination_folder=config.db_table,
+            static_source=config.static_source,
+            split_size=config.split_size,
+            split_strategy=config.split_strategy,
+            generate_splits=not args.plan_estimate_only,
+        )
+        logger.info(plan.full_str())
+        raise SystemExit(0)
 
     bigquery = SqlServerToBigquery(sql_server_to_csv=sql_server_to_csv)
 
-    result = bigquery.ingest_table(
-        threads=config.threads,
-        sql_server_table=config.db_table,
-        sql_server_schema=config.sql_server_schema,
-        static_source=config.static_source,
-        bigquery_destination_project=config.gcp_target_project,
-        bigquery_destination_dataset=config.gcp_bq_dataset,
-        split_size=config.split_size,
-    )
+    result = ingest(bigquery, config)
     logger.info(result.full_str())
@@ -25,6 +25,9 @@ setuptools.setup(
         "google-cloud-secret-manager>=2.4.0",
         "PyYAML>=5.4.1",
     ],
+    extras_require={
+        "arrow": ["pyarrow>=14.0.0", "arrow-odbc>=5.0.0"],
+    },
     packages=setuptools.find_packages(),
     include_package_data=True,
     zip_safe=False,
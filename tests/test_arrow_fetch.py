@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+import csv
+import io
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+
+from database_to_bigquery.base import Column
+from database_to_bigquery.sql_server import SqlServerToCsv
+from database_to_bigquery.type_mapping import SQL_SERVER_TO_BIGQUERY, TypeMapping
+
+pa = pytest.importorskip("pyarrow")
+arrow_fetch = pytest.importorskip("database_to_bigquery.arrow_fetch")
+
+CSV = SqlServerToCsv(username="u", password="p", host="h", database="d", destination="/tmp")
+
+
+def real(value: float) -> float:
+    """
+    A REAL value as pyodbc reads it, the float32 widened to a python float.
+    """
+    return pa.array([value], pa.float32()).to_pylist()[0]
+
+
+def nanoseconds(value: datetime) -> int:
+    return (value - datetime(1970, 1, 1)) // timedelta(microseconds=1) * 1000 + 700
+
+
+# SQL Server type -> the column, the arrow type arrow-odbc reads it as and the values as pyodbc reads them.
+COLUMNS = {
+    "BIGINT": (Column("BigInt", "BIGINT"), pa.int64(), [0, -(2 ** 63), 2 ** 63 - 1]),
+    "INT": (Column("Int", "INT"), pa.int32(), [1, -5, 2 ** 31 - 1]),
+    "SMALLINT": (Column("SmallInt", "SMALLINT"), pa.int16(), [1, -5, 300]),
+    "TINYINT": (Column("TinyInt", "TINYINT"), pa.uint8(), [0, 1, 255]),
+    "BIT": (Column("Bit", "BIT"), pa.bool_(), [True, False, True]),
+    "DECIMAL": (
+        Column("Decimal", "DECIMAL", precision=18, scale=2),
+        pa.decimal128(18, 2),
+        [Decimal("1.50"), Decimal("-0.50"), Decimal("0.00")],
+    ),
+    "NUMERIC": (
+        Column("Numeric", "NUMERIC", precision=38, scale=12),
+        pa.decimal128(38, 12),
+        [Decimal("12345678901234567890.123456789012"), Decimal("0.000000100000"), Decimal("-0.000000000001")],
+    ),
+    "MONEY": (Column("Money", "MONEY"), pa.decimal128(19, 4), [Decimal("1.0000"), Decimal("-922337203685477.5808"), Decimal("0.0001")]),
+    "SMALLMONEY": (Column("SmallMoney", "SMALLMONEY"), pa.decimal128(10, 4), [Decimal("0.0000"), Decimal("5.2500"), Decimal("-1.0000")]),
+    "FLOAT": (Column("Float", "FLOAT"), pa.float64(), [0.1, 1e20, -1e-7]),
+    "REAL": (Column("Real", "REAL"), pa.float32(), [real(0.1), real(1.5), real(3e38)]),
+    "DATE": (Column("Date", "DATE"), pa.date32(), [date(2024, 1, 2), date(1, 1, 1), date(9999, 12, 31)]),
+    "TIME": (Column("Time", "TIME"), pa.time64("us"), [time(3, 4, 5), time(23, 59, 59, 999999), time(0, 0, 0, 120)]),
+    "DATETIME": (
+        Column("DateTime", "DATETIME"),
+        pa.timestamp("ms"),
+        [datetime(2024, 1, 2, 3, 4, 5), datetime(2024, 1, 2, 3, 4, 5, 123000), datetime(1753, 1, 1)],
+    ),
+    "DATETIME2": (
+        Column("DateTime2", "DATETIME2"),
+        pa.timestamp("ns"),
+        [datetime(2024, 1, 2, 3, 4, 5), datetime(2024, 1, 2, 3, 4, 5, 1), datetime(2000, 2, 29, 12, 0, 0, 500000)],
+    ),
+    "SMALLDATETIME": (Column("SmallDateTime", "SMALLDATETIME"), pa.timestamp("s"), [datetime(2024, 1, 2, 3, 4)] * 3),
+    "CHAR": (Column("Char", "CHAR"), pa.string(), ["ab   ", "   ", "a,b "]),
+    "NCHAR": (Column("NChar", "NCHAR"), pa.string(), ["ab   ", "é  ", "   "]),
+    "VARCHAR": (Column("VarChar", "VARCHAR"), pa.string(), ["a,b", 'say "hi"', "line\r\nbreak"]),
+    "NVARCHAR": (Column("NVarChar", "NVARCHAR"), pa.string(), ["zero\x00byte", "ünïcödé ✓", ""]),
+    "UNIQUEIDENTIFIER": (
+        Column("Guid", "UNIQUEIDENTIFIER"),
+        pa.string(),
+        ["6F9619FF-8B86-D011-B42D-00C04FC964FF", "00000000-0000-0000-0000-000000000000", " "],
+    ),
+    "BINARY": (Column("Binary", "BINARY"), pa.binary(), [b"\x00\x01", b"\xff" * 5, b""]),
+    "VARBINARY": (Column("VarBinary", "VARBINARY"), pa.binary(), [b"abc", b"\x00", b"\xfb\xff"]),
+    "TIMESTAMP": (Column("RowVersion", "TIMESTAMP"), pa.binary(8), [b"\x00\x00\x00\x00\x00\x00\x07\xd1"] * 3),
+}
+# Not read with the arrow engine, see test_engine_falls_back.
+ROWS_ONLY = ["TEXT", "NTEXT", "XML", "IMAGE", "DATETIMEOFFSET"]
+
+
+def arrow_array(arrow_type, values: list) -> "pa.Array":
+    if pa.types.is_timestamp(arrow_type) and arrow_type.unit == "ns":
+        # What arrow-odbc reads has the 100 nanoseconds pyodbc drops.
+        return pa.array([None if v is None else nanoseconds(v) for v in values], pa.int64()).cast(arrow_type)
+    return pa.array(values, arrow_type)
+
+
+def row_csv(columns_type: list, rows: list, type_mapping: TypeMapping) -> str:
+    destination = io.StringIO()
+    writer = csv.DictWriter(destination, fieldnames=[c.name for c in columns_type], quotechar='"')
+    encoders = type_mapping.encoders(columns_type)
+    for row in rows:
+        writer.writerow(CSV.row_to_bq(row, encoders))
+    return destination.getvalue()
+
+
+def arrow_csv(columns_type: list, arrays: list, type_mapping: TypeMapping) -> str:
+    batch = pa.RecordBatch.from_arrays(arrays, names=[c.name for c in columns_type])
+    return arrow_fetch.batch_to_csv(arrow_fetch.encode_batch(batch, columns_type, type_mapping))
+
+
+def assert_same_csv(columns: list, type_mapping: TypeMapping = None):
+    type_mapping = type_mapping or TypeMapping()
+    columns_type = [c for c, _, _ in columns]
+    # Every value, then a row of NULLs.
+    values = [v + [None] for _, _, v in columns]
+    rows = [{c.name: v[i] for c, v in zip(columns_type, values)} for i in range(len(values[0]))]
+    arrays = [arrow_array(arrow_type, v) for (_, arrow_type, _), v in zip(columns, values)]
+    expected = row_csv(columns_type, rows, type_mapping)
+    assert arrow_csv(columns_type, arrays, type_mapping).encode("utf-8") == expected.encode("utf-8")
+
+
+def test_every_type_is_covered():
+    assert set(COLUMNS) | set(ROWS_ONLY) == set(SQL_SERVER_TO_BIGQUERY)
+
+
+@pytest.mark.parametrize("data_type", sorted(COLUMNS))
+def test_same_csv_as_row_path(data_type):
+    assert_same_csv([COLUMNS[data_type]])
+
+
+def test_same_csv_for_a_table_of_every_type():
+    assert_same_csv(list(COLUMNS.values()))
+
+
+@pytest.mark.parametrize(
+    "overrides",
+    [
+        {"DATETIME2": "DATETIME", "DECIMAL": "STRING", "BIT": "STRING"},
+        {"FLOAT": "NUMERIC", "INT": "BOOL", "DATE": "STRING"},
+    ],
+)
+def test_same_csv_with_type_overrides(overrides):
+    assert_same_csv(list(COLUMNS.values()), TypeMapping(overrides))
+
+
+def test_same_csv_without_strip_char():
+    assert_same_csv([COLUMNS["CHAR"]], TypeMapping(strip_char_type=False))
+
+
+def test_empty_batch():
+    assert_same_csv([(c, t, []) for c, t, _ in COLUMNS.values()])
+
+
+def test_engine_falls_back(monkeypatch):
+    csv_arrow = SqlServerToCsv(
+        username="u", password="p", host="h", database="d", destination="/tmp", fetch_engine="arrow"
+    )
+    monkeypatch.setattr(arrow_fetch, "available", lambda: True)
+    assert csv_arrow.fetch_engine_for(list(c for c, _, _ in COLUMNS.values())) == SqlServerToCsv.FETCH_ENGINE_ARROW
+    for data_type in ROWS_ONLY:
+        columns_type = [Column("Id", "INT"), Column("Value", data_type)]
+        assert csv_arrow.fetch_engine_for(columns_type) == SqlServerToCsv.FETCH_ENGINE_ROWS
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from database_to_bigquery.base import Column
+from database_to_bigquery.sql_server import SqlServerToCsv
+
+
+def sql_server_to_csv(**kwargs) -> SqlServerToCsv:
+    return SqlServerToCsv(username="u", password="p", host="h", database="d", destination="/tmp", **kwargs)
+
+
+def table_columns():
+    return [Column("Id", "INT"), Column("Name", "NVARCHAR"), Column("Notes", "NVARCHAR", max_length=-1)]
+
+
+def test_projection_is_case_insensitive():
+    csv = sql_server_to_csv(include_columns=["id", "NAME"])
+    assert csv.is_projected("Id") and csv.is_projected("Name")
+    assert not csv.is_projected("Notes")
+    csv = sql_server_to_csv(exclude_columns=["notes"])
+    assert csv.is_projected("Id") and not csv.is_projected("Notes")
+
+
+def test_projection_of_unknown_columns_fails():
+    sql_server_to_csv(include_columns=["ID"], exclude_columns=["notes"]).check_projection("dbo", "t", table_columns())
+    with pytest.raises(ValueError, match="Missing"):
+        sql_server_to_csv(include_columns=["Id", "Missing"]).check_projection("dbo", "t", table_columns())
+    with pytest.raises(ValueError, match="Nots"):
+        sql_server_to_csv(exclude_columns=["Nots"]).check_projection("dbo", "t", table_columns())
+
+
+def test_keyless_ignores_computed_columns():
+    columns = table_columns()
+    for c in columns:
+        c.pk = True
+    assert SqlServerToCsv.is_keyless(columns)
+    assert SqlServerToCsv.is_keyless(columns + [Column("Total", "COMPUTED", expression="Id * 2")])
+    columns[1].pk = False
+    assert not SqlServerToCsv.is_keyless(columns)
+
+
+def test_auto_strategy_hashes_keyless_table_with_computed_columns():
+    columns = table_columns()
+    for c in columns:
+        c.pk = True
+    columns.append(Column("Total", "COMPUTED", expression="Id * 2"))
+    buckets, partitioning = sql_server_to_csv().choose_split_strategy(
+        table="t",
+        sql_server_schema="dbo",
+        split_size=1000000,
+        split_strategy=SqlServerToCsv.SPLIT_STRATEGY_AUTO,
+        table_rows=3000000,
+        columns_type=columns,
+        primary_keys=[c.name for c in columns if c.pk],
+    )
+    assert buckets == 4
+    assert partitioning is None
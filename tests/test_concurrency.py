@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import pytest
+
+import main
+from database_to_bigquery import concurrency
+from database_to_bigquery.concurrency import AdaptiveConcurrency, SplitProgress
+
+
+class FakeClock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock(1000)
+    monkeypatch.setattr(concurrency, "time", clock)
+    monkeypatch.setattr(concurrency, "sleep", clock.sleep)
+    return clock
+
+
+def test_increase_by_one_per_split(clock):
+    c = AdaptiveConcurrency(initial=2, maximum=8)
+    c.on_split_done(rows=1000, elapsed=1, first_row_elapsed=0.1)
+    assert c.limit == 3
+    c.on_split_done(rows=1000, elapsed=1, first_row_elapsed=0.1)
+    assert c.limit == 4
+    assert [d[1:3] for d in c.decisions] == [(2, 3), (3, 4)]
+
+
+def test_capped_at_maximum(clock):
+    c = AdaptiveConcurrency(initial=2, maximum=3)
+    for _ in range(5):
+        c.on_split_done(rows=1000, elapsed=1, first_row_elapsed=0.1)
+    assert c.limit == 3
+    assert AdaptiveConcurrency(initial=20, maximum=3).limit == 3
+
+
+def test_backoff_on_time_to_first_row(clock):
+    c = AdaptiveConcurrency(initial=8, maximum=8)
+    c.on_split_done(rows=1000, elapsed=1, first_row_elapsed=0.1)
+    # Sub second first rows are noise, up to 1s is tolerated.
+    c.on_split_done(rows=1000, elapsed=1, first_row_elapsed=0.9)
+    assert c.limit == 8
+    c.on_split_done(rows=1000, elapsed=1, first_row_elapsed=1.5)
+    assert c.limit == 4
+
+
+def test_backoff_on_rows_per_second(clock):
+    c = AdaptiveConcurrency(initial=6, maximum=8)
+    c.on_split_done(rows=1000, elapsed=1, first_row_elapsed=0.1)
+    assert c.limit == 7
+    # Half the best rows/s is still tolerated, less is not.
+    c.on_split_done(rows=1000, elapsed=2, first_row_elapsed=0.1)
+    assert c.limit == 8
+    c.on_split_done(rows=1000, elapsed=3, first_row_elapsed=0.1)
+    assert c.limit == 4
+
+
+def test_backoff_stops_at_minimum(clock):
+    c = AdaptiveConcurrency(initial=2, minimum=2, maximum=8)
+    c.on_split_done(rows=1000, elapsed=1, first_row_elapsed=0.1)
+    for _ in range(3):
+        c.on_split_done(rows=1000, elapsed=10, first_row_elapsed=0.1)
+    assert c.limit == 2
+
+
+def test_fixed_limit_is_not_adaptive(clock):
+    c = AdaptiveConcurrency(initial=3, minimum=3, maximum=3)
+    assert not c.adaptive
+    c.on_split_done(rows=1000, elapsed=1, first_row_elapsed=0.1)
+    c.on_split_done(rows=1000, elapsed=100, first_row_elapsed=50)
+    assert c.limit == 3
+    assert c.decisions == []
+
+
+def test_acquire_blocks_at_limit():
+    c = AdaptiveConcurrency(initial=1, maximum=1)
+    c.acquire()
+    acquired = threading.Event()
+
+    def acquire():
+        c.acquire()
+        acquired.set()
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    assert not acquired.wait(0.1)
+    c.release()
+    assert acquired.wait(5)
+    thread.join()
+    assert c.active == 1
+
+
+def test_throttle(clock):
+    c = AdaptiveConcurrency(max_rows_per_second=100)
+    c.throttle(50)
+    assert clock.now == 1000.5
+    clock.now += 2
+    # Below the cap after the pause, no sleep.
+    c.throttle(100)
+    assert clock.now == 1002.5
+
+
+def config(monkeypatch, **options) -> main.Config:
+    for name in ["THREADS", "ADAPTIVE_THREADS", "MAX_CONCURRENT_QUERIES"]:
+        monkeypatch.delenv(name, raising=False)
+    return main.get_env_config(
+        dict(
+            db_username="u",
+            db_password="p",
+            db_host="h",
+            db_database="d",
+            gcs_bucket="b",
+            bq_dataset="ds",
+            target_gcp_project="p",
+            db_table="t",
+            **options,
+        )
+    )
+
+
+def test_threads_zero_is_not_adaptive(monkeypatch):
+    c = config(monkeypatch, threads=0)
+    assert c.threads == 0
+    assert not c.adaptive_threads
+    assert config(monkeypatch, adaptive_threads="true").adaptive_threads
+
+
+def covered_rows(progress: SplitProgress, pieces: list) -> list:
+    rows = list(range(progress.row_from, progress.row_to))
+    for piece in pieces:
+        rows += range(piece.row_from, piece.row_to)
+    return sorted(rows)
+
+
+@pytest.mark.parametrize(
+    "row_from, row_to, done, pieces, margin, min_rows",
+    [
+        (1, 101, 0, 4, 0, 1),
+        (1, 101, 10, 3, 5, 1),
+        (1, 102, 7, 4, 3, 10),
+        (1001, 2001, 500, 7, 100, 1),
+        (1, 11, 0, 20, 0, 1),
+    ],
+)
+def test_cut_covers_the_range_exactly(row_from, row_to, done, pieces, margin, min_rows):
+    progress = SplitProgress(split_id=1, part_id="", row_from=row_from, row_to=row_to)
+    progress.advance(done)
+    cut = progress.cut(pieces=pieces, margin=margin, min_rows=min_rows)
+    assert len(cut) >= 1
+    assert covered_rows(progress, cut) == list(range(row_from, row_to))
+    # The worker keeps what it read and the margin.
+    assert progress.row_to >= row_from + done + margin
+    assert all(p.row_to - p.row_from >= min_rows for p in cut)
+
+
+def test_cut_refused_by_margin():
+    progress = SplitProgress(split_id=1, part_id="", row_from=1, row_to=101)
+    progress.advance(90)
+    assert progress.cut(pieces=4, margin=10, min_rows=1) == []
+    assert progress.row_to == 101
+
+
+def test_cut_refused_by_min_rows():
+    progress = SplitProgress(split_id=1, part_id="", row_from=1, row_to=101)
+    progress.advance(50)
+    # 50 rows left, two pieces of at least 26 do not fit.
+    assert progress.cut(pieces=4, margin=0, min_rows=26) == []
+    assert progress.row_to == 101
+    assert len(progress.cut(pieces=4, margin=0, min_rows=25)) == 1
+
+
+def test_advance_stops_at_the_cut():
+    progress = SplitProgress(split_id=1, part_id="", row_from=1, row_to=101)
+    assert progress.advance(20) == 20
+    cut = progress.cut(pieces=2, margin=10, min_rows=1)
+    # Rows 1-20 are read, 21-30 are the margin, the remaining 70 rows are halved.
+    assert (progress.row_to, cut[0].row_from, cut[0].row_to) == (66, 66, 101)
+    assert progress.advance(40) == 40
+    assert progress.advance(40) == 5
+    assert progress.advance(40) == 0
+    assert progress.done == 65
+
+
+def test_cut_open_end():
+    progress = SplitProgress(split_id=1, part_id="", row_from=1, row_to=101, open_end=True)
+    cut = progress.cut(pieces=3, margin=0, min_rows=1)
+    assert not progress.open_end
+    assert [p.open_end for p in cut] == [False, True]
+    # The last piece reads to the end of the split, past the estimate.
+    assert cut[-1].advance(1000) == 1000
+    assert progress.advance(1000) == progress.row_to - progress.row_from
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from database_to_bigquery.sql_server import RollingContentFile
+
+HEADER = "a,b\r\n"
+
+
+def content_file(tmp_path, **kwargs) -> RollingContentFile:
+    return RollingContentFile(
+        location=lambda part: str(tmp_path / f"t-content-1{f'-{part}' if part else ''}.csv"), header=HEADER, **kwargs
+    )
+
+
+def read(location: str) -> str:
+    with open(location, encoding="utf-8", newline="") as f:
+        return f.read()
+
+
+def rows_of(locations: list) -> list:
+    """
+    The rows of each file, checking every file starts with the header.
+    """
+    files = []
+    for location in locations:
+        content = read(location)
+        assert content.startswith(HEADER)
+        files.append(content[len(HEADER):].splitlines(keepends=True))
+    return files
+
+
+def test_roll_over_by_rows(tmp_path):
+    rows = [f"{i},x\r\n" for i in range(10)]
+    with content_file(tmp_path, max_rows=3) as files:
+        for row in rows:
+            files.write(row)
+    assert files.locations == [
+        str(tmp_path / "t-content-1.csv"),
+        str(tmp_path / "t-content-1-1.csv"),
+        str(tmp_path / "t-content-1-2.csv"),
+        str(tmp_path / "t-content-1-3.csv"),
+    ]
+    assert [len(f) for f in rows_of(files.locations)] == [3, 3, 3, 1]
+    assert sum(rows_of(files.locations), []) == rows
+
+
+def test_exactly_full_does_not_leave_an_empty_file(tmp_path):
+    with content_file(tmp_path, max_rows=2) as files:
+        for i in range(4):
+            files.write(f"{i},x\r\n")
+    assert [len(f) for f in rows_of(files.locations)] == [2, 2]
+
+
+def test_roll_over_by_utf8_bytes(tmp_path):
+    # 10 bytes in utf-8, 7 characters.
+    rows = [f"{i},éééé\r\n" for i in range(10)]
+    with content_file(tmp_path, max_bytes=25) as files:
+        for row in rows:
+            files.write(row)
+    # A file rolls over once it has max_bytes, so holds up to one row more.  The header is not counted.
+    assert [len(f) for f in rows_of(files.locations)] == [3, 3, 3, 1]
+    assert sum(rows_of(files.locations), []) == rows
+
+
+def test_row_in_pieces_is_not_split_over_files(tmp_path):
+    with content_file(tmp_path, max_bytes=10) as files:
+        files.write_row(iter(["1,", "x" * 30, "\r\n"]))
+        files.write_row(iter(["2,", "y" * 30, "\r\n"]))
+    assert rows_of(files.locations) == [[f"1,{'x' * 30}\r\n"], [f"2,{'y' * 30}\r\n"]]
+
+
+def test_write_rows_rolls_before_the_batch(tmp_path):
+    with content_file(tmp_path, max_rows=4) as files:
+        files.write_rows("1,x\r\n2,x\r\n3,x\r\n", rows=3)
+        # Below the limit before the batch, so the whole batch goes to the first file.
+        files.write_rows("4,x\r\n5,x\r\n6,x\r\n", rows=3)
+        files.write_rows("7,x\r\n", rows=1)
+    assert [len(f) for f in rows_of(files.locations)] == [6, 1]
+
+
+def test_empty_split_gets_a_header_only_file(tmp_path):
+    with content_file(tmp_path, max_rows=3) as files:
+        pass
+    assert files.locations == [str(tmp_path / "t-content-1.csv")]
+    assert read(files.locations[0]) == HEADER
+
+
+@pytest.mark.parametrize("max_rows, max_bytes", [(-1, -1), (0, 0)])
+def test_no_limit(tmp_path, max_rows, max_bytes):
+    with content_file(tmp_path, max_rows=max_rows, max_bytes=max_bytes) as files:
+        for i in range(100):
+            files.write(f"{i},x\r\n")
+    assert len(files.locations) == 1
+    assert len(rows_of(files.locations)[0]) == 100
+
+
+def write_split(monkeypatch, tmp_path, max_rows: int, rows: list = None):
+    from test_splits import COLUMNS, sql_server_to_csv, table_rows
+
+    csv = sql_server_to_csv(monkeypatch, rows if rows is not None else table_rows(), {})
+    csv.destination = str(tmp_path)
+    (tmp_path / "t").mkdir(exist_ok=True)
+    csv.content_file_max_rows = max_rows
+    split = {"split_size": -1, "internal_split": 1, "cnt": 1000, "crc": "STATIC"}
+    cnt, _, _, locations = csv.write_split_to_destination(
+        split=split, destination_folder="t", table="t", schema="main", columns_type=COLUMNS, split_keys=["Id"]
+    )
+    return csv, split, cnt, locations
+
+
+def test_content_files_are_listed_in_the_crc(monkeypatch, tmp_path):
+    import json
+
+    csv, split, cnt, locations = write_split(monkeypatch, tmp_path, max_rows=300)
+    base = f"{tmp_path}/t/t"
+    assert cnt == 1000
+    assert locations == [f"{base}-content-1.csv"] + [f"{base}-content-1-{part}.csv" for part in [1, 2, 3]]
+    with open(f"{base}-1.crc", encoding="utf-8") as crc:
+        assert json.loads(crc.read())[csv.CRC_CONTENT_FILES] == locations
+    assert csv.crc_content_files(f"{base}-1.crc", default=None) == locations
+    cached = csv.cached_split_result(split, "t")
+    assert cached.cache_hit and cached.content_files == locations
+    # The rows of all files together, in order.
+    ids = [int(row.split(",")[0]) for f in rows_of_csv(locations) for row in f]
+    assert ids == list(range(1000))
+
+
+def rows_of_csv(locations: list) -> list:
+    files = []
+    for location in locations:
+        lines = read(location).splitlines()
+        assert lines[0] == "Id,Part,Name"
+        files.append(lines[1:])
+    return files
+
+
+def test_missing_content_file_is_not_a_cache_hit(monkeypatch, tmp_path):
+    import os
+
+    csv, split, _, locations = write_split(monkeypatch, tmp_path, max_rows=300)
+    os.remove(locations[2])
+    assert not csv.destination_result_exists(split, "t")
+
+
+def test_files_no_longer_listed_are_removed(monkeypatch, tmp_path):
+    import os
+
+    _, _, _, before = write_split(monkeypatch, tmp_path, max_rows=300)
+    csv, split, _, after = write_split(monkeypatch, tmp_path, max_rows=600)
+    assert after == before[:2]
+    assert [os.path.exists(location) for location in before] == [True, True, False, False]
+    # Removing orphans keeps every file of the split.
+    result = csv.cached_split_result(split, "t")
+    csv.remove_orphaned_files(f"{tmp_path}/t/t", [result])
+    assert all(os.path.exists(location) for location in after)
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+import csv
+import io
+import random
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from database_to_bigquery.base import Column
+from database_to_bigquery.sql_server import SqlServerToCsv, csv_row_pieces, has_large_value
+from database_to_bigquery.type_mapping import TypeMapping
+
+COLUMNS = [
+    Column("Id", "INT"),
+    Column("Notes", "NVARCHAR", max_length=-1),
+    Column("Code", "CHAR", max_length=10),
+    Column("Price", "DECIMAL", precision=18, scale=2),
+    Column("Doc", "VARBINARY", max_length=-1),
+    Column("Changed", "DATETIME2"),
+    Column("Body", "NTEXT"),
+]
+NAMES = [c.name for c in COLUMNS]
+SQL_SERVER_TO_CSV = SqlServerToCsv(username="u", password="p", host="h", database="d", destination="/tmp")
+
+
+def dict_writer(row: dict, encoders: dict) -> str:
+    out = io.StringIO(newline="")
+    csv.DictWriter(out, fieldnames=NAMES, quotechar='"').writerow(
+        SQL_SERVER_TO_CSV.row_to_bq(row, encoders)
+    )
+    return out.getvalue()
+
+
+def pieces(row: dict, encoders: dict, chunked: dict, chunk_size: int) -> str:
+    return "".join(csv_row_pieces(row, NAMES, encoders, chunked, chunk_size))
+
+
+def row(**values) -> dict:
+    base = {
+        "Id": 1,
+        "Notes": "note",
+        "Code": "AB   ",
+        "Price": Decimal("12.50"),
+        "Doc": b"\x00\x01binary",
+        "Changed": datetime(2024, 1, 2, 3, 4, 5, 678000),
+        "Body": "body",
+    }
+    base.update(values)
+    return base
+
+
+LARGE_TEXTS = [
+    "plain text without anything special " * 4,
+    'with "quotes" and ""double quotes"" ' * 4,
+    "with, commas, everywhere, " * 4,
+    "line\nbreaks\r\nand\rreturns " * 4,
+    "null\x00terminations\x00 inside " * 4,
+    '"' * 100,
+    "\r\n" * 50,
+    "unicode æøå 漢字 🙂 " * 6,
+    " leading and trailing spaces " * 4,
+]
+
+
+@pytest.mark.parametrize("text", LARGE_TEXTS)
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 16, 64])
+def test_large_text_matches_dict_writer(text, chunk_size):
+    mapping = TypeMapping()
+    encoders = mapping.encoders(COLUMNS)
+    chunked = mapping.chunked_encoders(COLUMNS)
+    for r in [row(Notes=text), row(Body=text), row(Notes=text, Body=text[::-1]), row(Notes=text, Id=None)]:
+        assert has_large_value(r, chunked, chunk_size)
+        assert pieces(r, encoders, chunked, chunk_size) == dict_writer(r, encoders)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 4, 5, 64])
+def test_large_bytes_match_dict_writer(chunk_size):
+    mapping = TypeMapping()
+    encoders = mapping.encoders(COLUMNS)
+    chunked = mapping.chunked_encoders(COLUMNS)
+    for size in [65, 66, 67, 100, 301]:
+        r = row(Doc=(bytes(range(256)) * 2)[:size])
+        assert pieces(r, encoders, chunked, chunk_size) == dict_writer(r, encoders)
+
+
+def test_none_and_empty_values_around_large_values():
+    mapping = TypeMapping()
+    encoders = mapping.encoders(COLUMNS)
+    chunked = mapping.chunked_encoders(COLUMNS)
+    large = 'x"y,' * 20
+    cases = [
+        dict.fromkeys(NAMES, None),
+        dict(dict.fromkeys(NAMES, None), Notes=large),
+        dict(dict.fromkeys(NAMES, None), Body=large),
+        dict(dict.fromkeys(NAMES, ""), Body=large, Doc=None),
+        dict(dict.fromkeys(NAMES, None), Notes=large, Body=large),
+        row(Id=None, Notes=large, Code=None, Price=None, Doc=None, Changed=None, Body=None),
+        row(Notes="", Body=large),
+    ]
+    for r in cases:
+        assert pieces(r, encoders, chunked, 8) == dict_writer(r, encoders)
+
+
+def test_only_large_lob_values_are_chunked():
+    mapping = TypeMapping()
+    chunked = mapping.chunked_encoders(COLUMNS)
+    assert set(chunked) == {"Notes", "Doc", "Body"}
+    assert not has_large_value(row(), chunked, 100)
+    assert has_large_value(row(Doc=b"x" * 101), chunked, 100)
+    # Columns loaded as something else than STRING or BYTES are written whole.
+    assert "Notes" not in TypeMapping({"Notes": "INT64"}).chunked_encoders(COLUMNS)
+
+
+def test_random_rows_match_dict_writer():
+    rng = random.Random(42)
+    alphabet = 'ab ,"\r\n\x00æ漢🙂'
+    mapping = TypeMapping()
+    encoders = mapping.encoders(COLUMNS)
+    chunked = mapping.chunked_encoders(COLUMNS)
+
+    def text():
+        if rng.random() < 0.2:
+            return None
+        return "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+
+    for _ in range(2000):
+        r = row(
+            Id=rng.choice([None, rng.randint(-1000, 1000)]),
+            Notes=text(),
+            Code=text(),
+            Doc=rng.choice([None, bytes(rng.randrange(256) for _ in range(rng.randint(0, 40)))]),
+            Body=text(),
+        )
+        chunk_size = rng.randint(1, 20)
+        assert pieces(r, encoders, chunked, chunk_size) == dict_writer(r, encoders)
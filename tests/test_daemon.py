@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+
+import pytest
+
+from database_to_bigquery import daemon
+from database_to_bigquery.daemon import CronSchedule, IntervalSchedule, SyncDaemon, SyncJob, parse_schedule
+
+
+def next_run(expression: str, after: datetime) -> datetime:
+    return datetime.fromtimestamp(CronSchedule(expression).next_after(after.timestamp()))
+
+
+class FakeClock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock(datetime(2024, 1, 1, 12, 0).timestamp())
+    monkeypatch.setattr(daemon, "time", clock)
+    return clock
+
+
+def test_cron_steps():
+    schedule = CronSchedule("*/15 */6 * * *")
+    assert schedule.minutes == {0, 15, 30, 45}
+    assert schedule.hours == {0, 6, 12, 18}
+    assert CronSchedule("5/20 * * * *").minutes == {5, 25, 45}
+    assert CronSchedule("1-10/3 * * * *").minutes == {1, 4, 7, 10}
+    assert next_run("*/15 * * * *", datetime(2024, 1, 1, 10, 7, 30)) == datetime(2024, 1, 1, 10, 15)
+
+
+def test_cron_ranges_and_lists():
+    schedule = CronSchedule("0 9-11,14 * * 1-5")
+    assert schedule.hours == {9, 10, 11, 14}
+    assert schedule.weekdays == {1, 2, 3, 4, 5}
+    # Friday 14:00 is the last run of the week, the next is Monday 09:00.
+    assert next_run("0 9-11,14 * * 1-5", datetime(2024, 1, 5, 14, 0)) == datetime(2024, 1, 8, 9, 0)
+
+
+def test_cron_next_is_strictly_after():
+    assert next_run("30 10 * * *", datetime(2024, 1, 1, 10, 30)) == datetime(2024, 1, 2, 10, 30)
+    assert next_run("30 10 * * *", datetime(2024, 1, 1, 10, 29, 59)) == datetime(2024, 1, 1, 10, 30)
+
+
+def test_cron_sunday_as_0_or_7():
+    assert CronSchedule("0 0 * * 7").weekdays == {0}
+    # 2024-01-07 is a Sunday.
+    assert next_run("0 0 * * 7", datetime(2024, 1, 1)) == datetime(2024, 1, 7)
+    assert next_run("0 0 * * 0", datetime(2024, 1, 1)) == datetime(2024, 1, 7)
+    assert next_run("0 0 * * 5-7", datetime(2024, 1, 6, 12)) == datetime(2024, 1, 7)
+
+
+def test_cron_day_of_month_or_day_of_week():
+    # Both restricted: the 15th, or any Monday.  2024-01-08 is a Monday.
+    assert next_run("0 0 15 * 1", datetime(2024, 1, 2)) == datetime(2024, 1, 8)
+    assert next_run("0 0 15 * 1", datetime(2024, 1, 8)) == datetime(2024, 1, 15)
+    assert next_run("0 0 15 * 1", datetime(2024, 1, 15)) == datetime(2024, 1, 22)
+    # Only one restricted: that one alone decides.
+    assert next_run("0 0 15 * *", datetime(2024, 1, 2)) == datetime(2024, 1, 15)
+    assert next_run("0 0 * * 1", datetime(2024, 1, 2)) == datetime(2024, 1, 8)
+
+
+def test_cron_months_and_leap_day():
+    assert next_run("0 0 1 3,9 *", datetime(2024, 4, 1)) == datetime(2024, 9, 1)
+    assert next_run("0 0 29 2 *", datetime(2024, 3, 1)) == datetime(2028, 2, 29)
+
+
+@pytest.mark.parametrize(
+    "expression", ["* * * *", "60 * * * *", "* 24 * * *", "* * 0 * *", "* * * 13 *", "5-1 * * * *", "*/0 * * * *"]
+)
+def test_cron_invalid(expression):
+    with pytest.raises(ValueError):
+        CronSchedule(expression)
+
+
+def test_cron_never_matches():
+    with pytest.raises(ValueError):
+        CronSchedule("0 0 31 2 *").next_after(datetime(2024, 1, 1).timestamp())
+
+
+def test_parse_schedule():
+    assert isinstance(parse_schedule({"cron": "* * * * *"}), CronSchedule)
+    assert parse_schedule({"interval": "30"}).seconds == 30
+    with pytest.raises(ValueError):
+        parse_schedule({})
+    with pytest.raises(ValueError):
+        IntervalSchedule(0)
+
+
+def test_run_on_schedule(clock):
+    job = SyncJob("t", IntervalSchedule(60), run=lambda: "done")
+    assert job.next_run == clock.now
+    SyncDaemon([job], status_port=0)._run(job)
+    assert job.last_result == "done"
+    assert job.next_run == job.last_start + 60
+    assert not job.busy
+
+
+def test_skip_missed_runs(clock):
+    def slow_run():
+        clock.now += 250
+
+    job = SyncJob("t", IntervalSchedule(60), run=slow_run)
+    start = clock.now
+    SyncDaemon([job], status_port=0)._run(job)
+    # Runs at start + 60, 120, 180 and 240 were missed, the next is counted from the end.
+    assert job.last_end == start + 250
+    assert job.next_run == start + 310
+
+
+def test_failed_run(clock):
+    def failing_run():
+        raise RuntimeError("boom")
+
+    job = SyncJob("t", IntervalSchedule(60), run=failing_run)
+    d = SyncDaemon([job], status_port=0)
+    d._run(job)
+    assert job.failures == 1
+    assert job.last_error == "boom"
+    assert d.health()["failing"] == ["t"]
+
+
+def warm_jobs(clock, count: int):
+    evicted = []
+    jobs = []
+    for i in range(count):
+        job = SyncJob(f"t{i}", IntervalSchedule(60), run=lambda: None, evict=lambda name=f"t{i}": evicted.append(name))
+        jobs.append(job)
+    return jobs, evicted
+
+
+def test_evict_after_ttl(clock):
+    jobs, evicted = warm_jobs(clock, 2)
+    d = SyncDaemon(jobs, status_port=0, warm_ttl=100)
+    d._run(jobs[0])
+    clock.now += 50
+    d._run(jobs[1])
+    clock.now += 60
+    d._evict(clock.now)
+    assert evicted == ["t0"]
+    assert not jobs[0].warm and jobs[1].warm
+
+
+def test_evict_least_recently_used(clock):
+    jobs, evicted = warm_jobs(clock, 3)
+    d = SyncDaemon(jobs, status_port=0, max_warm=2, warm_ttl=3600)
+    for job in [jobs[1], jobs[0], jobs[2]]:
+        d._run(job)
+        clock.now += 1
+    d._evict(clock.now)
+    assert evicted == ["t1"]
+    assert [j.warm for j in jobs] == [True, False, True]
+
+
+def test_evict_skips_busy_jobs(clock):
+    jobs, evicted = warm_jobs(clock, 2)
+    d = SyncDaemon(jobs, status_port=0, max_warm=1, warm_ttl=3600)
+    d._run(jobs[0])
+    clock.now += 1
+    d._run(jobs[1])
+    jobs[0].queued = True
+    d._evict(clock.now)
+    # The least recently used job is queued to run again, the other is evicted instead.
+    assert evicted == ["t1"]
+
+
+def test_stop_evicts_warm_jobs(clock):
+    jobs, evicted = warm_jobs(clock, 2)
+    d = SyncDaemon(jobs, status_port=0, warm_ttl=3600)
+    d._run(jobs[1])
+    d.stop()
+    d.run_forever(poll_seconds=0)
+    assert evicted == ["t1"]
+    assert not any(j.warm for j in jobs)
+
+
+def test_table_options_in_environment(monkeypatch):
+    import main
+
+    tables = [{"db_table": "Orders", "interval": 900, "threads": 4}, {"db_table": "Customers", "cron": "0 2 * * *"}]
+    for name in ["DB_TABLE", "THREADS", "SPLIT_SIZE", "INTERVAL"]:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("INTERVAL", "60")
+    monkeypatch.setenv("SPLIT_SIZE", "1000")
+    # Options no table sets may come from the environment.
+    assert main.table_env_overrides(tables) == []
+    monkeypatch.setenv("THREADS", "8")
+    monkeypatch.setenv("DB_TABLE", "Orders")
+    assert main.table_env_overrides(tables) == ["DB_TABLE", "THREADS"]
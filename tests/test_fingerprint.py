@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+from database_to_bigquery.base import Column, CopyResult
+from database_to_bigquery.sql_server import SqlServerToBigquery, SqlServerToCsv
+
+LABEL = SqlServerToBigquery.FINGERPRINT_LABEL
+
+
+class FakeTable:
+    def __init__(self, table_id: str, labels: dict = None):
+        self.table_id = table_id
+        self.labels = labels
+
+
+class FakeClient:
+    """
+    Stands in for the BigQuery client, with the tables by id.
+    """
+
+    def __init__(self, tables: dict):
+        self.tables = tables
+        self.updates = []
+
+    def get_table(self, table_id: str) -> FakeTable:
+        if table_id not in self.tables:
+            raise Exception(f"Not found: Table {table_id}")
+        return self.tables[table_id]
+
+    def update_table(self, table: FakeTable, fields: list):
+        self.updates.append((table.table_id, fields, dict(table.labels)))
+
+
+def bigquery(tables: dict = None) -> SqlServerToBigquery:
+    csv = SqlServerToCsv(username="u", password="p", host="h", database="d", destination="/tmp")
+    return SqlServerToBigquery(sql_server_to_csv=csv, bigquery_client=FakeClient(tables or {}))
+
+
+def copy_result(content_digest="abc", base_path="gs://b/t/100", columns=None) -> CopyResult:
+    return CopyResult(
+        table_name="t",
+        table_rows=10,
+        schema_name="dbo",
+        base_path=base_path,
+        elapsed_time=1,
+        split_results=[],
+        column_type=columns or [Column("Id", "INT"), Column("Name", "NVARCHAR")],
+        content_digest=content_digest,
+    )
+
+
+def test_load_fingerprint():
+    b = bigquery()
+    fingerprint = b.load_fingerprint(copy_result())
+    assert fingerprint == b.load_fingerprint(copy_result())
+    assert len(fingerprint) <= 63
+    assert fingerprint != b.load_fingerprint(copy_result(content_digest="abd"))
+    assert fingerprint != b.load_fingerprint(copy_result(base_path="gs://b/t/200"))
+    # Another BigQuery type for a column is another load.
+    assert fingerprint != b.load_fingerprint(copy_result(columns=[Column("Id", "INT"), Column("Name", "INT")]))
+    # Not every split was copied.
+    assert b.load_fingerprint(copy_result(content_digest=None)) is None
+
+
+def test_same_fingerprint_is_skipped():
+    b = bigquery({"p.d.t": FakeTable("p.d.t", {LABEL: "f1", "team": "x"})})
+    assert not b.should_load_table(copy_result(), "p.d.t", "f1")
+
+
+def test_changed_fingerprint_is_loaded():
+    b = bigquery({"p.d.t": FakeTable("p.d.t", {LABEL: "f1"})})
+    assert b.should_load_table(copy_result(), "p.d.t", "f2")
+
+
+def test_missing_label_or_table_is_loaded():
+    b = bigquery({"p.d.t": FakeTable("p.d.t", None), "p.d.u": FakeTable("p.d.u", {"team": "x"})})
+    assert b.should_load_table(copy_result(), "p.d.t", "f1")
+    assert b.should_load_table(copy_result(), "p.d.u", "f1")
+    assert b.should_load_table(copy_result(), "p.d.missing", "f1")
+
+
+def test_none_fingerprint_is_always_loaded():
+    b = bigquery({"p.d.t": FakeTable("p.d.t", {LABEL: None})})
+    assert b.should_load_table(copy_result(content_digest=None), "p.d.t", None)
+
+
+def test_stamp_fingerprint():
+    table = FakeTable("p.d.t", {"team": "x"})
+    b = bigquery({"p.d.t": table})
+    b.stamp_fingerprint(table, "f1")
+    assert b.bigquery_client.updates == [("p.d.t", ["labels"], {"team": "x", LABEL: "f1"})]
+    assert not b.should_load_table(copy_result(), "p.d.t", "f1")
+    # Already labeled, not updated again.
+    b.stamp_fingerprint(table, "f1")
+    assert len(b.bigquery_client.updates) == 1
+
+
+def test_stamp_none_removes_the_label():
+    table = FakeTable("p.d.t", {LABEL: "f1"})
+    b = bigquery({"p.d.t": table})
+    b.stamp_fingerprint(table, None)
+    # A label set to None is removed by BigQuery.
+    assert b.bigquery_client.updates == [("p.d.t", ["labels"], {LABEL: None})]
+    assert b.should_load_table(copy_result(), "p.d.t", "f1")
+    # Nothing to remove.
+    b.stamp_fingerprint(FakeTable("p.d.u", {"team": "x"}), None)
+    assert len(b.bigquery_client.updates) == 1
+
+
+def test_failing_stamp_does_not_fail_the_load():
+    class FailingClient(FakeClient):
+        def update_table(self, table, fields):
+            raise Exception("Forbidden")
+
+    b = bigquery()
+    b._bigquery_client = FailingClient({})
+    b.stamp_fingerprint(FakeTable("p.d.t", {}), "f1")
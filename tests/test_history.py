@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from database_to_bigquery.sql_server import SplitResult, SqlServerToCsv
+
+CSV = SqlServerToCsv(username="u", password="p", host="h", database="d", destination="/tmp")
+
+
+def split(split_id: int, cnt: int, crc=0) -> dict:
+    return {"internal_split": split_id, "split_size": 100, "cnt": cnt, "crc": crc}
+
+
+def test_makespan_on_one_thread_is_the_sum():
+    assert CSV.predict_makespan([3, 1, 2], threads=1) == 6
+    # Serial copies, THREADS=0, run on one thread.
+    assert CSV.predict_makespan([3, 1, 2], threads=0) == 6
+
+
+def test_makespan_longest_first():
+    # 8 and 7 each take a thread, then 5, 4 and 3 fill the least loaded.
+    assert CSV.predict_makespan([3, 8, 4, 7, 5], threads=2) == 15
+    # 5, 5 and 4 each take a thread, the 3s go to the 4 and a 5.
+    assert CSV.predict_makespan([5, 5, 4, 3, 3], threads=3) == 8
+
+
+def test_makespan_more_threads_than_splits():
+    assert CSV.predict_makespan([2, 9, 4], threads=8) == 9
+    assert CSV.predict_makespan([], threads=4) == 0
+
+
+def test_predict_without_history():
+    splits = {1: split(1, 100), 2: split(2, 200)}
+    assert CSV.predict_split_seconds(splits, {}) == {1: None, 2: None}
+
+
+def test_predict_from_history():
+    splits = {1: split(1, 100, crc=1), 2: split(2, 300, crc=2), 3: split(3, 50, crc=3)}
+    history = {
+        # Not changed since, a cache hit.
+        1: {"digest": CSV.split_digest(splits[1]), "cnt": 100, "elapsed": 4},
+        # Changed, scaled to its rows now.
+        2: {"digest": "old", "cnt": 200, "elapsed": 10},
+    }
+    predictions = CSV.predict_split_seconds(splits, history)
+    assert predictions[1] == 0
+    assert predictions[2] == pytest.approx(15)
+    # Never timed, the average of the table: 14 seconds for 300 rows.
+    assert predictions[3] == pytest.approx(50 * 14 / 300)
+
+
+def test_predict_history_without_timings():
+    splits = {1: split(1, 100), 2: split(2, 100)}
+    # A split only ever cached has no timing to predict from.
+    history = {1: {"digest": "old", "cnt": 100}}
+    assert CSV.predict_split_seconds(splits, history) == {1: None, 2: None}
+
+
+def test_history_round_trip(tmp_path):
+    base = str(tmp_path / "t-100")
+    assert CSV.read_history(base) == {}
+    splits = {1: split(1, 100), 2: split(2, 200)}
+    results = [
+        SplitResult(content_file="", crc_file="", elapsed=3, cache_hit=False, row_count=100, split_id=1),
+        SplitResult(content_file="", crc_file="", elapsed=0.1, cache_hit=True, row_count=-1, split_id=2),
+    ]
+    CSV.write_history(base, splits, results, {2: {"digest": "old", "cnt": 150, "elapsed": 6}})
+    history = CSV.read_history(base)
+    assert history[1] == {"digest": CSV.split_digest(splits[1]), "cnt": 100, "elapsed": 3}
+    # A cache hit keeps the timing of when it was last read.
+    assert history[2] == {"digest": CSV.split_digest(splits[2]), "cnt": 200, "elapsed": 6}
+    assert CSV.predict_split_seconds(splits, history) == {1: 0, 2: 0}
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import json
+from datetime import date, datetime, timedelta, timezone
+
+from database_to_bigquery.base import Column
+from database_to_bigquery.sql_server import SqlServerToCsv, decode_watermark, encode_watermark
+
+
+def sql_server_to_csv() -> SqlServerToCsv:
+    return SqlServerToCsv(username="u", password="p", host="h", database="d", destination="/tmp")
+
+
+def test_rowversion_high_is_below_active_transactions():
+    sql = sql_server_to_csv().incremental_high_sql("t", "dbo", Column("rv", "TIMESTAMP"))
+    assert "MIN_ACTIVE_ROWVERSION()" in sql
+    assert "- 1" in sql
+
+
+def test_date_high_with_lag():
+    csv = sql_server_to_csv()
+    assert csv.incremental_high_sql("t", "dbo", Column("m", "DATETIME2")) == "SELECT MAX(m) AS high FROM dbo.t"
+    sql = csv.incremental_high_sql("t", "dbo", Column("m", "DATETIME2"), lag_seconds=1.5)
+    assert sql.endswith("WHERE m <= DATEADD(MILLISECOND, -1500, SYSDATETIME())")
+    sql = csv.incremental_high_sql("t", "dbo", Column("m", "DATETIMEOFFSET"), lag_seconds=1)
+    assert "SYSDATETIMEOFFSET()" in sql
+    # Other columns are not held back.
+    assert "DATEADD" not in csv.incremental_high_sql("t", "dbo", Column("id", "BIGINT"), lag_seconds=1)
+
+
+def test_watermark_round_trip():
+    for value in [
+        b"\x00\x00\x00\x00\x00\x00\x07\xd1",
+        datetime(2024, 1, 1, 10, 0, 0, 3000),
+        datetime(2024, 1, 1, 10, 0, 0, 123456, tzinfo=timezone(timedelta(hours=2))),
+        date(2024, 2, 29),
+        2001,
+        "2024-01-01 10:00:00",
+        None,
+    ]:
+        # Through json, as stored.
+        decoded = decode_watermark(json.loads(json.dumps(encode_watermark(value))))
+        assert decoded == value
+        assert type(decoded) is type(value)
+
+
+def test_incremental_params_are_typed():
+    csv = sql_server_to_csv()
+    columns = [Column("Id", "INT"), Column("m", "DATETIME")]
+    watermark = {"value": encode_watermark(datetime(2024, 1, 2, 10, 0, 0, 997000))}
+    previous = {"value": encode_watermark(datetime(2024, 1, 1, 10, 0, 0, 3000))}
+    sql, params = csv.incremental_rows_sql("t", "dbo", columns, "m", watermark, previous)
+    assert sql == "SELECT Id,m FROM dbo.t WHERE m <= ? AND m > ?"
+    assert params == [datetime(2024, 1, 2, 10, 0, 0, 997000), datetime(2024, 1, 1, 10, 0, 0, 3000)]
+    assert all(isinstance(p, datetime) for p in params)
+    sql, params = csv.incremental_rows_sql("t", "dbo", columns, "m", watermark, {"value": None})
+    assert sql == "SELECT Id,m FROM dbo.t WHERE m <= ?"
+    assert params == [datetime(2024, 1, 2, 10, 0, 0, 997000)]
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from database_to_bigquery.base import SplitPlan, TablePlan
+from database_to_bigquery.sql_server import SqlServerToCsv
+
+PLAN_XML = (
+    '<ShowPlanXML xmlns="http://schemas.microsoft.com/sqlserver/2004/07/showplan"><BatchSequence><Batch>'
+    '<Statements><StmtSimple StatementSubTreeCost="1.5" StatementEstRows="100">'
+    '<QueryPlan><RelOp PhysicalOp="Clustered Index Scan"/></QueryPlan>'
+    "</StmtSimple></Statements></Batch></BatchSequence></ShowPlanXML>"
+)
+
+
+class FakeResult:
+    def __init__(self, row):
+        self.row = row
+
+    def first(self):
+        return self.row
+
+
+class FakeConnection:
+    def __init__(self, fail_on: str = None):
+        self.fail_on = fail_on
+        self.statements = []
+        self.invalidated = False
+
+    def execute(self, sql):
+        self.statements.append(sql)
+        if self.fail_on and self.fail_on in sql:
+            raise RuntimeError(f"failed: {sql}")
+        return FakeResult((PLAN_XML,))
+
+    def invalidate(self):
+        self.invalidated = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+def sql_server_to_csv(monkeypatch, connection: FakeConnection) -> SqlServerToCsv:
+    csv = SqlServerToCsv(username="u", password="p", host="h", database="d", destination="/tmp")
+    monkeypatch.setattr(csv, "connect", lambda replica=None: connection)
+    return csv
+
+
+def test_estimate_query_plan(monkeypatch):
+    connection = FakeConnection()
+    plan = sql_server_to_csv(monkeypatch, connection).estimate_query_plan("select * from t where a = ?", [5])
+    assert (plan["cost"], plan["rows"], plan["operators"]) == ("1.5", "100", ["Clustered Index Scan"])
+    assert connection.statements == ["SET SHOWPLAN_XML ON", "select * from t where a = 5", "SET SHOWPLAN_XML OFF"]
+    assert not connection.invalidated
+
+
+@pytest.mark.parametrize("fail_on", ["select", "SHOWPLAN_XML OFF", "SHOWPLAN_XML ON"])
+def test_failed_showplan_does_not_return_connection_to_pool(monkeypatch, fail_on):
+    connection = FakeConnection(fail_on=fail_on)
+    with pytest.raises(RuntimeError):
+        sql_server_to_csv(monkeypatch, connection).estimate_query_plan("select * from t")
+    assert connection.invalidated
+
+
+def test_reused_splits_are_not_counted_as_reads():
+    plans = [
+        SplitPlan(split_id=1, estimated_rows=10, estimated_bytes=100, cache_hit=True),
+        SplitPlan(split_id=2, estimated_rows=20, estimated_bytes=200, cache_hit=False, reused=True),
+        SplitPlan(split_id=3, estimated_rows=30, estimated_bytes=300, cache_hit=False),
+    ]
+    plan = TablePlan(
+        table_name="t",
+        schema_name="dbo",
+        table_rows=60,
+        table_bytes=600,
+        split_size=30,
+        split_strategy="row_number",
+        base_path="/tmp/t/30",
+        split_plans=plans,
+        query_plans={},
+    )
+    assert [p.to_read for p in plans] == [False, False, True]
+    assert str(plans[1]).startswith("[REUSE] split 2")
+    assert "Splits (1 of 3 to read, ~30 rows" in plan.full_str()
+
+
+def split(split_id: int, split_size: int, id_min: int, id_max: int, cnt: int, crc: int) -> dict:
+    return {
+        "internal_split": split_id,
+        "split_size": split_size,
+        "Id_min": id_min,
+        "Id_max": id_max,
+        "cnt": cnt,
+        "crc": crc,
+    }
+
+
+def test_find_reusable_splits(monkeypatch):
+    csv = SqlServerToCsv(username="u", password="p", host="h", database="d", destination="/tmp")
+    stored = [split(1, 10, 1, 10, 10, 6), split(2, 10, 11, 20, 10, 3)]
+    index = {
+        "/tmp/t/10": {
+            s["internal_split"]: {"identity": csv.split_identity(s), "content_files": [f"c{s['internal_split']}"]}
+            for s in stored
+        }
+    }
+    monkeypatch.setattr(csv, "reuse_index", lambda destination_folder, base_location: index)
+    splits = [split(1, 20, 1, 20, 20, 5), split(2, 20, 21, 40, 20, 0)]
+    reusable = csv.find_reusable_splits(splits, ["Id"], "t", "/tmp/t/20")
+    assert list(reusable) == [1]
+    assert [p["content_files"] for p in reusable[1]] == [["c1"], ["c2"]]
+    # Hash bucket splits are not ranges of the key.
+    assert csv.find_reusable_splits([dict(splits[0], buckets=2)], ["Id"], "t", "/tmp/t/20") == {}
+    assert csv.find_reusable_splits(splits, ["Id", "Name"], "t", "/tmp/t/20") == {}
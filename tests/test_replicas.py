@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+
+import pytest
+
+from database_to_bigquery import replicas
+from database_to_bigquery.replicas import Replica, ReplicaPool
+from database_to_bigquery.sql_server import SqlServerToCsv
+
+PLANNED = datetime(2024, 1, 1, 12, 0)
+
+
+class FakeClock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock(1000)
+    monkeypatch.setattr(replicas, "time", clock)
+    return clock
+
+
+def test_acquire_without_position(clock):
+    pool = ReplicaPool(["a", "b"])
+    first = pool.acquire()
+    second = pool.acquire()
+    assert {first.host, second.host} == {"a", "b"}
+
+
+def test_acquire_only_caught_up_replicas(clock):
+    positions = {"a": PLANNED - timedelta(seconds=5), "b": PLANNED}
+    pool = ReplicaPool(["a", "b"], position=positions.get)
+    assert pool.acquire(min_position=PLANNED).host == "b"
+    assert pool.acquire(min_position=PLANNED).host == "b"
+
+
+def test_lagging_replica_is_read_again_after_a_while(clock):
+    calls = []
+
+    def position(host):
+        calls.append(host)
+        return positions[host]
+
+    positions = {"a": PLANNED - timedelta(seconds=5)}
+    pool = ReplicaPool(["a"], position=position)
+    assert pool.acquire(min_position=PLANNED) is None
+    positions["a"] = PLANNED
+    # Not read again right away.
+    assert pool.acquire(min_position=PLANNED) is None
+    clock.now += ReplicaPool.POSITION_CHECK_SECONDS
+    replica = pool.acquire(min_position=PLANNED)
+    assert replica.host == "a"
+    pool.release(replica)
+    # Caught up stays caught up, without reading the position again.
+    assert pool.acquire(min_position=PLANNED).host == "a"
+    assert calls == ["a", "a"]
+
+
+def test_unknown_position_is_not_caught_up(clock):
+    pool = ReplicaPool(["a"], position=lambda host: None)
+    assert pool.acquire(min_position=PLANNED) is None
+    assert pool.acquire() is not None
+
+
+def test_position_failure_takes_replica_out(clock):
+    def position(host):
+        raise ConnectionError("unreachable")
+
+    pool = ReplicaPool(["a"], position=position)
+    assert pool.acquire(min_position=PLANNED) is None
+    assert pool.replicas[0].out_reason == "unreachable"
+    assert pool.acquire() is None
+
+
+def test_lag_takes_replica_out(clock):
+    pool = ReplicaPool(["a", "b"], lag={"a": 120, "b": 1}.get, max_lag_seconds=60)
+    assert pool.acquire().host == "b"
+    assert pool.acquire().host == "b"
+
+
+def test_faster_replica_gets_more_splits(clock):
+    pool = ReplicaPool(["a", "b"])
+    a, b = pool.replicas
+    pool.record(a, 2000, 1)
+    pool.record(b, 1000, 1)
+    hosts = [pool.acquire().host for _ in range(3)]
+    assert hosts.count("a") == 2
+
+
+def sql_server_to_csv(**kwargs) -> SqlServerToCsv:
+    return SqlServerToCsv(username="u", password="p", host="h", database="d", destination="/tmp", **kwargs)
+
+
+def test_replica_connect_is_not_retried(monkeypatch):
+    csv = sql_server_to_csv(read_replicas=["r"])
+    attempts = []
+
+    class FailingEngine:
+        def connect(self):
+            attempts.append(1)
+            raise Exception("Login timeout expired")
+
+    monkeypatch.setattr(csv, "replica_engine", lambda host: FailingEngine())
+    with pytest.raises(Exception):
+        csv.connect(Replica("r"))
+    assert attempts == [1]
+
+
+def test_dynamic_source_needs_a_commit_position(monkeypatch):
+    csv = sql_server_to_csv(read_replicas=["r"])
+    monkeypatch.setattr(csv, "commit_position", lambda host=None: None)
+    csv.allow_replica_reads("t", static_source=False)
+    with csv.read_replica() as replica:
+        assert replica is None
+
+    monkeypatch.setattr(csv, "commit_position", lambda host=None: PLANNED)
+    csv.allow_replica_reads("t", static_source=False)
+    assert csv._replica_position == PLANNED
+
+    csv.allow_replica_reads("t", static_source=True)
+    assert csv._replica_position is None
+    with csv.read_replica() as replica:
+        assert replica.host == "r"
+
+
+class LostConnection:
+    """
+    Connection to a replica that is lost after the first batch of rows of a query.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.connection.close()
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+    def execute(self, sql, params):
+        result = self.connection.execute(sql, params)
+        batches = []
+
+        def fetchmany(size):
+            if batches:
+                raise ConnectionError("connection lost")
+            batches.append(size)
+            return result.fetchmany(size)
+
+        result.fetchmany = fetchmany
+        return result
+
+
+def replica_csv(monkeypatch, tmp_path, replica_connect):
+    from test_splits import sqlite_engine, table_rows
+
+    csv = sql_server_to_csv(read_replicas=["r"])
+    csv.destination = str(tmp_path)
+    (tmp_path / "t").mkdir()
+    engine = sqlite_engine(table_rows(), {})
+    primary_reads = []
+
+    def connect(replica=None):
+        if replica:
+            return replica_connect(engine)
+        primary_reads.append(1)
+        return engine.connect()
+
+    monkeypatch.setattr(csv, "connect", connect)
+    csv.allow_replica_reads("t", static_source=True)
+    return csv, primary_reads
+
+
+def write_split(csv, progress=None, split_size: int = -1):
+    from test_splits import COLUMNS
+
+    return csv.write_split_to_destination(
+        split={"split_size": split_size, "internal_split": 1, "cnt": 1000, "crc": "STATIC"},
+        destination_folder="t",
+        table="t",
+        schema="main",
+        columns_type=COLUMNS,
+        split_keys=["Id"],
+        progress=progress,
+    )
+
+
+def read_ids(locations: list) -> list:
+    ids = []
+    for location in locations:
+        with open(location, encoding="utf-8") as f:
+            ids += [int(line.split(",")[0]) for line in f.read().splitlines()[1:]]
+    return ids
+
+
+def test_replica_failing_during_the_read_is_read_from_the_primary(monkeypatch, tmp_path):
+    csv, primary_reads = replica_csv(monkeypatch, tmp_path, lambda engine: LostConnection(engine.connect()))
+    cnt, _, _, locations = write_split(csv)
+    assert cnt == 1000
+    # The rows read from the replica before it failed are not written twice.
+    assert read_ids(locations) == list(range(1000))
+    assert primary_reads == [1]
+    assert csv.replicas.replicas[0].out_reason == "connection lost"
+    with csv.read_replica() as replica:
+        assert replica is None
+
+
+def test_replica_failing_to_connect_is_read_from_the_primary(monkeypatch, tmp_path):
+    def connect(engine):
+        raise Exception("Login timeout expired")
+
+    csv, primary_reads = replica_csv(monkeypatch, tmp_path, connect)
+    cnt, _, _, locations = write_split(csv)
+    assert cnt == 1000
+    assert primary_reads == [1]
+    assert csv.replicas.replicas[0].out_reason == "Login timeout expired"
+
+
+def test_replica_failing_during_a_range_read(monkeypatch, tmp_path):
+    from database_to_bigquery.concurrency import SplitProgress
+
+    csv, _ = replica_csv(monkeypatch, tmp_path, lambda engine: LostConnection(engine.connect()))
+    progress = SplitProgress(split_id=1, part_id="1-a", row_from=1, row_to=801)
+    (tmp_path / "t" / "2000").mkdir()
+    # Rows 1 to 800 of the only split.
+    cnt, _, _, locations = write_split(csv, progress, split_size=2000)
+    assert cnt == 800
+    assert progress.done == 800
+    assert read_ids(locations) == list(range(800))
+
+
+def test_primary_failing_is_not_read_again(monkeypatch, tmp_path):
+    from test_splits import sqlite_engine, table_rows
+
+    csv, _ = replica_csv(monkeypatch, tmp_path, lambda engine: LostConnection(engine.connect()))
+    csv.replicas.fail(csv.replicas.replicas[0], "down")
+    engine = sqlite_engine(table_rows(), {})
+    reads = []
+
+    def connect(replica=None):
+        reads.append(replica)
+        return LostConnection(engine.connect())
+
+    monkeypatch.setattr(csv, "connect", connect)
+    with pytest.raises(ConnectionError):
+        write_split(csv)
+    assert reads == [None]
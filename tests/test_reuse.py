@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+from database_to_bigquery.sql_server import SplitResult, SqlServerToCsv
+
+CSV = SqlServerToCsv(username="u", password="p", host="h", database="d", destination="/tmp")
+
+
+def split(split_id: int, split_size: int, id_min, id_max, cnt: int, crc, **fields) -> dict:
+    return {
+        "internal_split": split_id,
+        "split_size": split_size,
+        "Id_min": id_min,
+        "Id_max": id_max,
+        "cnt": cnt,
+        "crc": crc,
+        "internal_columns": "Id -> INT64 int_encoder",
+        **fields,
+    }
+
+
+def index(*stored_splits: dict, base: str = "/tmp/t/10") -> dict:
+    return {
+        base: {
+            s["internal_split"]: {
+                "identity": CSV.split_identity(s),
+                "content_files": [f"{base}-content-{s['internal_split']}.csv"],
+            }
+            for s in stored_splits
+        }
+    }
+
+
+# Ids 1 to 20 read with split size 10, and the crc of each half.
+SMALL = [split(0, 10, 1, 10, 10, 0b0110), split(1, 10, 11, 20, 10, 0b0011)]
+
+
+def test_same_identity():
+    stored = split(3, 10, 1, 20, 20, 5)
+    parts = CSV.find_reusable(split(0, 20, 1, 20, 20, 5), "Id", index(stored))
+    assert parts == [index(stored)["/tmp/t/10"][3]]
+
+
+def test_composes_consecutive_splits_by_xor():
+    parts = CSV.find_reusable(split(0, 20, 1, 20, 20, 0b0101), "Id", index(*SMALL))
+    assert [p["content_files"] for p in parts] == [["/tmp/t/10-content-0.csv"], ["/tmp/t/10-content-1.csv"]]
+
+
+def test_mismatched_crc_is_not_reused():
+    assert CSV.find_reusable(split(0, 20, 1, 20, 20, 0b0111), "Id", index(*SMALL)) is None
+
+
+def test_wrong_count_is_not_reused():
+    # A row was inserted between the copies.
+    assert CSV.find_reusable(split(0, 20, 1, 20, 21, 0b0101), "Id", index(*SMALL)) is None
+
+
+def test_key_range_must_be_covered():
+    # The stored splits end at 20, not 25.
+    assert CSV.find_reusable(split(0, 20, 1, 25, 20, 0b0101), "Id", index(*SMALL)) is None
+    # Nor start at 1.
+    assert CSV.find_reusable(split(0, 20, 0, 20, 20, 0b0101), "Id", index(*SMALL)) is None
+
+
+def test_gap_between_splits_is_not_reused():
+    stored = [SMALL[0], split(2, 10, 11, 20, 10, 0b0011)]
+    assert CSV.find_reusable(split(0, 20, 1, 20, 20, 0b0101), "Id", index(*stored)) is None
+
+
+def test_static_crc():
+    stored = [split(0, 10, 1, 10, 10, "STATIC"), split(1, 10, 11, 20, 10, "STATIC")]
+    assert len(CSV.find_reusable(split(0, 20, 1, 20, 20, "STATIC"), "Id", index(*stored))) == 2
+    # A static crc does not compose into a dynamic one.
+    assert CSV.find_reusable(split(0, 20, 1, 20, 20, 0), "Id", index(*stored)) is None
+
+
+def test_composes_other_columns():
+    identity = CSV.split_identity(split(0, 20, 1, 20, 20, 0b0101, Updated_max="2024-01-02T00:00:00"))
+    parts = [
+        CSV.split_identity(split(0, 10, 1, 10, 10, 0b0110, Updated_max="2024-01-02T00:00:00")),
+        CSV.split_identity(split(1, 10, 11, 20, 10, 0b0011, Updated_max="2024-01-01T00:00:00")),
+    ]
+    assert CSV.composes(identity, parts, "Id")
+    parts[0]["Updated_max"] = "2024-01-01T00:00:00"
+    assert not CSV.composes(identity, parts, "Id")
+    # A field missing in a part.
+    parts[0]["Updated_max"] = "2024-01-02T00:00:00"
+    del parts[1]["internal_columns"]
+    assert not CSV.composes(identity, parts, "Id")
+
+
+def test_other_type_mapping_is_not_reused():
+    stored = [dict(s, internal_columns="Id -> STRING str_encoder") for s in SMALL]
+    assert CSV.find_reusable(split(0, 20, 1, 20, 20, 0b0101), "Id", index(*stored)) is None
+
+
+def test_reuse_splits_looks_up_each_split_once(monkeypatch):
+    looked_up = []
+
+    def cached_split_result(s, destination_folder):
+        looked_up.append(s["internal_split"])
+        if s["internal_split"] == 0:
+            return SplitResult(
+                content_file="", crc_file="", elapsed=0, cache_hit=True, row_count=-1, split_id=0
+            )
+        return None
+
+    monkeypatch.setattr(CSV, "cached_split_result", cached_split_result)
+    monkeypatch.setattr(CSV, "reuse_index", lambda destination_folder, base_location: {})
+    splits = {i: split(i, 20, i * 20 + 1, i * 20 + 20, 20, 0) for i in range(3)}
+    results, uncached = CSV.reuse_splits(
+        splits=splits, primary_keys=["Id"], destination_folder="t", base_location="/tmp/t/20", uncached={2}
+    )
+    assert [r.split_id for r in results] == [0]
+    assert looked_up == [0, 1]
+    assert uncached == {1, 2}
+
+
+def test_process_split_skips_checked_lookup(monkeypatch):
+    def cached_split_result(s, destination_folder):
+        raise AssertionError("looked up again")
+
+    monkeypatch.setattr(CSV, "cached_split_result", cached_split_result)
+    monkeypatch.setattr(CSV, "_read_split", lambda **kwargs: (20, 0.1, -1, ["/tmp/t/20-content-1.csv"]))
+    result = CSV.process_split(
+        split=split(1, 20, 21, 40, 20, 0),
+        columns_type=[],
+        primary_keys=["Id"],
+        table="t",
+        schema="dbo",
+        destination_folder="t",
+        cache_checked=True,
+    )
+    assert not result.cache_hit
+    assert result.row_count == 20
+
+
+def test_work_stealing_skips_checked_lookup(monkeypatch):
+    csv = SqlServerToCsv(username="u", password="p", host="h", database="d", destination="/tmp")
+    looked_up = []
+
+    def cached_split_result(s, destination_folder):
+        looked_up.append(s["internal_split"])
+        return None
+
+    monkeypatch.setattr(csv, "cached_split_result", cached_split_result)
+
+    def read_split(**kwargs):
+        return 20, 0.1, -1, [f"/tmp/t/20-content-{kwargs['split']['internal_split']}.csv"]
+
+    monkeypatch.setattr(csv, "_read_split", read_split)
+    monkeypatch.setattr(csv, "write_split_crc", lambda **kwargs: None)
+    splits = {i: split(i, 20, i * 20 + 1, i * 20 + 20, 20, 0) for i in range(1, 4)}
+    results = csv.process_splits_work_stealing(
+        threads=2,
+        splits=splits,
+        columns_type=[],
+        primary_keys=["Id"],
+        table="t",
+        schema="dbo",
+        destination_folder="t",
+        uncached={1, 3},
+    )
+    assert sorted(r.split_id for r in results) == [1, 2, 3]
+    # Only the split not looked up before dispatch is looked up at the destination.
+    assert looked_up == [2]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from database_to_bigquery.base import Column
+from database_to_bigquery.sql_server import SqlServerToCsv
+
+
+def sql_server_to_csv(single_scan: bool) -> SqlServerToCsv:
+    return SqlServerToCsv(
+        username="u", password="p", host="h", database="d", destination="/tmp", single_scan=single_scan
+    )
+
+
+def test_single_scan_needs_rowversion_for_dynamic_sources():
+    columns = [Column("Id", "INT"), Column("Name", "NVARCHAR")]
+    with pytest.raises(ValueError):
+        sql_server_to_csv(True).check_single_scan("t", static_source=False, columns_type=columns)
+    sql_server_to_csv(True).check_single_scan("t", static_source=True, columns_type=columns)
+    sql_server_to_csv(False).check_single_scan("t", static_source=False, columns_type=columns)
+    sql_server_to_csv(True).check_single_scan(
+        "t", static_source=False, columns_type=columns + [Column("Version", "TIMESTAMP")]
+    )
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+import zlib
+
+import pytest
+import sqlalchemy
+from sqlalchemy.pool import StaticPool
+
+from database_to_bigquery.base import Column
+from database_to_bigquery.sql_server import SqlServerToCsv
+
+ROWS = 1000
+
+
+def checksum(*values) -> int:
+    """
+    Stands in for CHECKSUM, spread over the whole int range.  Id 0 gives the lowest int, which overflows ABS.
+    """
+    value = zlib.crc32(repr(values).encode("utf-8")) if len(values) > 1 else values[0]
+    return (value * 2654435761) % 2 ** 32 - 2 ** 31
+
+
+def sqlite_engine(rows: list, functions: dict) -> "sqlalchemy.engine.Engine":
+    """
+    An in memory database with table main.t of rows (Id, Part, Name).  The split queries run on it unchanged, except
+    for $PARTITION.pf, which sqlite does not have and is registered as the function partition_pf.
+    """
+
+    def connect():
+        connection = sqlite3.connect(":memory:", check_same_thread=False)
+        for name, function in functions.items():
+            connection.create_function(name, -1, function)
+        return connection
+
+    engine = sqlalchemy.create_engine("sqlite://", creator=connect, poolclass=StaticPool)
+
+    @sqlalchemy.event.listens_for(engine, "before_cursor_execute", retval=True)
+    def partition_function(conn, cursor, statement, parameters, context, executemany):
+        return statement.replace("$PARTITION.pf(", "partition_pf("), parameters
+
+    with engine.connect() as connection:
+        connection.exec_driver_sql("CREATE TABLE t (Id INTEGER PRIMARY KEY, Part INTEGER, Name TEXT)")
+        if rows:
+            connection.exec_driver_sql("INSERT INTO t VALUES (?, ?, ?)", rows)
+    return engine
+
+
+COLUMNS = [Column("Id", "INT"), Column("Part", "INT"), Column("Name", "NVARCHAR")]
+
+
+def sql_server_to_csv(monkeypatch, rows: list, functions: dict) -> SqlServerToCsv:
+    csv = SqlServerToCsv(username="u", password="p", host="h", database="d", destination="/tmp")
+    engine = sqlite_engine(rows, functions)
+    monkeypatch.setattr(csv, "connect", lambda replica=None: engine.connect())
+    return csv
+
+
+def read_splits(csv: SqlServerToCsv, splits: dict, split_keys: list) -> dict:
+    """
+    The Ids read by each split, with the split queries.
+    """
+    read = {}
+    for split_id, split in splits.items():
+        sql, params = csv.split_query_sql(
+            split=split, table="t", schema="main", columns_type=COLUMNS, split_keys=split_keys
+        )
+        with csv.connect() as connection:
+            read[split_id] = [row[0] for row in connection.exec_driver_sql(sql, tuple(params))]
+    return read
+
+
+def assert_disjoint_and_cover(splits: dict, read: dict, rows: list):
+    ids = [i for split_ids in read.values() for i in split_ids]
+    assert len(ids) == len(set(ids)), "a row is read by more than one split"
+    assert sorted(ids) == sorted(r[0] for r in rows), "a row is not read by any split"
+    for split_id, split in splits.items():
+        assert split["cnt"] == len(read[split_id])
+
+
+def table_rows(count: int = ROWS) -> list:
+    return [(i, i % 37 if i % 11 else None, f"name {i}") for i in range(count)]
+
+
+@pytest.mark.parametrize("split_size", [1, 60, 100, 999, 5000])
+def test_hash_buckets_are_disjoint_and_cover_the_table(monkeypatch, split_size):
+    rows = table_rows()
+    csv = sql_server_to_csv(monkeypatch, rows, {"CHECKSUM": checksum})
+    buckets = csv.calculate_hash_buckets(len(rows), split_size)
+    splits = csv.generate_splits(
+        table="t",
+        static_source=True,
+        schema="main",
+        columns_type=COLUMNS,
+        split_keys=["Id"],
+        split_size=split_size,
+        buckets=buckets,
+    )
+    assert set(splits) <= set(range(1, buckets + 1))
+    assert all(s["buckets"] == buckets for s in splits.values())
+    assert_disjoint_and_cover(splits, read_splits(csv, splits, ["Id"]), rows)
+
+
+def test_hash_buckets_of_composite_keys(monkeypatch):
+    rows = table_rows()
+    csv = sql_server_to_csv(monkeypatch, rows, {"CHECKSUM": checksum})
+    splits = csv.generate_splits(
+        table="t",
+        static_source=True,
+        schema="main",
+        columns_type=COLUMNS,
+        split_keys=["Id", "Name"],
+        split_size=100,
+        buckets=16,
+    )
+    assert_disjoint_and_cover(splits, read_splits(csv, splits, ["Id", "Name"]), rows)
+
+
+def test_hash_bucket_takes_modulo_before_abs():
+    csv = SqlServerToCsv(username="u", password="p", host="h", database="d", destination="/tmp")
+    sql = csv._generate_view_sql(
+        table="t", schema="dbo", columns=["Id"], split_keys=["Id", "Name"], split_size=100, buckets=8
+    )
+    assert "ABS(CHECKSUM(Id,Name) % 8) + 1 as internal_split" in sql
+
+
+def test_calculate_hash_buckets():
+    csv = SqlServerToCsv(username="u", password="p", host="h", database="d", destination="/tmp")
+    assert csv.calculate_hash_buckets(0, 100) == 1
+    assert csv.calculate_hash_buckets(100, 100) == 1
+    assert csv.calculate_hash_buckets(101, 100) == 2
+    assert csv.calculate_hash_buckets(1000, 100) == 16
+
+
+def test_empty_table_gets_an_empty_bucket_split(monkeypatch):
+    csv = sql_server_to_csv(monkeypatch, [], {"CHECKSUM": checksum})
+    splits = csv.generate_splits(
+        table="t",
+        static_source=True,
+        schema="main",
+        columns_type=COLUMNS,
+        split_keys=["Id"],
+        split_size=100,
+        buckets=4,
+    )
+    assert splits == {1: {"split_size": 100, "internal_split": 1, "cnt": 0, "buckets": 4}}
+    assert read_splits(csv, splits, ["Id"]) == {1: []}
+
+
+def partitioning(on_right: bool) -> dict:
+    return {
+        "partition_function": "pf",
+        "partition_column": "Part",
+        "on_right": on_right,
+        "boundaries": {1: 10, 2: 20},
+    }
+
+
+def partition_function(on_right: bool):
+    """
+    Stands in for $PARTITION.pf.  NULL goes to the leftmost partition, a boundary value to the partition on its right
+    with RANGE RIGHT and on its left with RANGE LEFT.
+    """
+
+    def partition(value):
+        if value is None:
+            return 1
+        return 1 + sum(1 for b in partitioning(on_right)["boundaries"].values() if b < value or (on_right and b == value))
+
+    return partition
+
+
+@pytest.mark.parametrize("on_right", [True, False])
+@pytest.mark.parametrize("split_size", [0, 7, 100, 5000])
+def test_partition_splits_are_disjoint_and_cover_the_table(monkeypatch, on_right, split_size):
+    rows = table_rows()
+    partition = partition_function(on_right)
+    csv = sql_server_to_csv(monkeypatch, rows, {"partition_pf": partition})
+    splits = csv.generate_splits(
+        table="t",
+        static_source=True,
+        schema="main",
+        columns_type=COLUMNS,
+        split_keys=["Id"],
+        split_size=split_size,
+        partitioning=partitioning(on_right),
+    )
+    read = read_splits(csv, splits, ["Id"])
+    assert_disjoint_and_cover(splits, read, rows)
+    parts = {r[0]: r[1] for r in rows}
+    for split_id, split in splits.items():
+        assert split_id // SqlServerToCsv.PARTITION_SPLIT_FACTOR == split["partition"]
+        assert {partition(parts[i]) for i in read[split_id]} == {split["partition"]}
+    assert {s["partition"] for s in splits.values()} == {1, 2, 3}
+
+
+def test_null_and_boundary_values_in_their_partition(monkeypatch):
+    rows = [(1, None, "a"), (2, 10, "b"), (3, 20, "c"), (4, 9, "d"), (5, 21, "e")]
+    for on_right, expected in [(True, {1: [1, 4], 2: [2], 3: [3, 5]}), (False, {1: [1, 2, 4], 2: [3], 3: [5]})]:
+        csv = sql_server_to_csv(monkeypatch, rows, {"partition_pf": partition_function(on_right)})
+        splits = csv.generate_splits(
+            table="t",
+            static_source=True,
+            schema="main",
+            columns_type=COLUMNS,
+            split_keys=["Id"],
+            split_size=0,
+            partitioning=partitioning(on_right),
+        )
+        read = read_splits(csv, splits, ["Id"])
+        assert {splits[i]["partition"]: sorted(ids) for i, ids in read.items()} == expected
+
+
+def test_partition_range():
+    csv = SqlServerToCsv(username="u", password="p", host="h", database="d", destination="/tmp")
+    assert [csv.partition_range(partitioning(True), p) for p in [1, 2, 3]] == ["[, 10)", "[10, 20)", "[20, )"]
+    assert [csv.partition_range(partitioning(False), p) for p in [1, 2, 3]] == ["(, 10]", "(10, 20]", "(20, ]"]
+
+
+def test_partition_split_reads_one_partition():
+    csv = SqlServerToCsv(username="u", password="p", host="h", database="d", destination="/tmp")
+    split = {"split_size": 0, "internal_split": 200000, "cnt": 1, "partition": 2}
+    split.update(partition_function="pf", partition_column="Part")
+    sql, params = csv.split_query_sql(split=split, table="t", schema="dbo", columns_type=COLUMNS, split_keys=["Id"])
+    assert "from dbo.t WHERE $PARTITION.pf(Part) = 2)" in sql
+    assert params == [200000]
+
+
+def test_partition_stats_splits_skip_empty_partitions():
+    csv = SqlServerToCsv(username="u", password="p", host="h", database="d", destination="/tmp")
+    stats = {1: {"rows": 5, "pages": 1}, 2: {"rows": 0, "pages": 0}, 3: {"rows": 7, "pages": 2}}
+    splits = csv._generate_partition_stats_splits("t", "dbo", COLUMNS, 0, partitioning(True), stats)
+    assert sorted(splits) == [100000, 300000]
+    assert splits[300000]["partition_range"] == "[20, )"
+    assert (splits[300000]["partition_rows"], splits[300000]["partition_pages"]) == (7, 2)
+    empty = csv._generate_partition_stats_splits("t", "dbo", COLUMNS, 0, partitioning(True), {1: {"rows": 0}})
+    assert empty[1]["cnt"] == 0
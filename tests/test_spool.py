@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import os
+
+from database_to_bigquery.spool import SpoolUploader
+from database_to_bigquery.sql_server import RollingContentFile
+
+
+class CheckedSpool(SpoolUploader):
+    """
+    Spool that records the most bytes it held at any time.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.peak = 0
+
+    def reserve(self, size: int) -> bool:
+        reserved = super().reserve(size)
+        self.peak = max(self.peak, self.spooled_bytes)
+        return reserved
+
+
+def content_file(tmp_path, spool, **kwargs) -> RollingContentFile:
+    destination = tmp_path / "destination"
+    destination.mkdir(exist_ok=True)
+    return RollingContentFile(
+        location=lambda part: str(destination / f"t-content-{part}.csv"), header="a,b\r\n", spool=spool, **kwargs
+    )
+
+
+def read(location: str) -> str:
+    with open(location, encoding="utf-8", newline="") as f:
+        return f.read()
+
+
+def test_spooled_files_are_uploaded(tmp_path):
+    spool = CheckedSpool(str(tmp_path / "spool"), max_bytes=-1)
+    with content_file(tmp_path, spool) as files:
+        files.write("1,x\r\n")
+    spool.wait()
+    assert read(files.locations[0]) == "a,b\r\n1,x\r\n"
+    assert spool.spooled_bytes == 0
+    assert os.listdir(tmp_path / "spool") == []
+
+
+def test_file_spills_to_destination_when_the_spool_is_full(tmp_path):
+    spool = CheckedSpool(str(tmp_path / "spool"), max_bytes=100)
+    rows = [f"{i},{'é' * 10}\r\n" for i in range(50)]
+    with content_file(tmp_path, spool) as files:
+        for row in rows:
+            files.write(row)
+            assert spool.spooled_bytes <= 100
+    spool.wait()
+    assert spool.peak <= 100
+    assert read(files.locations[0]) == "a,b\r\n" + "".join(rows)
+    assert spool.spooled_bytes == 0
+    assert os.listdir(tmp_path / "spool") == []
+
+
+def test_large_row_spills_in_the_middle(tmp_path):
+    spool = CheckedSpool(str(tmp_path / "spool"), max_bytes=1000)
+    pieces = ["1,"] + ["x" * 300] * 10 + ["\r\n"]
+    with content_file(tmp_path, spool) as files:
+        files.write_row(iter(pieces))
+    spool.wait()
+    assert spool.peak <= 1000
+    assert read(files.locations[0]) == "a,b\r\n" + "".join(pieces)
+
+
+def test_threads_share_the_cap(tmp_path):
+    import concurrent.futures
+
+    spool = CheckedSpool(str(tmp_path / "spool"), max_bytes=500)
+
+    def write_split(split_id: int) -> str:
+        destination = tmp_path / "destination"
+        destination.mkdir(exist_ok=True)
+        with RollingContentFile(
+            location=lambda part: str(destination / f"t-content-{split_id}-{part}.csv"), header="a\r\n", spool=spool
+        ) as files:
+            for i in range(100):
+                files.write(f"{i}\r\n")
+        return files.locations[0]
+
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        locations = list(executor.map(write_split, range(8)))
+    spool.wait()
+    assert spool.peak <= 500
+    for location in locations:
+        assert read(location) == "a\r\n" + "".join(f"{i}\r\n" for i in range(100))
+
+
+def test_rolled_files_with_spool(tmp_path):
+    spool = CheckedSpool(str(tmp_path / "spool"), max_bytes=30)
+    with content_file(tmp_path, spool, max_rows=2) as files:
+        for i in range(5):
+            files.write(f"{i},{i}\r\n")
+    spool.wait()
+    assert [read(l) for l in files.locations] == [
+        "a,b\r\n0,0\r\n1,1\r\n",
+        "a,b\r\n2,2\r\n3,3\r\n",
+        "a,b\r\n4,4\r\n",
+    ]
+    assert spool.peak <= 30
+
+
+def test_failed_file_releases_its_bytes(tmp_path):
+    spool = CheckedSpool(str(tmp_path / "spool"), max_bytes=1000)
+    try:
+        with content_file(tmp_path, spool) as files:
+            files.write("1,x\r\n")
+            raise RuntimeError("read failed")
+    except RuntimeError:
+        pass
+    spool.wait()
+    assert spool.spooled_bytes == 0
+    assert os.listdir(tmp_path / "spool") == []
+
+
+def test_shutdown_stops_upload_threads(tmp_path):
+    spool = SpoolUploader(str(tmp_path / "spool"))
+    with content_file(tmp_path, spool) as files:
+        files.write("1,x\r\n")
+    executor = spool._executor
+    spool.shutdown()
+    assert executor._shutdown
+    assert read(files.locations[0]) == "a,b\r\n1,x\r\n"
+    # Still usable after.
+    with content_file(tmp_path, spool) as files:
+        files.write("2,x\r\n")
+    spool.wait()
+    assert read(files.locations[0]) == "a,b\r\n2,x\r\n"
+    spool.shutdown()
+
+
+def test_dispose_shuts_down_the_spool(tmp_path, monkeypatch):
+    from database_to_bigquery.sql_server import SqlServerToCsv
+
+    csv = SqlServerToCsv(
+        username="u", password="p", host="h", database="d", destination="/tmp", spool_directory=str(tmp_path)
+    )
+    shutdowns = []
+    monkeypatch.setattr(csv.spool, "shutdown", lambda: shutdowns.append(1))
+    csv.dispose()
+    assert shutdowns == [1]
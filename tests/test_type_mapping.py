@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from database_to_bigquery.base import Column
+from database_to_bigquery.sql_server import SqlServerToCsv
+from database_to_bigquery.type_mapping import TypeMapping
+
+
+def decimal_column() -> Column:
+    return Column("Price", "DECIMAL", precision=18, scale=2)
+
+
+def test_bigquery_types():
+    mapping = TypeMapping()
+    assert mapping.bigquery_type(decimal_column()) == "NUMERIC"
+    assert mapping.bigquery_type(Column("p", "DECIMAL", precision=38, scale=12)) == "BIGNUMERIC"
+    assert mapping.bigquery_type(Column("x", "GEOGRAPHY")) == "STRING"
+    assert TypeMapping({"DECIMAL": "bignumeric"}).bigquery_type(decimal_column()) == "BIGNUMERIC"
+    # Column names win over types.
+    assert TypeMapping({"DECIMAL": "BIGNUMERIC", "Price": "FLOAT64"}).bigquery_type(decimal_column()) == "FLOAT64"
+
+
+def test_describe_changes_with_overrides():
+    column = Column("Changed", "DATETIMEOFFSET")
+    assert TypeMapping().describe(column) != TypeMapping({"DATETIMEOFFSET": "STRING"}).describe(column)
+    assert TypeMapping().describe(decimal_column()) != TypeMapping({"Price": "BIGNUMERIC"}).describe(
+        decimal_column()
+    )
+    # Same mapping, same description.
+    assert TypeMapping().describe(decimal_column()) == TypeMapping({"Other": "STRING"}).describe(decimal_column())
+
+
+def test_internal_columns_follow_type_overrides():
+    def internal_columns(type_overrides):
+        return SqlServerToCsv(
+            username="u", password="p", host="h", database="d", destination="/tmp", type_overrides=type_overrides
+        ).internal_columns([Column("Id", "INT"), decimal_column()])
+
+    assert internal_columns(None) == internal_columns({})
+    assert internal_columns(None) != internal_columns({"DECIMAL": "BIGNUMERIC"})